@@ -1,7 +1,51 @@
+import logging
+from argparse import ArgumentParser
+
 from aiohttp import web
 
+from .client import DEFAULT_MAX_POOL_CONNECTIONS
+from .config import config
 from .create_app import create_app
+from .models.user import bcrypt_cost
+from .prefork import WorkerOptions, run_supervisor
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="number of processes (0 = cpu count)"
+    )
+    parser.add_argument(
+        "--max-pool-connections", type=int, default=DEFAULT_MAX_POOL_CONNECTIONS
+    )
+    parser.add_argument("--shutdown-timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    if args.workers == 1:
+        app = create_app(max_pool_connections=args.max_pool_connections)
+        web.run_app(
+            app,
+            host=args.host,
+            port=args.port,
+            shutdown_timeout=args.shutdown_timeout,
+        )
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    bcrypt_rounds = None
+    if (target_ms := config.bcrypt_target_ms) is not None:
+        bcrypt_rounds = bcrypt_cost.calibrate(target_ms)
+    options = WorkerOptions(
+        host=args.host,
+        port=args.port,
+        max_pool_connections=args.max_pool_connections,
+        shutdown_timeout=args.shutdown_timeout,
+        bcrypt_rounds=bcrypt_rounds,
+    )
+    run_supervisor(options, args.workers)
+
 
 if __name__ == "__main__":
-    app = create_app()
-    web.run_app(app)
+    main()
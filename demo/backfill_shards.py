@@ -0,0 +1,44 @@
+import logging
+from argparse import ArgumentParser
+from typing import Optional, Type
+
+from .client import create_client
+from .model_utils import Base, ensure_tables
+from .models.practice_entry import LANGUAGE_INDEX, PracticeEntry
+from .models.video import IS_PUBLIC_INDEX, Video
+from .sharding_utils import ShardedIndex
+
+logger = logging.getLogger(__name__)
+
+#
+# Write sharded index keys (cf. sharding_utils.ShardedIndex) into items put before
+# the sharded indexes were added. Idempotent, so it can run again after the deploy.
+# With --prune, then delete indexes no longer declared (i.e. the unsharded ones
+# replaced by them) once no running server queries them.
+#
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = ArgumentParser(description="Write sharded index keys of old items")
+    parser.add_argument(
+        "--prune", action="store_true", help="then delete unsharded indexes"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    Base.__client__ = create_client()
+    indexes: list[tuple[Type[Base], ShardedIndex]] = [
+        (PracticeEntry, LANGUAGE_INDEX),
+        (Video, IS_PUBLIC_INDEX),
+    ]
+    for model, index in indexes:
+        count = index.backfill(model)
+        logger.info("backfilled %d %s into %s", count, model.__name__, index.index_name)
+    if args.prune:
+        models = [model for model, _ in indexes]
+        for table_name, changes in ensure_tables(models, prune=True).items():
+            logger.info("reconciled indexes of %s: %s", table_name, changes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from .codec_utils import accepted_encodings, compress
+
+#
+# In-process cache of encoded (and compressed) response bodies. Entries are keyed by
+# route and versions of tags (e.g. "Video:<id>"), so bumping a tag (cf. change feed)
+# makes stale entries unreachable and LRU evicts them eventually.
+#
+
+
+class TagVersions:
+    def __init__(self):
+        self.lock = threading.Lock()  # bumped from change feed thread
+        self.versions: dict[str, int] = {}
+
+    def get(self, tag: str) -> int:
+        return self.versions.get(tag, 0)
+
+    def bump(self, tag: str):
+        with self.lock:
+            self.versions[tag] = self.versions.get(tag, 0) + 1
+
+
+@dataclass
+class CachedResponse:
+    etag: str
+    bodies: dict[str, bytes]  # by Content-Encoding ("identity" for uncompressed)
+    expires_at: Optional[float]  # monotonic (None for no expiry)
+
+    @property
+    def size(self) -> int:
+        return sum(len(body) for body in self.bodies.values())
+
+    def select(self, accept_encoding: str) -> tuple[bytes, Optional[str]]:
+        encodings = accepted_encodings(accept_encoding)
+        for encoding in ["br", "gzip"]:
+            if encoding in self.bodies and encoding in encodings:
+                return self.bodies[encoding], encoding
+        return self.bodies["identity"], None
+
+
+def precompress(body: bytes) -> dict[str, bytes]:
+    bodies = {"identity": body}
+    for accept_encoding in ["br", "gzip"]:
+        compressed, encoding = compress(body, accept_encoding)
+        if encoding:
+            bodies[encoding] = compressed
+    return bodies
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Weak comparison (representations differ only by Content-Encoding)
+    >>> etag_matches('W/"abc", "def"', 'W/"def"')
+    True
+    >>> etag_matches("*", 'W/"abc"')
+    True
+    >>> etag_matches('"abc"', 'W/"def"')
+    False
+    """
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # only needed when tags are not bumped (i.e. no change feed)
+        self.tags = TagVersions()
+        self.entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.size = 0
+
+    def key(self, route: str, tags: list[str]) -> str:
+        return route + "#" + ",".join(f"{tag}@{self.tags.get(tag)}" for tag in tags)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at < time.monotonic():
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, body: bytes) -> CachedResponse:
+        etag = 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        entry = CachedResponse(etag, precompress(body), expires_at)
+        if entry.size > self.max_bytes:
+            return entry  # too large to cache
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+        return entry
+
+    def remove(self, key: str):
+        self.size -= self.entries.pop(key).size
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,47 @@
+import unittest
+
+from .cache_utils import ResponseCache
+from .codec_utils import MIN_COMPRESS_SIZE
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def test_key_changes_with_tag_versions(self):
+        cache = ResponseCache()
+        key = cache.key("/videos/1", ["Video:1"])
+        cache.put(key, b"{}")
+        assert cache.get(cache.key("/videos/1", ["Video:1"])) is not None
+
+        cache.tags.bump("Video:1")
+        assert cache.key("/videos/1", ["Video:1"]) != key
+        assert cache.get(cache.key("/videos/1", ["Video:1"])) is None
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_bytes=10)
+        cache.put("a", b"aaaa")
+        cache.put("b", b"bbbb")
+        assert cache.get("a") is not None  # "b" is now least recently used
+        cache.put("c", b"cccc")
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
+        assert cache.size == 8
+
+        cache.put("d", b"d" * 11)  # larger than whole cache
+        assert cache.get("d") is None and cache.size == 8
+
+    def test_ttl(self):
+        cache = ResponseCache(ttl=-1.0)
+        cache.put("a", b"aaaa")
+        assert cache.get("a") is None and cache.size == 0
+
+    def test_precompressed_bodies(self):
+        cache = ResponseCache()
+        body = b"[" + b"0," * MIN_COMPRESS_SIZE + b"0]"
+        entry = cache.put("a", body)
+        assert entry.select("gzip, deflate") == (entry.bodies["gzip"], "gzip")
+        assert entry.select("gzip, br") == (entry.bodies["br"], "br")
+        assert entry.select("") == (body, None)
+        assert entry.etag.startswith('W/"')
+
+        # Small body is not compressed
+        entry = cache.put("b", b"{}")
+        assert entry.select("gzip") == (b"{}", None)
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+from argparse import ArgumentParser
+from typing import Optional
+
+from .client import create_client, create_streams_client
+from .model_utils import Base
+from .models.caption_entry import CaptionEntry
+from .models.caption_posting import CaptionPosting
+from .models.stream_checkpoint import StreamCheckpoint
+from .stream_utils import Change, ChangeFeed
+
+logger = logging.getLogger(__name__)
+
+#
+# Durable consumer keeping derived data in sync with change streams, so that it
+# catches up with writes which bypassed (or failed after) synchronous maintenance
+#
+
+derived_feed = ChangeFeed("derived", checkpoints=StreamCheckpoint)
+
+
+@derived_feed.register(CaptionEntry)
+def index_caption_entries(changes: list[Change]):
+    # Idempotent (postings are overwritten) thus safe to redeliver
+    for change in changes:
+        CaptionPosting.index(change.new, change.old)
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = ArgumentParser(description="Consume DynamoDB Streams for derived data")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    Base.__client__ = create_client()
+    derived_feed.client = create_streams_client()
+    asyncio.run(derived_feed.run(args.poll_interval))
+
+
+if __name__ == "__main__":
+    main()
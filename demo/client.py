@@ -0,0 +1,38 @@
+from typing import Any
+
+import boto3
+from botocore.config import Config as BotocoreConfig
+
+from .config import config
+
+DEFAULT_MAX_POOL_CONNECTIONS = 10  # botocore's default
+DEFAULT_READ_TIMEOUT = 60  # botocore's default
+
+
+def create_client(
+    max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS, service_name="dynamodb"
+) -> Any:
+    retries = None
+    if service_name == "dynamodb":
+        # Single attempt as data plane requests are retried with rate limiting
+        # instead (cf. throttle_utils.call_with_rate_limit), which resends server
+        # errors and timeouts too, so that retries don't multiply
+        retries = {"total_max_attempts": 1}
+    return boto3.client(
+        service_name,
+        endpoint_url=config.endpoint_url,
+        region_name=config.region_name,
+        aws_access_key_id=config.aws_access_key_id,
+        aws_secret_access_key=config.aws_secret_access_key,
+        config=BotocoreConfig(
+            max_pool_connections=max_pool_connections,
+            # Calls not hedged run in request's thread (cf. latency_utils.Hedger),
+            # so don't wait for response beyond request deadline
+            read_timeout=config.request_timeout or DEFAULT_READ_TIMEOUT,
+            retries=retries,
+        ),
+    )
+
+
+def create_streams_client() -> Any:
+    return create_client(service_name="dynamodbstreams")
@@ -0,0 +1,91 @@
+import base64
+import gzip
+from dataclasses import fields
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Optional
+
+import brotli
+import orjson
+
+MIN_COMPRESS_SIZE = 1024
+
+
+#
+# JSON encoding
+#
+
+
+@lru_cache(maxsize=None)
+def json_fields(cls: type) -> tuple[str, ...]:
+    # Dataclass fields except "__json_exclude__" (e.g. User.password_digest)
+    exclude = getattr(cls, "__json_exclude__", [])
+    return tuple(f.name for f in fields(cls) if f.name not in exclude)
+
+
+def default(obj: Any) -> Any:
+    if hasattr(obj, "__dataclass_fields__"):
+        return {name: getattr(obj, name) for name in json_fields(obj.__class__)}
+    if isinstance(obj, Decimal):  # boto3 deserializes numbers as Decimal
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    raise TypeError
+
+
+def encode(data: Any) -> bytes:
+    # Serialize models (and containers of them) directly to bytes
+    return orjson.dumps(data, default=default, option=orjson.OPT_PASSTHROUGH_DATACLASS)
+
+
+def decode(body: bytes) -> Any:
+    return orjson.loads(body)
+
+
+#
+# Content-Encoding negotiation
+#
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    """
+    >>> sorted(accepted_encodings("gzip, deflate, br;q=0"))
+    ['deflate', 'gzip']
+    """
+    res = set()
+    for part in accept_encoding.split(","):
+        name, *params = [s.strip() for s in part.split(";")]
+        if "q=0" in params or "q=0.0" in params:
+            continue
+        res.add(name.lower())
+    return res
+
+
+def compress(body: bytes, accept_encoding: str) -> tuple[bytes, Optional[str]]:
+    if len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    encodings = accepted_encodings(accept_encoding)
+    if "br" in encodings:
+        return brotli.compress(body, quality=4), "br"
+    if "gzip" in encodings:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
+
+
+#
+# Opaque pagination cursor
+#
+
+
+def encode_cursor(cursor: Optional[dict]) -> Optional[str]:
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(encode(cursor)).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[dict]:
+    # Raises ValueError for malformed cursor
+    if cursor is None:
+        return None
+    res = decode(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    if not isinstance(res, dict):
+        raise ValueError("invalid cursor")
+    return res
@@ -0,0 +1,48 @@
+import gzip
+import unittest
+from dataclasses import dataclass
+from decimal import Decimal
+
+import brotli
+
+from .codec_utils import compress, decode, decode_cursor, encode, encode_cursor
+
+
+@dataclass
+class Model:
+    __json_exclude__ = ["secret"]
+
+    name: str
+    secret: str
+    count: Decimal
+
+
+class CodecTest(unittest.TestCase):
+    def test_encode(self):
+        models = [
+            Model("john", "xxx", Decimal(3)),
+            Model("jane", "yyy", Decimal("0.5")),
+        ]
+        res = decode(encode(dict(models=models)))
+        assert res == {
+            "models": [dict(name="john", count=3), dict(name="jane", count=0.5)]
+        }
+
+    def test_compress(self):
+        body = encode(["déménager"] * 1000)
+        compressed, encoding = compress(body, "gzip, deflate")
+        assert encoding == "gzip"
+        assert gzip.decompress(compressed) == body
+        compressed, encoding = compress(body, "gzip, deflate, br")
+        assert encoding == "br"
+        assert brotli.decompress(compressed) == body
+        assert compress(body, "gzip, br;q=0")[1] == "gzip"
+        assert compress(body, "identity") == (body, None)
+        assert compress(b"{}", "gzip") == (b"{}", None)
+
+    def test_cursor(self):
+        cursor = {"0": {"id": {"S": "x"}}, "1": None}
+        assert decode_cursor(encode_cursor(cursor)) == cursor
+        assert encode_cursor(None) is None
+        with self.assertRaises(ValueError):
+            decode_cursor("xxx")
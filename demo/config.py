@@ -1,5 +1,5 @@
 import os
-from typing import Literal, cast
+from typing import Literal, Optional, cast
 
 from pydantic import BaseModel
 
@@ -28,12 +28,59 @@ class Config(BaseModel):
 
     jwt_secret: str
 
+    # Calibrate bcrypt rounds at startup to hash in about this time (cf.
+    # models.user.BcryptCost), None keeps static rounds (e.g. 4 for test)
+    bcrypt_target_ms: Optional[float] = 250.0
+
+    # "rows" (CaptionEntry per line) or "packed" (CaptionTrack per language track)
+    caption_storage: Literal["rows", "packed"] = "rows"
+
+    # "per_model" (table per model) or "single" (videos, captions and practice
+    # entries in one table cf. single_table_utils, migrate with
+    # "python -m demo.migrate_single_table")
+    table_layout: Literal["per_model", "single"] = "per_model"
+
+    # Request profiling (cf. middlewares.profiler_middleware)
+    profile_secret: Optional[str] = None
+    profile_sample_rate: float = 0.0
+    profile_dir: str = "tmp/profiles"
+
+    # Deadline of each request in second (cf. middlewares.deadline_middleware)
+    request_timeout: Optional[float] = 10.0
+
+    # Hedge "get_item" and "query" slower than p95 (cf. latency_utils.Hedger)
+    hedged_reads: bool = False
+    hedge_max_extra_ratio: float = 0.05
+
+    # Consume DynamoDB Streams in each worker for in-process caches
+    # (cf. stream_utils.change_feed)
+    change_feed: bool = False
+    change_feed_poll_interval: float = 1.0
+
+    # Response cache of video/caption endpoints (cf. cache_utils.ResponseCache).
+    # Entries expire after ttl (in second) unless invalidated by change feed
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_ttl: float = 60.0
+
+    # Due practice entries per user (cf. models.review_queue.ReviewQueues) are
+    # reloaded after ttl (in second) unless kept in sync by change feed
+    review_queue_ttl: float = 5.0
+
+    # Log DynamoDB calls slower than this (cf. model_utils.slow_operations)
+    slow_operation_threshold_ms: Optional[float] = None
+
 
 env = load_env()
 config = load(Config, [f"config/{env}.json"], ENV_PREFIX)
 
 
-def schema(table_name: str, **kwargs) -> dict:
+# Item level change stream (cf. stream_utils.ChangeFeed)
+STREAM_SPECIFICATION = dict(StreamEnabled=True, StreamViewType="NEW_AND_OLD_IMAGES")
+
+
+def schema(table_name: str, stream=False, **kwargs) -> dict:
+    if stream:
+        kwargs.update(StreamSpecification=STREAM_SPECIFICATION)
     return dict(
         TableName=f"{config.table_prefix}-{table_name}",
         BillingMode="PAY_PER_REQUEST",
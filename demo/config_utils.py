@@ -18,7 +18,7 @@ def load(Config: Type[T], filenames: list[str], env_prefix: str) -> T:
     # Load environment variables
     for key in Config.__fields__.keys():
         if value := os.getenv(f"{env_prefix}_{key}"):
-            d[f"{env_prefix}_{key}"] = value
+            d[key] = value
 
     # Load with pydantic
     return Config.parse_obj(d)
@@ -1,7 +1,21 @@
 from abc import ABC
-from typing import Any, Callable, Coroutine, Type, TypeVar
+from typing import Any, Awaitable, Callable, Coroutine, Type, TypeVar
 
 from aiohttp.web import Request, Response
+from pydantic import BaseModel, ValidationError
+
+from .cache_utils import etag_matches, response_cache
+from .codec_utils import compress, decode, encode
+from .model_utils import TransactionCanceled
+
+V = TypeVar("V", bound=BaseModel)
+
+
+class ErrorResponse(Exception):
+    # Raised within action to respond immediately (cf. to_handler)
+    def __init__(self, response: Response):
+        super().__init__(response.status)
+        self.response = response
 
 
 class BaseController(ABC):
@@ -13,17 +27,68 @@ class BaseController(ABC):
     def process_action(self, action: Callable[[], Coroutine[Any, Any, Response]]):
         return action()
 
+    async def parse(self, Validator: Type[V]) -> V:
+        # Parse JSON request body (respond 400 when invalid)
+        try:
+            return Validator.parse_obj(decode(await self.req.read()))
+        except ValidationError as e:
+            raise self.error(400, errors=e.errors()) from e
+        except ValueError as e:  # orjson.JSONDecodeError
+            raise self.error(400, errors=str(e)) from e
+
+    def render(self, data: Any, status=200) -> Response:
+        body = encode(data)
+        body, encoding = compress(body, self.req.headers.get("Accept-Encoding", ""))
+        headers = {"Content-Type": "application/json", "Vary": "Accept-Encoding"}
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(body=body, status=status, headers=headers)
+
+    async def render_cached(
+        self, tags: list[str], build: Callable[[], Awaitable[Any]], max_age=60
+    ) -> Response:
+        # Respond from cache (cf. cache_utils.ResponseCache) or 304 if client has it
+        # already. "build" is only called on miss and may raise ErrorResponse
+        # (which is not cached)
+        key = response_cache.key(self.req.path_qs, tags)
+        entry = response_cache.get(key)
+        if entry is None:
+            entry = response_cache.put(key, encode(await build()))
+
+        headers = {
+            "ETag": entry.etag,
+            "Cache-Control": f"public, max-age={max_age}",
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(self.req.headers.get("If-None-Match", ""), entry.etag):
+            return Response(status=304, headers=headers)
+
+        body, encoding = entry.select(self.req.headers.get("Accept-Encoding", ""))
+        headers["Content-Type"] = "application/json"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(body=body, headers=headers)
+
+    def error(self, status: int, **data: Any) -> ErrorResponse:
+        return ErrorResponse(self.render(data, status=status))
+
 
 T = TypeVar("T", bound=BaseController)
 
 
-def to_handler(Controller: Type[T], action: Callable[[T], Coroutine[Any, Any, None]]):
+def to_handler(Controller: Type[T], action: Callable[[T], Coroutine[Any, Any, Any]]):
     async def handler(request: Request):
         controller = Controller(request)
 
         def bound_action():
             return action(controller)
 
-        return controller.process_action(bound_action)
+        try:
+            return await controller.process_action(bound_action)
+        except ErrorResponse as e:
+            return e.response
+        except TransactionCanceled:
+            # e.g. concurrent write of the same unique key
+            return controller.error(409, errors="conflicting write").response
 
     return handler
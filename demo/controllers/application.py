@@ -0,0 +1,20 @@
+from ..controller_utils import BaseController
+from ..model_utils import run_in_executor
+from ..models.user import User
+
+
+class ApplicationController(BaseController):
+    async def current_user(self) -> User:
+        # "Authorization: Bearer <token>" (cf. User.to_token)
+        scheme, _, token = self.req.headers.get("Authorization", "").partition(" ")
+        if scheme == "Bearer":
+            if user := await run_in_executor(lambda: User.find_by_token(token)):
+                return user
+        raise self.error(401, errors="unauthorized")
+
+    def limit_param(self, default=20, maximum=100) -> int:
+        try:
+            limit = int(self.req.query.get("limit", default))
+        except ValueError as e:
+            raise self.error(400, errors="invalid limit") from e
+        return min(max(limit, 1), maximum)
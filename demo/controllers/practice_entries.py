@@ -0,0 +1,46 @@
+import asyncio
+
+from ..codec_utils import decode_cursor, encode_cursor
+from ..model_utils import run_in_executor
+from ..models.caption_entry import CaptionEntry
+from ..models.practice_entry import PracticeEntry
+from ..models.video import Video
+from .application import ApplicationController
+
+
+class PracticeEntriesController(ApplicationController):
+    async def index(self):
+        # Practice entries of all users per language (newest first)
+        await self.current_user()
+        language = self.req.query.get("language", "fr")
+        limit = self.limit_param()
+        try:
+            cursor = decode_cursor(self.req.query.get("cursor"))
+        except ValueError as e:
+            raise self.error(400, errors="invalid cursor") from e
+
+        practice_entries, next_cursor = await run_in_executor(
+            lambda: PracticeEntry.find_by_language(language, limit, cursor)
+        )
+
+        # Resolve references by a single batch (cf. DataLoader)
+        caption_entries, videos = await asyncio.gather(
+            CaptionEntry.load_in_tracks(
+                [(e.video_id, e.language, e.caption_entry_id) for e in practice_entries]
+            ),
+            asyncio.gather(
+                *[Video.load_batched(id=e.video_id) for e in practice_entries]
+            ),
+        )
+        return self.render(
+            dict(
+                practice_entries=practice_entries,
+                caption_entries=unique_by_id(caption_entries),
+                videos=unique_by_id(videos),
+                cursor=encode_cursor(next_cursor),
+            )
+        )
+
+
+def unique_by_id(models: list) -> list:
+    return list({model.id: model for model in models if model is not None}.values())
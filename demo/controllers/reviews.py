@@ -0,0 +1,28 @@
+from pydantic import BaseModel, conint
+
+from ..model_utils import run_in_executor
+from ..models.review_queue import next_due, review
+from ..models.track_timing import time_spans
+from .application import ApplicationController
+
+
+class ReviewValidator(BaseModel):
+    grades: dict[str, conint(ge=0, le=5)]  # type: ignore # PracticeEntry.id to grade
+
+
+class ReviewsController(ApplicationController):
+    async def due(self):
+        # Current user's practice entries due for review (oldest due first) with
+        # their estimated time spans in video for playback
+        user = await self.current_user()
+        limit = self.limit_param()
+        practice_entries = await run_in_executor(lambda: next_due(user.id, limit))
+        spans = await run_in_executor(lambda: time_spans(practice_entries))
+        return self.render(dict(practice_entries=practice_entries, time_spans=spans))
+
+    async def create(self):
+        # Grades of review session
+        user = await self.current_user()
+        params = await self.parse(ReviewValidator)
+        practice_entries = await run_in_executor(lambda: review(user.id, params.grades))
+        return self.render(dict(practice_entries=practice_entries))
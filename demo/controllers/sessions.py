@@ -0,0 +1,14 @@
+from ..model_utils import run_in_executor
+from ..models.user import CredentialsValidator, User
+from .application import ApplicationController
+
+
+class SessionsController(ApplicationController):
+    async def create(self):
+        params = await self.parse(CredentialsValidator)
+        user = await run_in_executor(
+            lambda: User.find_by_credentials(params.username, params.password)
+        )
+        if user is None:
+            raise self.error(401, errors="invalid username or password")
+        return self.render(dict(user=user, token=user.to_token()))
@@ -1,10 +1,20 @@
-from ..controller_utils import BaseController
+from ..model_utils import run_in_executor
+from ..models.user import CredentialsValidator, User
+from .application import ApplicationController
 
 
-class UsersController(BaseController):
+class UsersController(ApplicationController):
     async def create(self):
-        # await self.body()
-        # self.
-        # await self.req.json()
-        # self.req.
-        pass
+        params = await self.parse(CredentialsValidator)
+        try:
+            # bcrypt is CPU bound so run off the event loop
+            user = await run_in_executor(
+                lambda: User.create(params.username, params.password)
+            )
+        except RuntimeError as e:
+            raise self.error(409, errors=str(e)) from e
+        return self.render(dict(user=user, token=user.to_token()), status=201)
+
+    async def show_me(self):
+        user = await self.current_user()
+        return self.render(dict(user=user))
@@ -0,0 +1,81 @@
+from ..cache_utils import response_cache
+from ..model_utils import run_in_executor
+from ..models.caption_entry import CaptionEntry
+from ..models.caption_track import CaptionTrack
+from ..models.video import Video
+from ..models.video_page import find_video_page
+from ..stream_utils import Change, change_feed
+from .application import ApplicationController
+
+
+class VideosController(ApplicationController):
+    # Public videos only, so that responses can be shared by all users (cached)
+    async def show(self):
+        video_id = self.req.match_info["id"]
+
+        async def build():
+            return dict(video=await self.find_public_video(video_id))
+
+        return await self.render_cached([video_tag(video_id)], build)
+
+    async def captions(self):
+        video_id = self.req.match_info["id"]
+        language = self.req.match_info["language"]
+
+        async def build():
+            video = await self.find_public_video(video_id)
+            if language not in [video.language1, video.language2]:
+                raise self.error(404, errors="not found")
+            caption_entries = await run_in_executor(
+                lambda: CaptionEntry.find_by_video(video_id, language)
+            )
+            return dict(caption_entries=caption_entries)
+
+        tags = [video_tag(video_id), track_tag("__".join([video_id, language]))]
+        return await self.render_cached(tags, build, max_age=300)
+
+    async def page(self):
+        # Video with captions and current user's practice entries (not cached)
+        user = await self.current_user()
+        video_id = self.req.match_info["id"]
+        page = await run_in_executor(lambda: find_video_page(video_id, user.id))
+        if page is None or not (page.video.is_public or page.video.user_id == user.id):
+            raise self.error(404, errors="not found")
+        return self.render(page)
+
+    async def find_public_video(self, video_id: str) -> Video:
+        video = await Video.load_batched(id=video_id)
+        if video is None or not video.is_public:
+            raise self.error(404, errors="not found")
+        return video
+
+
+#
+# Invalidate cached responses from changes (cf. config.change_feed)
+#
+
+
+def video_tag(video_id: str) -> str:
+    return f"Video:{video_id}"
+
+
+def track_tag(video_id__language: str) -> str:
+    return f"CaptionTrack:{video_id__language}"
+
+
+@change_feed.register(Video)
+def invalidate_videos(changes: list[Change]):
+    for change in changes:
+        response_cache.tags.bump(video_tag(change.item.id))
+
+
+@change_feed.register(CaptionEntry)
+def invalidate_caption_entries(changes: list[Change]):
+    for change in changes:
+        response_cache.tags.bump(track_tag(change.item.video_id__language))
+
+
+@change_feed.register(CaptionTrack)
+def invalidate_caption_tracks(changes: list[Change]):
+    for change in changes:
+        response_cache.tags.bump(track_tag(change.item.video_id__language))
@@ -1,9 +1,73 @@
+import asyncio
+from contextlib import suppress
+from typing import Optional
+
 from aiohttp.web import Application
 
+from .cache_utils import response_cache
+from .client import DEFAULT_MAX_POOL_CONNECTIONS, create_client, create_streams_client
+from .config import config
+from .latency_utils import hedger
+from .middlewares import deadline_middleware, loader_middleware, profiler_middleware
+from .model_utils import Base, run_in_executor, slow_operations
+from .models.review_queue import review_queues
+from .models.user import bcrypt_cost
 from .routes import routes
+from .stream_utils import change_feed
+
 
+def create_app(
+    max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS,
+    bcrypt_rounds: Optional[int] = None,
+    poll_change_feed=True,
+) -> Application:
+    middlewares = [loader_middleware]
+    if config.request_timeout is not None:
+        middlewares.insert(0, deadline_middleware(config.request_timeout))
+    # Don't even install profiler unless enabled
+    if config.profile_secret is not None or config.profile_sample_rate > 0:
+        middlewares.insert(
+            0,
+            profiler_middleware(
+                config.profile_secret, config.profile_sample_rate, config.profile_dir
+            ),
+        )
+    slow_operations.threshold_ms = config.slow_operation_threshold_ms
+    hedger.enabled = config.hedged_reads
+    hedger.max_extra_ratio = config.hedge_max_extra_ratio
+    response_cache.max_bytes = config.response_cache_max_bytes
+    response_cache.ttl = None if config.change_feed else config.response_cache_ttl
+    review_queues.ttl = None if config.change_feed else config.review_queue_ttl
 
-def create_app() -> Application:
-    app = Application()
+    app = Application(middlewares=middlewares)
     app.add_routes(routes)
+
+    # Create client on startup so that each worker process owns its connection pool
+    async def on_startup(_app: Application):
+        Base.__client__ = create_client(max_pool_connections)
+        # Calibrated by supervisor when prefork (cf. prefork.WorkerOptions)
+        if bcrypt_rounds is not None:
+            bcrypt_cost.rounds = bcrypt_rounds
+        elif (target_ms := config.bcrypt_target_ms) is not None:
+            await run_in_executor(lambda: bcrypt_cost.calibrate(target_ms))
+
+    app.on_startup.append(on_startup)
+
+    # Prefork workers get changes from supervisor instead (cf. prefork.Supervisor)
+    if config.change_feed and poll_change_feed:
+
+        async def start_change_feed(app: Application):
+            change_feed.client = create_streams_client()
+            app["change_feed"] = asyncio.ensure_future(
+                change_feed.run(config.change_feed_poll_interval)
+            )
+
+        async def stop_change_feed(app: Application):
+            app["change_feed"].cancel()
+            with suppress(asyncio.CancelledError):
+                await app["change_feed"]
+
+        app.on_startup.append(start_change_feed)
+        app.on_cleanup.append(stop_change_feed)
+
     return app
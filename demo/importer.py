@@ -0,0 +1,194 @@
+import json
+import logging
+import math
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from uuid import NAMESPACE_URL, uuid5
+
+from .client import create_client
+from .misc.ttml_to_json import parse_ttml
+from .model_utils import Base, TransactionCanceled
+from .models.caption_entry import CaptionEntry
+from .models.video import Video
+from .utils import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+#
+# Import "<name>.player-response.json" and "<name>.<language>.ttml" files
+# (cf. data/README.md) as Video and CaptionEntry. Ids are derived from youtube id
+# so that re-importing (e.g. resuming crashed import) doesn't duplicate rows.
+#
+
+
+def deterministic_id(*parts: str) -> str:
+    return str(uuid5(NAMESPACE_URL, "/".join(["demo", *parts])))
+
+
+@dataclass
+class Dump:
+    name: str
+    player_response: dict
+    directory: Path
+
+    def ttml_path(self, language: str) -> Path:
+        return self.directory / f"{self.name}.{language}.ttml"
+
+    @property
+    def languages(self) -> list[str]:
+        # Caption tracks listed in player response (and downloaded next to it)
+        captions = self.player_response.get("captions", {})
+        tracks = captions.get("playerCaptionsTracklistRenderer", {})
+        return [
+            track["languageCode"]
+            for track in tracks.get("captionTracks", [])
+            if self.ttml_path(track["languageCode"]).exists()
+        ]
+
+
+def find_dumps(directory: Path) -> list[Dump]:
+    suffix = ".player-response.json"
+    return [
+        Dump(path.name[: -len(suffix)], json.loads(path.read_text()), directory)
+        for path in sorted(directory.glob(f"*{suffix}"))
+    ]
+
+
+def to_video(dump: Dump, user_id: str, language1: str, language2: str) -> Video:
+    details = dump.player_response["videoDetails"]
+    youtube_id = details["videoId"]
+    return Video(
+        user_id,
+        youtube_id,
+        details["title"],
+        details["author"],
+        language1,
+        language2,
+        id=deterministic_id("Video", user_id, youtube_id),
+    )
+
+
+def to_caption_entries(video: Video, language: str, ttml_text: str):
+    return [
+        CaptionEntry(
+            video.id,
+            language,
+            entry["text"],
+            math.floor(parse_timestamp(entry["begin"])),
+            math.ceil(parse_timestamp(entry["end"])),
+            id=deterministic_id("CaptionEntry", video.id, language, str(i)),
+        )
+        for i, entry in enumerate(parse_ttml(ttml_text))
+    ]
+
+
+class Checkpoint:
+    # Names of completely imported dumps (one per line)
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set(path.read_text().split()) if path.exists() else set()
+
+    def add(self, name: str):
+        with self.lock:
+            self.done.add(name)
+            with open(self.path, "a") as f:
+                f.write(name + "\n")
+
+
+class ImportJob:
+    def __init__(
+        self,
+        user_id: str,
+        language1: str,
+        language2: str,
+        checkpoint: Checkpoint,
+        concurrency: int,
+    ):
+        self.user_id = user_id
+        self.language1 = language1
+        self.language2 = language2
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        # Separate pool for tracks since dump tasks wait on them
+        self.track_executor = ThreadPoolExecutor(concurrency * 2)
+
+    def run(self, dumps: list[Dump]) -> int:
+        pending = [dump for dump in dumps if dump.name not in self.checkpoint.done]
+        logger.info("%d already imported", len(dumps) - len(pending))
+        try:
+            with ThreadPoolExecutor(self.concurrency) as executor:
+                results = list(executor.map(self.import_dump, pending))
+        finally:
+            self.track_executor.shutdown()  # job runs once
+        return sum(results)
+
+    def import_dump(self, dump: Dump) -> bool:
+        try:
+            return self._import_dump(dump)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("%s: failed", dump.name)
+            return False
+
+    def _import_dump(self, dump: Dump) -> bool:
+        languages = [self.language1, self.language2]
+        if not set(languages) <= set(dump.languages):
+            logger.warning("%s: missing caption tracks %s", dump.name, languages)
+            return False
+
+        # Convert and write tracks concurrently (rows first so that existing video
+        # always has its captions)
+        video = to_video(dump, self.user_id, self.language1, self.language2)
+        tracks = self.track_executor.map(
+            lambda language: self.import_track(dump, video, language), languages
+        )
+        list(tracks)
+        try:
+            video.put()
+        except TransactionCanceled as e:
+            # Already imported before crash
+            if [f.code for f in e.failures] != ["ConditionalCheckFailed"]:
+                raise
+
+        self.checkpoint.add(dump.name)
+        logger.info("%s: imported %s as %s", dump.name, video.youtube_id, video.id)
+        return True
+
+    def import_track(self, dump: Dump, video: Video, language: str):
+        ttml_text = dump.ttml_path(language).read_text()
+        entries = to_caption_entries(video, language, ttml_text)
+        CaptionEntry.put_track(video.id, language, entries)
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = ArgumentParser(description="Import youtube dumps as Video/CaptionEntry")
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--language1", default="fr")
+    parser.add_argument("--language2", default="en")
+    parser.add_argument("--checkpoint", type=Path, default=Path("import.checkpoint"))
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    Base.__client__ = create_client(max_pool_connections=args.concurrency * 4)
+    job = ImportJob(
+        args.user_id,
+        args.language1,
+        args.language2,
+        Checkpoint(args.checkpoint),
+        args.concurrency,
+    )
+    started_at = time.monotonic()
+    count = job.run(find_dumps(args.directory))
+    elapsed = time.monotonic() - started_at
+    logger.info("imported %d videos in %.1fs", count, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import json
+import shutil
+import tempfile
+import unittest
+import uuid
+from pathlib import Path
+from typing import Any, ClassVar
+from unittest.mock import patch
+
+import boto3
+
+from .importer import (
+    Checkpoint,
+    ImportJob,
+    deterministic_id,
+    find_dumps,
+    to_caption_entries,
+    to_video,
+)
+from .model_utils import Base, delete_tables, ensure_tables
+from .model_utils_test import TEST_CONFIG
+from .models.application import Counter
+from .models.caption_entry import CaptionEntry
+from .models.caption_posting import CaptionPosting
+from .models.video import Video
+
+data_dir = Path(__file__).parent.parent / "data"
+
+
+class ImporterTest(unittest.TestCase):
+    def test_find_dumps(self):
+        dumps = find_dumps(data_dir)
+        assert [dump.name for dump in dumps] == ["ex01"]
+        assert sorted(dumps[0].languages) == ["en", "fr"]
+
+    def test_deterministic_ids(self):
+        dump = find_dumps(data_dir)[0]
+        video = to_video(dump, "user", "fr", "en")
+        assert video.id == to_video(dump, "user", "fr", "en").id
+        assert video.id != to_video(dump, "other-user", "fr", "en").id
+
+        ttml_text = dump.ttml_path("fr").read_text()
+        entries1 = to_caption_entries(video, "fr", ttml_text)
+        entries2 = to_caption_entries(video, "fr", ttml_text)
+        assert entries1 == entries2
+        assert entries1[0].id == deterministic_id("CaptionEntry", video.id, "fr", "0")
+        assert entries1[1].timestamp_start == 6
+        assert entries1[1].timestamp_end == 18
+
+
+def copy_dumps(directory: Path, count: int):
+    # Copies of data/ex01 with distinct youtube ids
+    player_response = json.loads((data_dir / "ex01.player-response.json").read_text())
+    for i in range(count):
+        name = f"ex{i:02d}"
+        player_response["videoDetails"]["videoId"] = f"video{i:02d}"
+        path = directory / f"{name}.player-response.json"
+        path.write_text(json.dumps(player_response))
+        for language in ["fr", "en"]:
+            shutil.copy(
+                data_dir / f"ex01.{language}.ttml",
+                directory / f"{name}.{language}.ttml",
+            )
+
+
+class ImportJobTest(unittest.TestCase):
+    client: ClassVar[Any]
+    models: ClassVar[list] = [Video, CaptionEntry, CaptionPosting, Counter]
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.client = boto3.client("dynamodb", **TEST_CONFIG)
+        Base.__client__ = cls.client
+        ensure_tables(cls.models)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        delete_tables(cls.models)
+
+    def test_resume(self):
+        user_id = str(uuid.uuid4())
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp)
+            copy_dumps(directory, 3)
+            dumps = find_dumps(directory)
+            checkpoint_path = directory / "import.checkpoint"
+
+            # Crash (e.g. killed) while writing 2nd video, after its caption rows
+            put = Video.put
+
+            def crash_on_second(video: Video, *args, **kwargs):
+                if video.youtube_id == "video01":
+                    raise KeyboardInterrupt
+                return put(video, *args, **kwargs)
+
+            job = ImportJob(user_id, "fr", "en", Checkpoint(checkpoint_path), 1)
+            with patch.object(Video, "put", crash_on_second):
+                with self.assertRaises(KeyboardInterrupt):
+                    job.run(dumps)
+            done = Checkpoint(checkpoint_path).done
+            assert "ex00" in done and "ex01" not in done
+
+            # Resume
+            job = ImportJob(user_id, "fr", "en", Checkpoint(checkpoint_path), 2)
+            assert job.run(dumps) == 3 - len(done)
+            assert Checkpoint(checkpoint_path).done == {"ex00", "ex01", "ex02"}
+
+            # Each video once (counted once too) with all its caption entries
+            assert Video.count_by("user_id", user_id) == 3
+            for dump in dumps:
+                video = to_video(dump, user_id, "fr", "en")
+                assert Video.get(id=video.id) is not None
+                for language in ["fr", "en"]:
+                    ttml_text = dump.ttml_path(language).read_text()
+                    expected = to_caption_entries(video, language, ttml_text)
+                    entries = CaptionEntry.find_by_video(video.id, language)
+                    assert [e.id for e in entries] == [e.id for e in expected]
@@ -0,0 +1,146 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Iterator, Optional
+
+#
+# Request deadline (cf. middlewares.deadline_middleware)
+#
+
+# time.monotonic() by which current request must finish
+current_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "current_deadline", default=None
+)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def remaining_time() -> Optional[float]:
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline():
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded()
+
+
+@contextmanager
+def deadline_after(seconds: float) -> Iterator[None]:
+    # Nested deadline cannot extend outer one
+    deadline = time.monotonic() + seconds
+    if (outer := current_deadline.get()) is not None:
+        deadline = min(deadline, outer)
+    token = current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+#
+# Hedged requests
+#
+
+
+class LatencyTracker:
+    # Recent latencies per key (e.g. operation and table) for percentile estimation
+    def __init__(self, window=200, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+        self.latencies: dict[Hashable, deque[float]] = {}
+
+    def add(self, key: Hashable, latency: float):
+        with self.lock:
+            if key not in self.latencies:
+                self.latencies[key] = deque(maxlen=self.window)
+            self.latencies[key].append(latency)
+
+    def percentile(self, key: Hashable, q: float) -> Optional[float]:
+        with self.lock:
+            latencies = sorted(self.latencies.get(key, []))
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[min(int(len(latencies) * q), len(latencies) - 1)]
+
+
+class Hedger:
+    # Send second attempt of idempotent read when the first one takes longer than
+    # p95 latency and return whichever finishes first. Extra load is capped by
+    # budget which grows by "max_extra_ratio" per read. Only hedged reads run on
+    # "executor" (attempts abandoned at deadline keep its threads until they
+    # finish), other calls run in the calling thread and are bounded by deadline
+    # checks between retries (cf. throttle_utils.call_with_rate_limit).
+    def __init__(self, max_extra_ratio=0.05, max_budget=10.0, max_workers=32):
+        self.enabled = False
+        self.max_extra_ratio = max_extra_ratio
+        self.max_budget = max_budget
+        self.budget = 0.0
+        self.lock = threading.Lock()
+        self.tracker = LatencyTracker()
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.num_hedged = 0
+
+    def take_budget(self) -> bool:
+        with self.lock:
+            if self.budget < 1:
+                return False
+            self.budget -= 1
+            self.num_hedged += 1
+            return True
+
+    def timed(self, key: Hashable, f: Callable[[], Any]) -> Callable[[], Any]:
+        def run():
+            started_at = time.monotonic()
+            res = f()
+            self.tracker.add(key, time.monotonic() - started_at)
+            return res
+
+        return run
+
+    def call(self, key: Hashable, f: Callable[[], Any], hedge: bool) -> Any:
+        check_deadline()
+        remaining = remaining_time()
+        delay = self.tracker.percentile(key, 0.95) if self.enabled and hedge else None
+        if delay is None or (remaining is not None and delay >= remaining):
+            return self.timed(key, f)()
+
+        with self.lock:
+            self.budget = min(self.budget + self.max_extra_ratio, self.max_budget)
+
+        context = contextvars.copy_context()
+        first = self.executor.submit(context.run, self.timed(key, f))
+        futures = [first]
+        wait(futures, timeout=delay)
+        if not first.done() and self.take_budget():
+            context = contextvars.copy_context()
+            futures.append(self.executor.submit(context.run, self.timed(key, f)))
+        return first_result(futures, remaining_time())
+
+
+def first_result(futures: list[Future], timeout: Optional[float]) -> Any:
+    # Result of the first successful future (or the last error)
+    pending = set(futures)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    error: Optional[BaseException] = None
+    while pending:
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded()
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    assert error is not None
+    raise error
+
+
+hedger = Hedger()
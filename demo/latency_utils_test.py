@@ -0,0 +1,93 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from .latency_utils import (
+    DeadlineExceeded,
+    Hedger,
+    LatencyTracker,
+    check_deadline,
+    deadline_after,
+    first_result,
+    remaining_time,
+)
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_deadline_after(self):
+        assert remaining_time() is None
+        with deadline_after(10):
+            with deadline_after(100):  # cannot extend outer deadline
+                assert 9 < remaining_time() <= 10
+            check_deadline()
+        assert remaining_time() is None
+
+    def test_check_deadline(self):
+        with deadline_after(0):
+            with pytest.raises(DeadlineExceeded):
+                check_deadline()
+
+    def test_first_result_timeout(self):
+        with ThreadPoolExecutor(1) as executor:
+            future = executor.submit(time.sleep, 0.2)
+            with pytest.raises(DeadlineExceeded):
+                first_result([future], 0.01)
+
+    def test_hedger_bounded_by_deadline(self):
+        hedger = Hedger()
+        hedger.enabled = True
+        for _ in range(20):
+            hedger.tracker.add("key", 0.01)
+        with deadline_after(0.05):
+            with pytest.raises(DeadlineExceeded):
+                hedger.call("key", lambda: time.sleep(0.2), hedge=True)
+
+    def test_hedger_runs_other_calls_in_calling_thread(self):
+        hedger = Hedger()
+        hedger.enabled = True
+        for _ in range(20):
+            hedger.tracker.add("key", 0.01)
+        with deadline_after(10):
+            thread_id = hedger.call("key", threading.get_ident, hedge=False)
+        assert thread_id == threading.get_ident()
+        with pytest.raises(DeadlineExceeded):
+            with deadline_after(0):
+                hedger.call("key", threading.get_ident, hedge=False)
+
+
+class HedgerTest(unittest.TestCase):
+    def test_percentile(self):
+        tracker = LatencyTracker(min_samples=10)
+        for i in range(9):
+            tracker.add("key", i)
+        assert tracker.percentile("key", 0.95) is None
+        tracker.add("key", 9)
+        assert tracker.percentile("key", 0.95) == 9
+        assert tracker.percentile("key", 0.5) == 5
+
+    def test_hedge_slow_call(self):
+        hedger = Hedger(max_extra_ratio=1.0)
+        hedger.enabled = True
+        for _ in range(20):
+            hedger.tracker.add("key", 0.01)
+        delays = [0.5, 0.0]  # first attempt is slow, second one is fast
+
+        def call():
+            time.sleep(delays.pop(0))
+            return "ok"
+
+        started_at = time.monotonic()
+        assert hedger.call("key", call, hedge=True) == "ok"
+        assert time.monotonic() - started_at < 0.3
+        assert hedger.num_hedged == 1
+
+    def test_hedge_budget(self):
+        hedger = Hedger(max_extra_ratio=0.0)
+        hedger.enabled = True
+        for _ in range(20):
+            hedger.tracker.add("key", 0.001)
+        assert hedger.call("key", lambda: time.sleep(0.01) or "ok", hedge=True) == "ok"
+        assert hedger.num_hedged == 0
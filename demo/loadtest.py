@@ -0,0 +1,389 @@
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import threading
+import time
+from argparse import ArgumentParser
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+from uuid import uuid4
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+#
+# Open-loop load generator for the HTTP API (cf. routes.py). Requests are started
+# at the configured rate regardless of responses, and latency is measured from
+# the scheduled start, so a saturated server shows up as growing latency instead of
+# a silently lower request rate (i.e. no "coordinated omission").
+#
+
+
+@dataclass
+class Sample:
+    route: str
+    status: Optional[int]  # None if no response (connection error, timeout)
+    latency_ms: float
+
+
+@dataclass
+class VirtualUser:
+    username: str
+    password: str
+    token: Optional[str] = None
+    cursor: Optional[str] = None  # next page of feed
+
+
+@dataclass
+class LoadTest:
+    session: aiohttp.ClientSession
+    url: str
+    users: list[VirtualUser] = field(default_factory=list)
+
+    async def request(self, method: str, path: str, **kwargs) -> tuple[int, Any]:
+        res = await self.session.request(method, self.url + path, **kwargs)
+        async with res:
+            body = await res.read()
+            return res.status, json.loads(body) if res.status < 300 else None
+
+    def auth(self, user: VirtualUser) -> dict:
+        return dict(headers={"Authorization": f"Bearer {user.token}"})
+
+    async def signup(self, user: VirtualUser) -> int:
+        credentials = dict(username=user.username, password=user.password)
+        status, body = await self.request("POST", "/users/", json=credentials)
+        if body:
+            user.token = body["token"]
+        return status
+
+    #
+    # Routes (picked randomly with weights per request)
+    #
+
+    async def new_user(self) -> int:
+        return await self.signup(VirtualUser(f"load_{uuid4().hex[:16]}", "password"))
+
+    async def login(self) -> int:
+        user = random.choice(self.users)
+        credentials = dict(username=user.username, password=user.password)
+        status, _ = await self.request("POST", "/sessions/", json=credentials)
+        return status
+
+    async def me(self) -> int:
+        status, _ = await self.request("GET", "/users/me", **self.auth(self.pick()))
+        return status
+
+    async def feed(self) -> int:
+        # Each user pages through the feed and starts over at the end
+        user = self.pick()
+        params = dict(language="fr", limit="20")
+        if user.cursor:
+            params.update(cursor=user.cursor)
+        status, body = await self.request(
+            "GET", "/practice_entries/", params=params, **self.auth(user)
+        )
+        if body:
+            user.cursor = body["cursor"]
+        return status
+
+    def pick(self) -> VirtualUser:
+        return random.choice([user for user in self.users if user.token])
+
+    def routes(self) -> dict[str, Callable[[], Awaitable[int]]]:
+        return dict(signup=self.new_user, login=self.login, me=self.me, feed=self.feed)
+
+
+async def run_open_loop(
+    routes: dict[str, Callable[[], Awaitable[int]]],
+    weights: dict[str, float],
+    rate: float,
+    duration: float,
+    timeout: float,
+    max_in_flight: int,
+) -> list[Sample]:
+    names = [name for name in weights if weights[name] > 0]
+    samples: list[Sample] = []
+    in_flight: set[asyncio.Task] = set()
+
+    async def send(name: str, scheduled_at: float):
+        try:
+            status: Optional[int] = await asyncio.wait_for(routes[name](), timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = None
+        samples.append(Sample(name, status, (time.monotonic() - scheduled_at) * 1000))
+
+    # Poisson arrivals
+    started_at = time.monotonic()
+    scheduled_at = started_at
+    while scheduled_at < started_at + duration:
+        scheduled_at += random.expovariate(rate)
+        await asyncio.sleep(max(scheduled_at - time.monotonic(), 0))
+        name = random.choices(names, [weights[name] for name in names])[0]
+        if len(in_flight) >= max_in_flight:
+            # Client side limit reached, count as error rather than slowing down
+            samples.append(Sample(name, None, 0.0))
+            continue
+        task = asyncio.ensure_future(send(name, scheduled_at))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    if in_flight:
+        await asyncio.wait(in_flight)
+    return samples
+
+
+def percentile(sorted_values: list[float], q: float) -> Optional[float]:
+    """
+    Nearest-rank percentile
+    >>> percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 0.95)
+    10
+    >>> percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 0.5)
+    5
+    >>> percentile([], 0.5)
+    """
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(q * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(samples: list[Sample], duration: float) -> dict[str, dict]:
+    # Latency percentiles of successful requests, error = no response or 5xx
+    report = {}
+    for route in sorted({sample.route for sample in samples}):
+        route_samples = [sample for sample in samples if sample.route == route]
+        ok = [s for s in route_samples if s.status is not None and s.status < 500]
+        latencies = sorted(sample.latency_ms for sample in ok)
+        statuses: dict[str, int] = {}
+        for sample in route_samples:
+            key = str(sample.status or "error")
+            statuses[key] = statuses.get(key, 0) + 1
+        report[route] = dict(
+            requests=len(route_samples),
+            throughput=round(len(ok) / duration, 2),
+            error_rate=round(1 - len(ok) / len(route_samples), 4),
+            p50_ms=percentile(latencies, 0.50),
+            p95_ms=percentile(latencies, 0.95),
+            p99_ms=percentile(latencies, 0.99),
+            statuses=statuses,
+        )
+    return report
+
+
+def print_report(report: dict[str, dict]):
+    columns = ["requests", "throughput", "error_rate", "p50_ms", "p95_ms", "p99_ms"]
+    print(" ".join(f"{name:>10}" for name in ["route", *columns]))
+    for route, r in report.items():
+        values = ["-" if r[name] is None else str(r[name]) for name in columns]
+        print(" ".join(f"{value:>10}" for value in [route, *values]))
+
+
+def git_commit() -> Optional[str]:
+    try:
+        res = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        )
+        return res.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+#
+# Local server (against localstack or in-memory moto backend) in its own process,
+# so that it doesn't share event loop (nor GIL) with the load generator and skew
+# its latencies. The in-memory backend runs in a process of its own too.
+#
+
+mp = multiprocessing.get_context("spawn")
+
+
+def all_models() -> list:
+    from .models.application import Counter
+    from .models.caption_entry import CaptionEntry
+    from .models.caption_posting import CaptionPosting
+    from .models.caption_track import CaptionTrack
+    from .models.practice_entry import PracticeEntry
+    from .models.stream_checkpoint import StreamCheckpoint
+    from .models.user import UniqueUsername, User
+    from .models.video import Video
+
+    return [
+        UniqueUsername,
+        User,
+        Video,
+        CaptionEntry,
+        PracticeEntry,
+        Counter,
+        CaptionPosting,
+        CaptionTrack,
+        StreamCheckpoint,
+    ]
+
+
+def seed_practice_entries(count: int):
+    from .models.practice_entry import PracticeEntry
+
+    PracticeEntry.put_batch(
+        PracticeEntry(str(uuid4()), str(uuid4()), "fr", f"text {i}", 0, 4, str(uuid4()))
+        for i in range(count)
+    )
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_server(port: int, ready: Any) -> None:
+    asyncio.run(serve(port, ready))
+
+
+async def serve(port: int, ready: Any) -> None:
+    from .create_app import create_app
+
+    runner = web.AppRunner(create_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    ready.set()
+    await asyncio.Event().wait()  # until terminated
+
+
+def run_memory_backend(port: int, ready: Any) -> None:
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError as e:
+        raise SystemExit("in-memory backend requires moto[server]") from e
+
+    ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False).start()
+    ready.set()
+    threading.Event().wait()  # until terminated
+
+
+def start_process(target: Callable[[int, Any], None], port: int, timeout=30.0) -> Any:
+    # Run "target" in a new process and wait until it's listening on "port"
+    ready = mp.Event()
+    process = mp.Process(target=target, args=(port, ready), daemon=True)
+    process.start()
+    if not ready.wait(timeout):
+        process.terminate()
+        raise SystemExit(f"{target.__name__} failed to start on port {port}")
+    return process
+
+
+def stop_process(process: Any):
+    process.terminate()
+    process.join()
+
+
+#
+# CLI
+#
+
+
+def parse_weights(s: str) -> dict[str, float]:
+    """
+    >>> parse_weights("signup=1,me=10")
+    {'signup': 1.0, 'me': 10.0}
+    """
+    pairs = [item.split("=") for item in s.split(",") if item]
+    return {name: float(weight) for name, weight in pairs}
+
+
+async def run(args: Any, url: str) -> dict:
+    connector = aiohttp.TCPConnector(limit=args.max_in_flight)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        test = LoadTest(session, url)
+        # Users for authenticated routes are signed up before measuring
+        test.users = [
+            VirtualUser(f"load_{uuid4().hex[:16]}", "password")
+            for _ in range(args.users)
+        ]
+        await asyncio.gather(*[test.signup(user) for user in test.users])
+        if not any(user.token for user in test.users):
+            raise SystemExit(f"failed to sign up users on {url}")
+
+        samples = await run_open_loop(
+            test.routes(),
+            parse_weights(args.mix),
+            args.rate,
+            args.duration,
+            args.timeout,
+            args.max_in_flight,
+        )
+
+    return dict(
+        commit=git_commit(),
+        started_at=int(time.time()),
+        options=vars(args),
+        routes=summarize(samples, args.duration),
+    )
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = ArgumentParser(description="Open-loop load test of the HTTP API")
+    parser.add_argument(
+        "--url", help="running server (default: start one locally in a new process)"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["localstack", "memory"],
+        default="localstack",
+        help="DynamoDB of local server (memory requires moto[server])",
+    )
+    parser.add_argument("--rate", type=float, default=50.0, help="requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="in second")
+    parser.add_argument("--mix", default="signup=1,login=1,me=10,feed=8")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument(
+        "--seed-entries",
+        type=int,
+        default=0,
+        help="practice entries to create for feed (local server only)",
+    )
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--output", type=Path, help="save report as json")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    with ExitStack() as stack:
+        url = args.url
+        if url is None:
+            from .client import create_client
+            from .config import ENV_PREFIX, config
+            from .model_utils import Base, ensure_tables
+
+            if args.backend == "memory":
+                port = free_port()
+                stack.callback(stop_process, start_process(run_memory_backend, port))
+                # Also for server process (which loads config from environment)
+                config.endpoint_url = f"http://127.0.0.1:{port}"
+                os.environ[f"{ENV_PREFIX}_endpoint_url"] = config.endpoint_url
+            Base.__client__ = create_client()
+            ensure_tables(all_models())
+            seed_practice_entries(args.seed_entries)
+            port = free_port()
+            stack.callback(stop_process, start_process(run_server, port))
+            url = f"http://127.0.0.1:{port}"
+        report = asyncio.run(run(args, url))
+
+    print_report(report["routes"])
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2, default=str))
+        logger.info("saved report to %s", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from .config import config
+from .loadtest import Sample, main, summarize
+from .model_utils import Base
+
+
+class SummarizeTest(unittest.TestCase):
+    def test_summarize(self):
+        samples = [Sample("me", 200, float(ms)) for ms in range(1, 101)]
+        samples += [Sample("me", 401, 1.0), Sample("me", 503, 1.0)]
+        samples += [Sample("feed", None, 0.0)]
+        report = summarize(samples, duration=10.0)
+
+        assert report["me"] == dict(
+            requests=102,
+            throughput=10.1,
+            error_rate=0.0098,
+            p50_ms=50.0,
+            p95_ms=95.0,
+            p99_ms=99.0,
+            statuses={"200": 100, "401": 1, "503": 1},
+        )
+        assert report["feed"]["error_rate"] == 1.0
+        assert report["feed"]["p50_ms"] is None
+        assert report["feed"]["statuses"] == {"error": 1}
+
+
+class MemoryBackendTest(unittest.TestCase):
+    def test_main(self):
+        # End to end: moto and server processes, short open-loop run against them
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(
+            os.environ
+        ), mock.patch.object(config, "endpoint_url"), mock.patch.object(
+            Base, "__client__"
+        ):
+            output = Path(tmp) / "report.json"
+            argv = ["--backend", "memory", "--rate", "20", "--duration", "2"]
+            argv += ["--users", "4", "--seed-entries", "5", "--output", str(output)]
+            main(argv)
+            report = json.loads(output.read_text())
+
+        routes = report["routes"]
+        assert sum(r["requests"] for r in routes.values()) > 0
+        for name, route in routes.items():
+            assert route["error_rate"] == 0.0, (name, route["statuses"])
@@ -0,0 +1,85 @@
+import asyncio
+import hmac
+import random
+import re
+import time
+from pathlib import Path
+from typing import Optional
+
+from aiohttp.web import Request, Response, middleware
+
+from .codec_utils import encode
+from .latency_utils import DeadlineExceeded, deadline_after, remaining_time
+from .model_utils import DataLoader, current_loader
+from .profile_utils import SamplingProfiler
+
+
+@middleware
+async def loader_middleware(request: Request, handler):
+    # Batch and memoize Base.load within request
+    token = current_loader.set(DataLoader())
+    try:
+        return await handler(request)
+    finally:
+        current_loader.reset(token)
+
+
+def deadline_middleware(timeout: float):
+    # Bound whole request (including DynamoDB calls in threads cf. latency_utils)
+    @middleware
+    async def _deadline_middleware(request: Request, handler):
+        with deadline_after(timeout):
+            try:
+                return await asyncio.wait_for(handler(request), remaining_time())
+            except (asyncio.TimeoutError, DeadlineExceeded):
+                return Response(
+                    body=encode(dict(errors="deadline exceeded")),
+                    status=504,
+                    content_type="application/json",
+                )
+
+    return _deadline_middleware
+
+
+PROFILE_HEADER = "X-Debug-Profile"
+
+
+def profiler_middleware(secret: Optional[str], sample_rate: float, directory: str):
+    # Profile requests with "X-Debug-Profile: <secret>" or sampled fraction of all
+    # requests and write them to "<directory>/<time>-<method>-<path>.folded".
+    # Only one request is profiled at a time.
+    profiling = False
+
+    def should_profile(request: Request) -> bool:
+        header = request.headers.get(PROFILE_HEADER)
+        if header is not None and secret is not None:
+            if hmac.compare_digest(header, secret):
+                return True
+        return sample_rate > 0 and random.random() < sample_rate
+
+    @middleware
+    async def _profiler_middleware(request: Request, handler):
+        nonlocal profiling
+        if profiling or not should_profile(request):
+            return await handler(request)
+
+        profiling = True
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            return await handler(request)
+        finally:
+            profiler.stop()
+            profiling = False
+            name = re.sub(r"[^\w.-]+", "_", f"{request.method}-{request.path}")
+            path = Path(directory) / f"{time.time():.3f}-{name}.folded"
+            await asyncio.get_running_loop().run_in_executor(
+                None, write_profile, path, profiler.folded()
+            )
+
+    return _profiler_middleware
+
+
+def write_profile(path: Path, content: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
@@ -0,0 +1,67 @@
+import logging
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Type
+
+from .client import create_client
+from .config import config
+from .model_utils import Base, boto3_deserialize, ensure_tables, send_request
+from .models.application import main_table
+
+logger = logging.getLogger(__name__)
+
+#
+# Copy items of per-model tables into main table (cf. config.table_layout).
+# Idempotent (items are overwritten), so it can run again to catch up writes made
+# before the switch. Derived data (e.g. CaptionPosting) is not touched.
+#
+
+
+def migrate_segment(model: Type[Base], segment: int, total_segments: int) -> int:
+    table_name = model.__layout__.schema["TableName"]
+    params = dict(TableName=table_name, Segment=segment, TotalSegments=total_segments)
+    count = 0
+    while True:
+        res = send_request(Base.__client__, "scan", **params)
+        items = [model.from_dict(boto3_deserialize(item)) for item in res["Items"]]
+        # Not "put_batch" which maintains derived data
+        model.write_batch(
+            [dict(PutRequest=dict(Item=model.serialize(item))) for item in items]
+        )
+        count += len(items)
+        if (last_key := res.get("LastEvaluatedKey")) is None:
+            return count
+        params.update(ExclusiveStartKey=last_key)
+
+
+def migrate(model: Type[Base], total_segments: int) -> int:
+    with ThreadPoolExecutor(total_segments) as executor:
+        counts = executor.map(
+            lambda segment: migrate_segment(model, segment, total_segments),
+            range(total_segments),
+        )
+        return sum(counts)
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = ArgumentParser(description="Copy per-model tables into single table")
+    parser.add_argument("--segments", type=int, default=4, help="parallel scans")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    assert config.table_layout == "single", "set DEMO_table_layout=single"
+    # Register models sharing main table
+    # pylint: disable=unused-import
+    from .models import caption_entry, practice_entry, video
+
+    Base.__client__ = create_client()
+    models = list(main_table.models.values())
+    ensure_tables(models)
+    table_name = main_table.schema["TableName"]
+    for model in models:
+        count = migrate(model, args.segments)
+        logger.info("copied %d %s into %s", count, model.__name__, table_name)
+
+
+if __name__ == "__main__":
+    main()
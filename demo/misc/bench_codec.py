@@ -0,0 +1,40 @@
+import json
+import timeit
+from dataclasses import asdict
+from functools import partial
+
+from ..codec_utils import compress, encode
+from ..models.caption_entry import CaptionEntry
+
+# Compare response encoding of a caption track (~300 lines) against the naive
+# json.dumps(asdict(...)) (run "python -m demo.misc.bench_codec")
+
+
+def main():
+    text = (
+        "vous allez bien. Aujourd'hui, on est le 31 août 2021 et demain on déménage !"
+    )
+    entries = [CaptionEntry("video", "fr", text, i, i + 5) for i in range(300)]
+
+    def naive():
+        return json.dumps([asdict(entry) for entry in entries]).encode("utf-8")
+
+    def fast():
+        return encode(entries)
+
+    assert json.loads(naive()) == json.loads(fast())
+    number = 200
+    for name, f in [("json.dumps(asdict)", naive), ("codec_utils.encode", fast)]:
+        seconds = min(timeit.repeat(f, number=number, repeat=5)) / number
+        print(f"{name:20} {seconds * 1e6:8.1f} us  {len(f())} bytes")
+
+    body = fast()
+    for encoding in ["gzip", "br"]:
+        compressed, _ = compress(body, encoding)
+        seconds = timeit.timeit(partial(compress, body, encoding), number=number)
+        us = seconds / number * 1e6
+        print(f"{encoding:20} {us:8.1f} us  {len(compressed)} bytes")
+
+
+if __name__ == "__main__":
+    main()
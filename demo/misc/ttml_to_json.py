@@ -10,9 +10,7 @@ class Entry(TypedDict):
     end: str
 
 
-def main():
-    ttml_text = sys.stdin.read()
-
+def parse_ttml(ttml_text: str) -> list[Entry]:
     # Normalize whitespaces
     ttml_text = ttml_text.replace("<br />", " ")
     ttml_text = ttml_text.replace("\xa0", " ")
@@ -24,6 +22,11 @@ def main():
         entries.append(
             dict(text=p.text or "", begin=p.attrib["begin"], end=p.attrib["end"])
         )
+    return entries
+
+
+def main():
+    entries = parse_ttml(sys.stdin.read())
 
     # Emit
     print(json.dumps(entries, indent=2, ensure_ascii=False))
@@ -1,15 +1,31 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import json
+import logging
+import time
 from abc import ABC, abstractmethod
-from typing import Any, ClassVar, Optional, Type, TypeVar, cast
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, ClassVar, Iterable, Optional, Sequence, Type, TypeVar, cast
 
 from boto3.dynamodb.transform import ConditionExpressionBuilder
 from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+from more_itertools import chunked
+
+from .latency_utils import hedger
+from .throttle_utils import backoff, call_with_rate_limit, rate_limiters
+
+logger = logging.getLogger(__name__)
 
 # Borrow utilities from boto3
 serializer = TypeSerializer()
 deserializer = TypeDeserializer()
-builder = ConditionExpressionBuilder()
 
 
 def map_values(d: dict, f: Any) -> dict:
@@ -28,35 +44,196 @@ def boto3_deserialize(d: dict) -> dict:
     return map_values(d, deserializer.deserialize)
 
 
-def boto3_build_expression(
+def build_expressions(
     KeyConditionExpression=None, FilterExpression=None, **kwargs
-) -> dict:
+) -> tuple[dict, dict]:
+    # Return parameters with expression strings/names and (unserialized) values.
+    # Placeholders of key and filter conditions are merged (builder is fresh for
+    # each call so that placeholders don't collide)
+    builder = ConditionExpressionBuilder()
     res = dict(kwargs)
-    if KeyConditionExpression is not None:
-        exp_string, names, values = builder.build_expression(KeyConditionExpression)
-        res.update(
-            dict(
-                KeyConditionExpression=exp_string,
-                ExpressionAttributeNames=names,
-                ExpressionAttributeValues=boto3_serialize(values),
-            )
-        )
-    if FilterExpression is not None:
-        exp_string, names, values = builder.build_expression(FilterExpression)
-        res.update(
-            dict(
-                FilterExpression=exp_string,
-                ExpressionAttributeNames=names,
-                ExpressionAttributeValues=boto3_serialize(values),
-            )
-        )
+    names: dict = {}
+    values: dict = {}
+    for param, condition in [
+        ("KeyConditionExpression", KeyConditionExpression),
+        ("FilterExpression", FilterExpression),
+    ]:
+        if condition is None:
+            continue
+        built = builder.build_expression(condition)
+        res[param] = built.condition_expression
+        names.update(built.attribute_name_placeholders)
+        values.update(built.attribute_value_placeholders)
+    if names:
+        res["ExpressionAttributeNames"] = names
+    return res, values
+
+
+def boto3_build_expression(**kwargs) -> dict:
+    res, values = build_expressions(**kwargs)
+    if values:
+        res["ExpressionAttributeValues"] = boto3_serialize(values)
     return res
 
 
+#
+# Prepared query template
+#
+
+
+class Param:
+    # Placeholder of value in condition, which is bound for each query e.g.
+    #   QueryTemplate(KeyConditionExpression=Key("username").eq(Param("username")))
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f"Param({self.name!r})"
+
+
+class QueryTemplate:
+    # Build expression string and names only once and serialize only bound values
+    def __init__(self, **kwargs):
+        self.params, values = build_expressions(**kwargs)
+        params = {k: v for k, v in values.items() if isinstance(v, Param)}
+        constants = {k: v for k, v in values.items() if not isinstance(v, Param)}
+        self.param_names = map_values(params, lambda param: param.name)
+        self.constant_values = boto3_serialize(constants)
+
+    def bind(self, **bindings) -> dict:
+        values = dict(self.constant_values)
+        for placeholder, name in self.param_names.items():
+            values[placeholder] = serializer.serialize(bindings[name])
+        if not values:
+            return dict(self.params)
+        return dict(self.params, ExpressionAttributeValues=values)
+
+
+def index_map(schema_or_description: dict) -> dict[str, dict]:
+    indexes = schema_or_description.get("GlobalSecondaryIndexes", [])
+    return {index["IndexName"]: index for index in indexes}
+
+
+def same_index(actual: dict, expected: dict) -> bool:
+    # "describe_table" adds extra fields (e.g. "IndexStatus") so compare only ours
+    return all(actual.get(k) == expected[k] for k in ["KeySchema", "Projection"])
+
+
+BATCH_WRITE_LIMIT = 25
+BATCH_GET_LIMIT = 100
+# Resending unprocessed items/keys of batch request (cf. write_batch, get_many)
+BATCH_MAX_ATTEMPTS = 10
+
 # TODO: type-safe
 Client = Any
 Table = Any
 
+
+def request_targets(
+    params: dict,
+) -> tuple[list[tuple[str, Optional[str]]], list[int]]:
+    # Tables/indexes accessed by request parameters and "cost" (number of items) of
+    # request for each of them
+    if "TableName" in params:
+        return [(params["TableName"], params.get("IndexName"))], [1]
+    if "RequestItems" in params:  # batch_get_item, batch_write_item
+        items = params["RequestItems"]
+        # "Keys" of batch_get_item or list of write requests of batch_write_item
+        costs = [len(v["Keys"] if "Keys" in v else v) for v in items.values()]
+        return [(table, None) for table in items], costs
+    if "TransactItems" in params:  # transact_get_items, transact_write_items
+        counts: dict[str, int] = {}
+        for item in params["TransactItems"]:
+            for op in item.values():
+                counts[op["TableName"]] = counts.get(op["TableName"], 0) + 1
+        tables = sorted(counts)
+        return [(table, None) for table in tables], [counts[t] for t in tables]
+    return [], []
+
+
+# Idempotent reads which may be sent twice
+HEDGED_OPERATIONS = ["get_item", "query"]
+
+
+def send_request(client: Client, operation: str, **params) -> dict:
+    # Send data plane request with adaptive rate limiting and throttle-aware retries
+    targets, costs = request_targets(params)
+    limiters = [rate_limiters.get(table, index) for table, index in targets]
+
+    def call() -> dict:
+        return call_with_rate_limit(
+            limiters, partial(getattr(client, operation), **params), costs=costs
+        )
+
+    def call_bounded() -> dict:
+        # Bounded by request deadline and hedged if enabled (cf. latency_utils)
+        key = (operation, tuple(targets))
+        return hedger.call(key, call, hedge=operation in HEDGED_OPERATIONS)
+
+    if slow_operations.threshold_ms is None:
+        return call_bounded()
+    started_at = time.perf_counter()
+    res = None
+    try:
+        res = call_bounded()
+        return res
+    finally:
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        if elapsed_ms >= slow_operations.threshold_ms:
+            slow_operations.add(operation, targets, params, res, elapsed_ms)
+
+
+#
+# Slow operation log
+#
+
+EXPRESSION_PARAMS = [
+    "KeyConditionExpression",
+    "FilterExpression",
+    "ConditionExpression",
+    "UpdateExpression",
+    "ProjectionExpression",
+]
+
+
+class SlowOperationLog:
+    # Keep recent DynamoDB calls slower than threshold (disabled when None)
+    def __init__(self, threshold_ms: Optional[float] = None, maxlen=1000):
+        self.threshold_ms = threshold_ms
+        self.records: deque[dict] = deque(maxlen=maxlen)
+
+    def add(
+        self,
+        operation: str,
+        targets: list[tuple[str, Optional[str]]],
+        params: dict,
+        res: Optional[dict],
+        elapsed_ms: float,
+    ):
+        record = dict(
+            operation=operation,
+            tables=[table for table, _ in targets],
+            index=params.get("IndexName"),
+            # Only placeholders i.e. no values are logged
+            expressions={k: params[k] for k in EXPRESSION_PARAMS if k in params},
+            item_count=None if res is None else item_count(res),
+            elapsed_ms=round(elapsed_ms, 1),
+        )
+        self.records.append(record)
+        logger.warning("slow operation: %s", record)
+
+
+def item_count(res: dict) -> int:
+    if "Count" in res:
+        return res["Count"]
+    if "Responses" in res:  # batch_get_item
+        return sum(len(items) for items in res["Responses"].values())
+    return 1 if res.get("Item") or res.get("Attributes") else 0
+
+
+slow_operations = SlowOperationLog()
+
+
 T = TypeVar("T", bound="Base")
 
 
@@ -64,6 +241,15 @@ class Base(ABC):
     __client__: ClassVar[Client] = None
     __schema__: ClassVar[dict] = {}  # child class must override
     __table_description__: ClassVar[dict] = {}
+    # Stored in table shared with other models if set (cf. single_table_utils)
+    __layout__: ClassVar[Any] = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if layout := cls.__dict__.get("__layout__"):
+            # Layout keeps model's own "__schema__" (for its logical keys and
+            # indexes) and replaces it with the shared table's
+            cls.__schema__ = layout.bind(cls)
 
     @classmethod
     def TableName(cls: Type[T]) -> dict:
@@ -71,7 +257,17 @@ class Base(ABC):
 
     @classmethod
     def create_table(cls: Type[T]):
-        res = cls.__client__.create_table(**cls.__schema__)
+        # Empty index list and definitions of attributes not in any key are invalid
+        params = dict(cls.__schema__)
+        if not params.get("GlobalSecondaryIndexes", True):
+            del params["GlobalSecondaryIndexes"]
+        key_schemas = [params["KeySchema"]]
+        key_schemas += [index["KeySchema"] for index in index_map(params).values()]
+        key_names = {key["AttributeName"] for keys in key_schemas for key in keys}
+        params["AttributeDefinitions"] = [
+            d for d in params["AttributeDefinitions"] if d["AttributeName"] in key_names
+        ]
+        res = cls.__client__.create_table(**params)
         cls.__table_description__ = res["TableDescription"]
         cls.__client__.get_waiter("table_exists").wait(**cls.TableName())
 
@@ -86,12 +282,113 @@ class Base(ABC):
         res = cls.__client__.describe_table(**cls.TableName())
         cls.__table_description__ = res["Table"]
 
+    @classmethod
+    def table_exists(cls: Type[T]) -> bool:
+        try:
+            cls.describe_table()
+            return True
+        except cls.__client__.exceptions.ResourceNotFoundException:
+            return False
+
+    @classmethod
+    def schema_changes(cls: Type[T], prune=False) -> list[dict]:
+        # Compare "__schema__" with "__table_description__" (cf. describe_table)
+        # and return "GlobalSecondaryIndexUpdates" entries to reconcile them.
+        # Indexes no longer declared are only deleted with "prune" (they may still
+        # be queried by running servers of the previous version) and logged if not.
+        expected = index_map(cls.__schema__)
+        actual = index_map(cls.__table_description__)
+        changes = []
+        for name, index in actual.items():
+            if name not in expected and not prune:
+                logger.warning(
+                    "skipped deleting undeclared index %s of %s (prune to delete)",
+                    name,
+                    cls.__schema__["TableName"],
+                )
+            elif name not in expected or not same_index(index, expected[name]):
+                changes.append({"Delete": {"IndexName": name}})
+        for name, index in expected.items():
+            if name not in actual or not same_index(actual[name], index):
+                changes.append({"Create": index})
+        return changes
+
+    @classmethod
+    def ensure_table(
+        cls: Type[T], apply=True, recreate=False, prune=False
+    ) -> list[dict]:
+        if not cls.table_exists():
+            if apply:
+                cls.create_table()
+            return [{"CreateTable": cls.TableName()}]
+
+        if cls.__table_description__["KeySchema"] != cls.__schema__["KeySchema"]:
+            # Primary key cannot be altered
+            if apply and recreate:
+                cls.delete_table()
+                cls.create_table()
+            return [{"RecreateTable": cls.TableName()}]
+
+        changes = cls.schema_changes(prune)
+        if apply:
+            # Only one index can be created or deleted by a single "update_table"
+            for change in changes:
+                cls.__client__.update_table(
+                    **cls.TableName(),
+                    AttributeDefinitions=cls.__schema__["AttributeDefinitions"],
+                    GlobalSecondaryIndexUpdates=[change],
+                )
+                cls.wait_for_indexes()
+
+        if stream := cls.stream_change():
+            if apply:
+                cls.__client__.update_table(
+                    **cls.TableName(), StreamSpecification=stream
+                )
+                cls.wait_for_indexes()
+            changes.append({"StreamSpecification": stream})
+        return changes
+
+    @classmethod
+    def stream_change(cls: Type[T]) -> Optional[dict]:
+        # "StreamSpecification" to enable/disable stream (None if already as expected)
+        disabled = {"StreamEnabled": False}
+        expected = cls.__schema__.get("StreamSpecification", disabled)
+        actual = cls.__table_description__.get("StreamSpecification", disabled)
+        if not actual["StreamEnabled"] and not expected["StreamEnabled"]:
+            return None
+        return None if actual == expected else expected
+
+    @classmethod
+    def wait_for_indexes(cls: Type[T], delay=1.0, max_attempts=600):
+        # No boto3 waiter for index creation/deletion so poll "describe_table"
+        for _ in range(max_attempts):
+            cls.describe_table()
+            description = cls.__table_description__
+            statuses = [description["TableStatus"]] + [
+                index["IndexStatus"]
+                for index in description.get("GlobalSecondaryIndexes", [])
+            ]
+            if all(status == "ACTIVE" for status in statuses):
+                return
+            time.sleep(delay)
+        raise TimeoutError(f"{cls.TableName()} indexes did not become ACTIVE")
+
+    @classmethod
+    def request(cls: Type[T], operation: str, **params) -> dict:
+        return send_request(cls.__client__, operation, **params)
+
     @classmethod
     def serialize(cls: Type[T], self: T) -> dict:
-        return boto3_serialize(cls.to_dict(self))
+        d = boto3_serialize(cls.to_dict(self))
+        if cls.__layout__:
+            d.update(cls.__layout__.item_attributes(self))
+        return d
 
     @classmethod
     def deserialize(cls: Type[T], d: dict) -> T:
+        if cls.__layout__:
+            d = cls.__layout__.strip(d)
         return cls.from_dict(boto3_deserialize(d))
 
     @classmethod
@@ -99,12 +396,37 @@ class Base(ABC):
         return [attrs["AttributeName"] for attrs in cls.__schema__["KeySchema"]]
 
     def keys(self: T) -> dict:
+        if self.__layout__:
+            return self.__layout__.primary_key(self)
         return {name: getattr(self, name) for name in self.key_names()}
 
+    @classmethod
+    def key_params(cls: Type[T], keys: dict) -> dict:
+        # Serialized "Key" from model's key attributes (e.g. "get(id=...)")
+        if cls.__layout__:
+            keys = cls.__layout__.primary_key(keys)
+        return boto3_serialize(keys)
+
+    @classmethod
+    def index_key_names(cls: Type[T], index_name: str) -> list[str]:
+        if cls.__layout__:
+            return cls.__layout__.index_key_names(index_name)
+        index = index_map(cls.__schema__)[index_name]
+        return [attrs["AttributeName"] for attrs in index["KeySchema"]]
+
+    @classmethod
+    def item_model(cls: Type[T], item: dict) -> Type[Base]:
+        # Model of raw item read from this model's table
+        return cls.__layout__.model_of(item) if cls.__layout__ else cls
+
     @classmethod
     def unique_keys_condition(cls: Type[T]) -> str:
         return " AND ".join(f"attribute_not_exists({k})" for k in cls.key_names())
 
+    @classmethod
+    def existing_keys_condition(cls: Type[T]) -> str:
+        return " AND ".join(f"attribute_exists({k})" for k in cls.key_names())
+
     @classmethod
     @abstractmethod
     def to_dict(cls: Type[T], self: T) -> dict:
@@ -126,26 +448,56 @@ class Base(ABC):
         return params
 
     def put(self: T, unique=True):
-        self.__client__.put_item(**self.put_params(unique=unique))
+        self.request("put_item", **self.put_params(unique=unique))
 
     @classmethod
-    def get(cls: Type[T], **keys: dict) -> Optional[T]:
-        res = cls.__client__.get_item(**cls.TableName(), Key=boto3_serialize(keys))
+    def get(cls: Type[T], **keys: Any) -> Optional[T]:
+        res = cls.request("get_item", **cls.TableName(), Key=cls.key_params(keys))
         if item := res.get("Item"):
             return cls.deserialize(item)
         return None
 
-    def update(self: T):
+    @classmethod
+    def get_batch(cls: Type[T], keys_list: list[dict]) -> list[Optional[T]]:
+        return cast(Any, get_many([(cls, keys) for keys in keys_list]))
+
+    @classmethod
+    async def load_batched(cls: Type[T], **keys: Any) -> Optional[T]:
+        # "get" batched with other calls of the same tick (cf. DataLoader)
+        if loader := current_loader.get():
+            # Shared future must not be cancelled by one of callers
+            return await asyncio.shield(loader.load(cls, keys))
+        return await run_in_executor(partial(cls.get, **keys))
+
+    def delete_params(self: T, must_exist=False):
+        params = dict(**self.TableName(), Key=boto3_serialize(self.keys()))
+        if must_exist:
+            params.update(ConditionExpression=self.existing_keys_condition())
+        return params
+
+    def update_params(self: T):
         d = omit(self.serialize(self), self.key_names())
-        AttributeUpdates = map_values(d, lambda v: {"Value": v, "Action": "PUT"})
-        self.__client__.update_item(
-            **self.TableName(),
-            Key=boto3_serialize(self.keys()),
-            AttributeUpdates=AttributeUpdates,
-        )
+        params = dict(**self.TableName(), Key=boto3_serialize(self.keys()))
+        if d:
+            # "SET #a0 = :a0, ..." (instead of legacy "AttributeUpdates" which
+            # cannot be used in transaction)
+            names = [f"a{i}" for i in range(len(d))]
+            assignments = ", ".join(f"#{name} = :{name}" for name in names)
+            params.update(
+                UpdateExpression=f"SET {assignments}",
+                ExpressionAttributeNames={f"#{n}": k for n, k in zip(names, d)},
+                ExpressionAttributeValues={
+                    f":{n}": v for n, v in zip(names, d.values())
+                },
+            )
+        return params
+
+    def update(self: T):
+        self.request("update_item", **self.update_params())
 
     def delete(self: T) -> bool:
-        res = self.__client__.delete_item(
+        res = self.request(
+            "delete_item",
             **self.TableName(),
             Key=boto3_serialize(self.keys()),
             ReturnValues="ALL_OLD",
@@ -153,7 +505,25 @@ class Base(ABC):
         return res.get("Attributes") is not None
 
     #
-    # read many (TODO: Pagination)
+    # transaction (cf. UnitOfWork)
+    #
+
+    def transact_items(self: T, action: str, **options) -> list[dict]:
+        # Items of TransactWriteItems to "put", "update" or "delete" this model
+        if action == "put":
+            return [dict(Put=self.put_params(**options))]
+        if action == "update":
+            return [dict(Update=self.update_params(**options))]
+        if action == "delete":
+            return [dict(Delete=self.delete_params(**options))]
+        raise ValueError(action)
+
+    def after_commit(self: T, action: str):
+        # Hook called after transaction including this model succeeded
+        pass
+
+    #
+    # read many
     #
 
     @classmethod
@@ -164,28 +534,309 @@ class Base(ABC):
     def scan(cls: Type[T], **kwargs) -> list[T]:
         return cls.scan_raw(**boto3_build_expression(**kwargs))
 
+    @classmethod
+    def query_prepared(cls: Type[T], template: QueryTemplate, **bindings) -> list[T]:
+        return cls.query_raw(**template.bind(**bindings))
+
     @classmethod
     def query_raw(cls: Type[T], **kwargs) -> list[T]:
-        res = cls.__client__.query(**cls.TableName(), **kwargs)
-        items = res["Items"]
-        assert res.get("LastEvaluatedKey") is None  # No pagination needed
-        return list(map(cls.deserialize, items))
+        return cls.read_all_raw("query", **kwargs)
+
+    @classmethod
+    def query_page_raw(cls: Type[T], **kwargs) -> tuple[list[T], Optional[dict]]:
+        # Single page and "LastEvaluatedKey" to pass as "ExclusiveStartKey"
+        if cls.__layout__:
+            kwargs = cls.__layout__.translate_query(kwargs)
+        res = cls.request("query", **cls.TableName(), **kwargs)
+        return list(map(cls.deserialize, res["Items"])), res.get("LastEvaluatedKey")
 
     @classmethod
     def scan_raw(cls: Type[T], **kwargs) -> list[T]:
-        res = cls.__client__.scan(**cls.TableName(), **kwargs)
-        items = res["Items"]
-        assert res.get("LastEvaluatedKey") is None  # No pagination needed
-        return list(map(cls.deserialize, items))
+        return cls.read_all_raw("scan", **kwargs)
+
+    @classmethod
+    def read_all_raw(cls: Type[T], operation: str, **kwargs) -> list[T]:
+        # Follow "LastEvaluatedKey" unless "Limit" is given
+        if cls.__layout__ and operation == "query":
+            kwargs = cls.__layout__.translate_query(kwargs)
+        items = []
+        while True:
+            res = cls.request(operation, **cls.TableName(), **kwargs)
+            items += res["Items"]
+            last_key = res.get("LastEvaluatedKey")
+            if last_key is None or "Limit" in kwargs:
+                break
+            kwargs = dict(kwargs, ExclusiveStartKey=last_key)
+        # Scan of shared table reads items of other models too
+        return [cls.deserialize(item) for item in items if cls.item_model(item) is cls]
 
     #
-    # TODO: create/destroy many
+    # create/destroy many
     #
 
     @classmethod
-    def put_batch(cls):
-        assert False
+    def put_batch(cls: Type[T], items: Iterable[T]):
+        cls.write_batch(
+            [dict(PutRequest=dict(Item=cls.serialize(item))) for item in items]
+        )
+
+    @classmethod
+    def destroy_batch(cls: Type[T], items: Iterable[T]):
+        cls.write_batch(
+            [
+                dict(DeleteRequest=dict(Key=boto3_serialize(item.keys())))
+                for item in items
+            ]
+        )
 
     @classmethod
-    def destroy_batch(cls):
-        assert False
+    def write_batch(cls: Type[T], requests: list[dict]):
+        table_name = cls.__schema__["TableName"]
+        for chunk in chunked(requests, BATCH_WRITE_LIMIT):
+            pending = {table_name: chunk}
+            for attempt in range(BATCH_MAX_ATTEMPTS):
+                if attempt > 0:
+                    time.sleep(backoff(attempt - 1))
+                res = cls.request("batch_write_item", RequestItems=pending)
+                pending = res.get("UnprocessedItems") or {}
+                if not pending:
+                    break
+            else:
+                raise TimeoutError(f"{table_name} items unprocessed after retries")
+
+
+def key_id(model: Type[Base], serialized_keys: dict) -> tuple[str, str]:
+    return (model.__schema__["TableName"], json.dumps(serialized_keys, sort_keys=True))
+
+
+def get_many(requests: list[tuple[Type[Base], dict]]) -> list[Optional[Base]]:
+    # "get" items of any models by BatchGetItem (results in the same order as requests)
+    models: dict[str, Type[Base]] = {}
+    keys: dict[tuple[str, str], dict] = {}
+    for model, model_keys in requests:
+        serialized = model.key_params(model_keys)
+        models[model.__schema__["TableName"]] = model
+        keys[key_id(model, serialized)] = serialized
+
+    found: dict[tuple[str, str], Base] = {}
+    for chunk in chunked(keys.items(), BATCH_GET_LIMIT):
+        pending: dict[str, dict] = {}
+        for (table, _), serialized in chunk:
+            pending.setdefault(table, {"Keys": []})["Keys"].append(serialized)
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(backoff(attempt - 1))
+            res = send_request(
+                models[next(iter(pending))].__client__,
+                "batch_get_item",
+                RequestItems=pending,
+            )
+            for table, items in res["Responses"].items():
+                for item in items:
+                    model = models[table].item_model(item)
+                    serialized = {name: item[name] for name in model.key_names()}
+                    found[key_id(model, serialized)] = model.deserialize(item)
+            pending = res.get("UnprocessedKeys") or {}
+            if not pending:
+                break
+        else:
+            raise TimeoutError(f"{list(pending)} keys unprocessed after retries")
+
+    return [
+        found.get(key_id(model, model.key_params(model_keys)))
+        for model, model_keys in requests
+    ]
+
+
+#
+# Unit of work (TransactWriteItems across models)
+#
+
+TRANSACT_WRITE_LIMIT = 100
+
+
+@dataclass
+class CancellationFailure:
+    index: int  # within TransactItems of the chunk
+    action: str
+    model: Base
+    code: str  # e.g. "ConditionalCheckFailed"
+    message: Optional[str]
+
+
+class TransactionCanceled(Exception):
+    def __init__(self, failures: list[CancellationFailure]):
+        super().__init__(
+            ", ".join(
+                f"{f.action} {type(f.model).__name__}{f.model.keys()}: {f.code}"
+                for f in failures
+            )
+        )
+        self.failures = failures
+
+
+class UnitOfWork:
+    # Collect puts/updates/deletes/condition checks across models and commit them by
+    # TransactWriteItems. Items of a single model (e.g. with aggregate updates) are
+    # always sent in the same request.
+    def __init__(self):
+        self.groups: list[tuple[str, Base, list[dict]]] = []
+
+    def __len__(self) -> int:
+        return sum(len(items) for _, _, items in self.groups)
+
+    def add(self, action: str, model: Base, items: list[dict]) -> UnitOfWork:
+        self.groups.append((action, model, items))
+        return self
+
+    def put(self, model: Base, unique=True) -> UnitOfWork:
+        return self.add("put", model, model.transact_items("put", unique=unique))
+
+    def update(self, model: Base) -> UnitOfWork:
+        return self.add("update", model, model.transact_items("update"))
+
+    def delete(self, model: Base, must_exist=False) -> UnitOfWork:
+        items = model.transact_items("delete", must_exist=must_exist)
+        return self.add("delete", model, items)
+
+    def check(self, model: Base, condition: Any) -> UnitOfWork:
+        # "condition" as boto3 condition (e.g. Attr("x").exists()) or raw string
+        params = dict(**model.TableName(), Key=boto3_serialize(model.keys()))
+        if isinstance(condition, str):
+            params.update(ConditionExpression=condition)
+        else:
+            res, values = build_expressions(FilterExpression=condition)
+            params.update(
+                ConditionExpression=res["FilterExpression"],
+                ExpressionAttributeNames=res["ExpressionAttributeNames"],
+            )
+            if values:
+                params.update(ExpressionAttributeValues=boto3_serialize(values))
+        return self.add("check", model, [dict(ConditionCheck=params)])
+
+    def chunks(self, atomic: bool) -> list[list[tuple[str, Base, list[dict]]]]:
+        if atomic:
+            if len(self) > TRANSACT_WRITE_LIMIT:
+                raise ValueError(f"{len(self)} items exceed {TRANSACT_WRITE_LIMIT}")
+            return [self.groups]
+        chunks: list[list[tuple[str, Base, list[dict]]]] = [[]]
+        size = 0
+        for group in self.groups:
+            if size + len(group[2]) > TRANSACT_WRITE_LIMIT:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(group)
+            size += len(group[2])
+        return chunks
+
+    def commit(self, atomic=True):
+        # Non-atomic commit sends as many transactions as needed and stops at the
+        # first cancellation (previous chunks stay committed)
+        for chunk in self.chunks(atomic):
+            if not chunk:
+                continue
+            owners = [(action, model) for action, model, items in chunk for _ in items]
+            items = [item for _, _, group_items in chunk for item in group_items]
+            client = chunk[0][1].__client__
+            try:
+                send_request(client, "transact_write_items", TransactItems=items)
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code != "TransactionCanceledException":
+                    raise
+                reasons = e.response.get("CancellationReasons", [])
+                failures = [
+                    CancellationFailure(
+                        i, *owners[i], reason.get("Code"), reason.get("Message")
+                    )
+                    for i, reason in enumerate(reasons)
+                    if reason.get("Code") not in [None, "None"]
+                ]
+                raise TransactionCanceled(failures) from e
+            for action, model, _ in chunk:
+                model.after_commit(action)
+
+
+#
+# Request-scoped batching of "get" (cf. Base.load)
+#
+
+current_loader: contextvars.ContextVar[Optional[DataLoader]] = contextvars.ContextVar(
+    "current_loader", default=None
+)
+
+
+async def run_in_executor(f: Any) -> Any:
+    # Run blocking boto3 call in thread with current context (e.g. current_loader)
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, context.run, f)
+
+
+class DataLoader:
+    # Collect "load" calls made in the same event loop tick, dedupe them, send them as
+    # a single BatchGetItem and memoize results (one instance per request)
+    def __init__(self):
+        self.futures: dict[tuple[str, str], asyncio.Future] = {}
+        self.queue: list[tuple[Type[Base], dict]] = []
+        self.num_batches = 0
+
+    def load(self, model: Type[Base], keys: dict) -> asyncio.Future:
+        key = key_id(model, model.key_params(keys))
+        if key not in self.futures:
+            loop = asyncio.get_running_loop()
+            self.futures[key] = loop.create_future()
+            if not self.queue:
+                loop.call_soon(self.dispatch)
+            self.queue.append((model, keys))
+        return self.futures[key]
+
+    def dispatch(self):
+        queue, self.queue = self.queue, []
+        self.num_batches += 1
+        asyncio.ensure_future(self.fetch(queue))
+
+    async def fetch(self, queue: list[tuple[Type[Base], dict]]):
+        futures = [self.futures[key_id(m, m.key_params(k))] for m, k in queue]
+        try:
+            results = await run_in_executor(lambda: get_many(queue))
+        except Exception as e:  # pylint: disable=broad-except
+            for (model, keys), future in zip(queue, futures):
+                # Don't memoize failure
+                del self.futures[key_id(model, model.key_params(keys))]
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+
+#
+# Provision/delete tables concurrently
+#
+
+
+def ensure_tables(
+    models: Sequence[Type[Base]], apply=True, recreate=False, prune=False
+) -> dict[str, list[dict]]:
+    # Create missing tables and reconcile indexes (cf. Base.ensure_table) of all
+    # models in parallel, then return changes per table name (applied or not)
+    models = unique_tables(models)
+    with ThreadPoolExecutor(max(len(models), 1)) as executor:
+        changes = executor.map(lambda m: m.ensure_table(apply, recreate, prune), models)
+        return {m.__schema__["TableName"]: c for m, c in zip(models, changes)}
+
+
+def delete_tables(models: Sequence[Type[Base]]):
+    def delete_table(model: Type[Base]):
+        with suppress(model.__client__.exceptions.ResourceNotFoundException):
+            model.delete_table()
+
+    models = unique_tables(models)
+    with ThreadPoolExecutor(max(len(models), 1)) as executor:
+        list(executor.map(delete_table, models))
+
+
+def unique_tables(models: Sequence[Type[Base]]) -> list[Type[Base]]:
+    # One model per table (models may share single table cf. Base.__layout__)
+    return list({m.__schema__["TableName"]: m for m in models}.values())
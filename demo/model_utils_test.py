@@ -1,3 +1,4 @@
+import asyncio
 import unittest
 import uuid
 from dataclasses import asdict, dataclass
@@ -7,7 +8,20 @@ import boto3
 import pytest
 from boto3.dynamodb.conditions import Attr, Key
 
-from .model_utils import Base
+from .model_utils import (
+    Base,
+    DataLoader,
+    Param,
+    QueryTemplate,
+    TransactionCanceled,
+    UnitOfWork,
+    boto3_build_expression,
+    current_loader,
+    delete_tables,
+    ensure_tables,
+    request_targets,
+    slow_operations,
+)
 
 TEST_CONFIG = dict(
     endpoint_url="http://localhost:4566",
@@ -106,6 +120,63 @@ class BaseTest(unittest.TestCase):
         Model.describe_table()
         assert Model.__table_description__["TableStatus"] == "ACTIVE"
 
+    def test_ensure_tables(self):
+        Model1 = define_test_model()
+        Model2 = define_test_model()
+        Model1.create_table()
+        res = ensure_tables([Model1, Model2])
+        assert res == {
+            Model1.__schema__["TableName"]: [],
+            Model2.__schema__["TableName"]: [{"CreateTable": Model2.TableName()}],
+        }
+        assert Model2.__table_description__["TableStatus"] == "ACTIVE"
+
+    def test_ensure_tables_index_changes(self):
+        Model = define_test_model()
+        index = Model.__schema__["GlobalSecondaryIndexes"].pop()
+        Model.create_table()
+        Model.__schema__["GlobalSecondaryIndexes"].append(index)
+
+        res = ensure_tables([Model], apply=False)
+        assert res == {Model.__schema__["TableName"]: [{"Create": index}]}
+
+        ensure_tables([Model])
+        assert ensure_tables([Model]) == {Model.__schema__["TableName"]: []}
+
+    def test_ensure_tables_prune(self):
+        Model = define_test_model()
+        Model.create_table()
+        index = Model.__schema__["GlobalSecondaryIndexes"].pop()
+        delete = {"Delete": {"IndexName": index["IndexName"]}}
+
+        with self.assertLogs("demo.model_utils", "WARNING") as logs:
+            assert ensure_tables([Model]) == {Model.__schema__["TableName"]: []}
+        assert index["IndexName"] in logs.output[0]
+
+        res = ensure_tables([Model], prune=True)
+        assert res == {Model.__schema__["TableName"]: [delete]}
+        assert ensure_tables([Model]) == {Model.__schema__["TableName"]: []}
+
+    def test_ensure_tables_stream_changes(self):
+        Model = define_test_model()
+        Model.create_table()
+        stream = dict(StreamEnabled=True, StreamViewType="NEW_AND_OLD_IMAGES")
+        Model.__schema__["StreamSpecification"] = stream
+
+        res = ensure_tables([Model])
+        assert res == {Model.__schema__["TableName"]: [{"StreamSpecification": stream}]}
+        assert Model.__table_description__["LatestStreamArn"]
+        assert ensure_tables([Model]) == {Model.__schema__["TableName"]: []}
+
+    def test_delete_tables(self):
+        Model1 = define_test_model()
+        Model2 = define_test_model()
+        ensure_tables([Model1, Model2])
+        delete_tables([Model1, Model2])
+        names = self.client.list_tables()["TableNames"]
+        assert Model1.__schema__["TableName"] not in names
+        assert Model2.__schema__["TableName"] not in names
+
     def test_serialize(self):
         Model = define_test_model()
         Model.create_table()
@@ -141,6 +212,96 @@ class BaseTest(unittest.TestCase):
         res = Model.query(KeyConditionExpression=Key("username").eq("barr"))
         assert len(res) == 1
 
+    def test_get_batch(self):
+        Model = define_test_model()
+        Model.create_table()
+        models = [Model(f"user{i}", "asdf", i) for i in range(150)]
+        Model.put_batch(models)
+        keys_list = [model.keys() for model in models] + [dict(username="x", age=0)]
+        res = Model.get_batch(keys_list)
+        assert res == models + [None]
+
+    def test_load(self):
+        Model = define_test_model()
+        Model.create_table()
+        models = [Model("barr", "asdf1", 1), Model("john", "qwer1", 2)]
+        Model.put_batch(models)
+        loader = DataLoader()
+
+        async def main():
+            current_loader.set(loader)
+            res = await asyncio.gather(
+                Model.load_batched(username="barr", age=1),
+                Model.load_batched(username="john", age=2),
+                Model.load_batched(username="barr", age=1),
+                Model.load_batched(username="fooo", age=3),
+            )
+            res_memoized = await Model.load_batched(username="john", age=2)
+            return res, res_memoized
+
+        res, res_memoized = asyncio.run(main())
+        assert res == [models[0], models[1], models[0], None]
+        assert res_memoized == models[1]
+        assert loader.num_batches == 1
+
+    def test_unit_of_work(self):
+        Model1 = define_test_model()
+        Model2 = define_test_model()
+        ensure_tables([Model1, Model2])
+        model1 = Model1("barr", "asdf1", 1)
+        model1.put()
+        model1.password = "qwer1"
+        model2 = Model2("john", "asdf2", 2)
+        model3 = Model2("jimm", "asdf3", 3)
+        model3.put()
+        (
+            UnitOfWork()
+            .update(model1)
+            .put(model2)
+            .check(model3, Attr("password").eq("asdf3"))
+            .commit()
+        )
+        assert Model1.get(**model1.keys()) == model1
+        assert Model2.get(**model2.keys()) == model2
+
+        with pytest.raises(TransactionCanceled) as e:
+            UnitOfWork().put(Model1("fooo", "asdf")).put(model2).commit()
+        assert [(f.index, f.model, f.code) for f in e.value.failures] == [
+            (1, model2, "ConditionalCheckFailed")
+        ]
+        assert Model1.get(username="fooo", age=0) is None
+
+        UnitOfWork().delete(model1).delete(model2, must_exist=True).commit()
+        assert Model1.get(**model1.keys()) is None
+        assert Model2.get(**model2.keys()) is None
+
+    def test_unit_of_work_non_atomic(self):
+        Model = define_test_model()
+        Model.create_table()
+        unit_of_work = UnitOfWork()
+        models = [Model(f"user{i}", "asdf", i) for i in range(150)]
+        for model in models:
+            unit_of_work.put(model)
+        with pytest.raises(ValueError):
+            unit_of_work.commit()
+        unit_of_work.commit(atomic=False)
+        assert Model.get_batch([model.keys() for model in models]) == models
+
+    def test_slow_operations(self):
+        Model = define_test_model()
+        Model.create_table()
+        Model("barr", "asdf1", 1).put()
+        slow_operations.threshold_ms = 0
+        try:
+            Model.query(KeyConditionExpression=Key("username").eq("barr"))
+        finally:
+            slow_operations.threshold_ms = None
+        record = slow_operations.records[-1]
+        assert record["operation"] == "query"
+        assert record["tables"] == [Model.__schema__["TableName"]]
+        assert record["expressions"] == {"KeyConditionExpression": "#n0 = :v0"}
+        assert record["item_count"] == 1
+
     def test_update(self):
         Model = define_test_model()
         Model.create_table()
@@ -194,6 +355,73 @@ class BaseTest(unittest.TestCase):
         )
         assert res == models[:1]
 
+    def test_query_hash_and_filter(self):
+        Model = define_test_model()
+        Model.create_table()
+        models = [
+            Model("barr", "asdf1", 1),
+            Model("barr", "qwer", 2),
+            Model("john", "asdf2", 2),
+        ]
+        for model in models:
+            model.put()
+        res = Model.query(
+            KeyConditionExpression=Key("username").eq("barr"),
+            FilterExpression=Attr("password").begins_with("asdf"),
+        )
+        assert res == models[:1]
+
+    def test_build_expression_merge_placeholders(self):
+        res = boto3_build_expression(
+            KeyConditionExpression=Key("username").eq("barr"),
+            FilterExpression=Attr("password").eq("asdf"),
+        )
+        assert res == {
+            "KeyConditionExpression": "#n0 = :v0",
+            "FilterExpression": "#n1 = :v1",
+            "ExpressionAttributeNames": {"#n0": "username", "#n1": "password"},
+            "ExpressionAttributeValues": {":v0": {"S": "barr"}, ":v1": {"S": "asdf"}},
+        }
+
+    def test_query_template_bind(self):
+        template = QueryTemplate(
+            KeyConditionExpression=Key("username").eq(Param("username"))
+            & Key("age").lte(Param("age")),
+            FilterExpression=Attr("password").begins_with("asdf"),
+        )
+        res = template.bind(username="barr", age=1)
+        assert res == {
+            "KeyConditionExpression": "(#n0 = :v0 AND #n1 <= :v1)",
+            "FilterExpression": "begins_with(#n2, :v2)",
+            "ExpressionAttributeNames": {
+                "#n0": "username",
+                "#n1": "age",
+                "#n2": "password",
+            },
+            "ExpressionAttributeValues": {
+                ":v0": {"S": "barr"},
+                ":v1": {"N": "1"},
+                ":v2": {"S": "asdf"},
+            },
+        }
+
+    def test_query_prepared(self):
+        Model = define_test_model()
+        Model.create_table()
+        models = [
+            Model("barr", "asdf1", 1),
+            Model("barr", "asdf2", 2),
+            Model("john", "qwer1", 2),
+        ]
+        for model in models:
+            model.put()
+        template = QueryTemplate(
+            KeyConditionExpression=Key("username").eq(Param("username"))
+            & Key("age").lte(Param("age"))
+        )
+        assert Model.query_prepared(template, username="barr", age=1) == models[:1]
+        assert Model.query_prepared(template, username="john", age=2) == models[2:]
+
     def test_query_gsi(self):
         Model = define_test_model()
         Model.create_table()
@@ -255,3 +483,12 @@ class BaseTest(unittest.TestCase):
             }
         )
         assert res == models[:2]
+
+
+class RequestTargetsTest(unittest.TestCase):
+    def test_cost_per_table(self):
+        params = dict(RequestItems=dict(a=dict(Keys=[{}, {}]), b=dict(Keys=[{}])))
+        assert request_targets(params) == ([("a", None), ("b", None)], [2, 1])
+        items = [dict(Put=dict(TableName=name)) for name in ["b", "a", "b"]]
+        params = dict(TransactItems=items)
+        assert request_targets(params) == ([("a", None), ("b", None)], [1, 2])
@@ -1,14 +1,29 @@
+import asyncio
 import json
+import threading
+import time
 import unittest
+from contextlib import contextmanager
 from os.path import dirname, join
-from typing import Any, ClassVar, Type
+from typing import Any, ClassVar, Iterator, Optional, Type
+from unittest.mock import patch
 
 import boto3
+from botocore.exceptions import ClientError
 
 from ..config import config, env
-from .application import ApplicationBase
+from ..latency_utils import current_deadline
+from ..model_utils import UnitOfWork, boto3_serialize, delete_tables, ensure_tables
+from ..review_utils import DAY
+from ..stream_utils import Change
+from ..timing_utils import TrackTiming
+from .application import ApplicationBase, Counter
 from .caption_entry import CaptionEntry
-from .practice_entry import PracticeEntry
+from .caption_posting import CaptionPosting, SearchHit, search
+from .caption_track import CaptionTrack, pack_entries
+from .practice_entry import LANGUAGE_INDEX, PracticeEntry
+from .review_queue import DueQueue, next_due, review, review_queues, sync_review_queues
+from .track_timing import CachedTiming, TrackTimings
 from .user import UniqueUsername, User
 from .video import Video
 
@@ -18,6 +33,9 @@ model_classes: list[Type[ApplicationBase]] = [
     Video,
     CaptionEntry,
     PracticeEntry,
+    Counter,
+    CaptionPosting,
+    CaptionTrack,
 ]
 
 player_response_json = join(dirname(__file__), "../../data/ex01.player-response.json")
@@ -27,6 +45,49 @@ en_ttml = join(dirname(__file__), "../../data/ex01.en.ttml")
 player_response = json.load(open(player_response_json))
 
 
+@contextmanager
+def conflicting_transactions(client: Any) -> Iterator[list[dict]]:
+    # Transactions as DynamoDB runs them concurrently: canceled by TransactionConflict
+    # while another one updates the same counter, otherwise applied atomically (which
+    # moto doesn't do for concurrent requests, so they're applied one at a time)
+    transact_write_items = client.transact_write_items
+    lock = threading.Lock()
+    applying = threading.Lock()
+    in_flight: set[str] = set()
+    conflicts: list[dict] = []
+
+    def transact(**params):
+        keys = [
+            json.dumps(item["Update"]["Key"], sort_keys=True)
+            if "Update" in item
+            else ""
+            for item in params["TransactItems"]
+        ]
+        with lock:
+            if in_flight.intersection(keys):
+                conflicts.append(params)
+                reasons = [
+                    dict(Code="TransactionConflict" if key in in_flight else "None")
+                    for key in keys
+                ]
+                response = dict(
+                    Error=dict(Code="TransactionCanceledException"),
+                    CancellationReasons=reasons,
+                )
+                raise ClientError(response, "TransactWriteItems")
+            in_flight.update(key for key in keys if key)
+        try:
+            time.sleep(0.01)  # overlap with other requests
+            with applying:
+                return transact_write_items(**params)
+        finally:
+            with lock:
+                in_flight.difference_update(keys)
+
+    with patch.object(client, "transact_write_items", transact):
+        yield conflicts
+
+
 class AllTest(unittest.TestCase):
     client: ClassVar[Any]
     user: ClassVar[User]
@@ -42,14 +103,12 @@ class AllTest(unittest.TestCase):
             aws_secret_access_key=config.aws_secret_access_key,
         )
         ApplicationBase.__client__ = cls.client
-        for model_class in model_classes:
-            model_class.create_table()
+        ensure_tables(model_classes)
         cls.user = User.create("john", "asdfjkl;")
 
     @classmethod
     def tearDownClass(cls) -> None:
-        for model_class in model_classes:
-            model_class.delete_table()
+        delete_tables(model_classes)
 
     def test_video(self):
         # Create video
@@ -81,6 +140,311 @@ class AllTest(unittest.TestCase):
         range_end = 75
         language = "fr"
         practice_entry = PracticeEntry(
-            caption_entry_id, video_id, language, text, range_start, range_end
+            caption_entry_id, video_id, language, text, range_start, range_end, user_id
         )
         practice_entry.put()
+
+    def test_practice_entry_find_by_language(self):
+        practice_entries = [
+            PracticeEntry("c", "v", "de", f"text{i}", 0, 5, "u", created_at=i)
+            for i in range(7)
+        ]
+        for practice_entry in practice_entries:
+            practice_entry.put()
+
+        # Page through all shards
+        res: list[PracticeEntry] = []
+        items, cursor = PracticeEntry.find_by_language("de", limit=3)
+        res += items
+        while cursor is not None:
+            items, cursor = PracticeEntry.find_by_language("de", limit=3, cursor=cursor)
+            res += items
+        assert res == practice_entries[::-1]
+
+    def test_practice_entry_find_by_language_short_pages(self):
+        practice_entries = [
+            PracticeEntry("c", "v", "nl", f"text{i}", 0, 5, "u", created_at=i)
+            for i in range(20)
+        ]
+        PracticeEntry.put_batch(practice_entries)
+        query_page_raw = PracticeEntry.query_page_raw
+
+        def short_page(**params):
+            # As if 1MB limit was reached after 2 items
+            items, last_key = query_page_raw(**params)
+            if len(items) > 2:
+                return items[:2], LANGUAGE_INDEX.start_key(PracticeEntry, items[1])
+            return items, last_key
+
+        res: list[PracticeEntry] = []
+        cursor = None
+        with patch.object(PracticeEntry, "query_page_raw", short_page):
+            while True:
+                items, cursor = PracticeEntry.find_by_language(
+                    "nl", limit=5, cursor=cursor
+                )
+                res += items
+                if cursor is None:
+                    break
+        assert res == practice_entries[::-1]
+
+    def test_practice_entry_find_by_language_context(self):
+        # Shards are queried in threads but within deadline of the request
+        query_page_raw = PracticeEntry.query_page_raw
+        deadlines: list[Optional[float]] = []
+
+        def record_deadline(**params):
+            deadlines.append(current_deadline.get())
+            return query_page_raw(**params)
+
+        deadline = time.monotonic() + 10.0
+        token = current_deadline.set(deadline)
+        try:
+            with patch.object(PracticeEntry, "query_page_raw", record_deadline):
+                PracticeEntry.find_by_language("da")
+        finally:
+            current_deadline.reset(token)
+        assert deadlines == [deadline] * LANGUAGE_INDEX.shards
+
+    def test_backfill_shards(self):
+        practice_entry = PracticeEntry("c", "v", "sv", "text", 0, 5, "u")
+        practice_entry.put()
+        # As if put before the sharded index was added
+        PracticeEntry.request(
+            "update_item",
+            **PracticeEntry.TableName(),
+            Key=boto3_serialize(practice_entry.keys()),
+            UpdateExpression="REMOVE language_shard",
+        )
+        assert PracticeEntry.find_by_language("sv")[0] == []
+
+        assert LANGUAGE_INDEX.backfill(PracticeEntry) == 1
+        assert LANGUAGE_INDEX.backfill(PracticeEntry) == 0
+        assert PracticeEntry.find_by_language("sv")[0] == [practice_entry]
+
+    def test_video_find_public(self):
+        user_id = self.user.id
+        videos = [
+            Video(user_id, f"y{i}", "title", "author", "fr", "en", 1, created_at=i)
+            for i in range(3)
+        ]
+        private_video = Video(user_id, "y", "title", "author", "fr", "en", 0)
+        for video in videos + [private_video]:
+            video.put()
+        res, cursor = Video.find_public(limit=10)
+        assert res == videos[::-1]
+        assert cursor is None
+
+    def test_aggregates(self):
+        video_id = "video-aggregates"
+        practice_entries = [
+            PracticeEntry("c", video_id, language, "text", 0, 4, "u")
+            for language in ["it", "it", "es"]
+        ]
+        for practice_entry in practice_entries:
+            practice_entry.put()
+        assert PracticeEntry.count_by("video_id", video_id) == 3
+        assert PracticeEntry.count_by("language", "it") == 2
+
+        assert practice_entries[0].delete() is True
+        assert practice_entries[0].delete() is False
+        assert PracticeEntry.count_by("video_id", video_id) == 2
+        assert PracticeEntry.count_by("language", "it") == 1
+        assert PracticeEntry.count_by("language", "xx") == 0
+        assert PracticeEntry.count_all_by("language")["es"] == 1
+
+    def test_aggregates_batch(self):
+        video_id = "video-aggregates-batch"
+        practice_entries = [
+            PracticeEntry("c", video_id, "pt", "text", start, start + 1, "u")
+            for start in range(20)
+        ]
+        with conflicting_transactions(self.client) as conflicts:
+            PracticeEntry.put_batch(practice_entries)
+            # Existing items aren't counted
+            PracticeEntry.put_batch(practice_entries[:5])
+        assert conflicts  # concurrent increments of the same counter were resent
+        assert PracticeEntry.count_by("video_id", video_id) == 20
+        # Summed across counter shards
+        assert PracticeEntry.count_by("language", "pt") == 20
+        assert PracticeEntry.count_all_by("language")["pt"] == 20
+
+        with conflicting_transactions(self.client):
+            PracticeEntry.destroy_batch(practice_entries[:5])
+        assert PracticeEntry.count_by("video_id", video_id) == 15
+        assert PracticeEntry.count_by("language", "pt") == 15
+
+    def test_review_queue(self):
+        user_id = "user-review"
+        practice_entries = [
+            PracticeEntry("c", "v", "pt", f"text{i}", 0, 5, user_id, due_at=i)
+            for i in range(5)
+        ]
+        for practice_entry in practice_entries:
+            practice_entry.put()
+
+        with patch.object(DueQueue, "PAGE_SIZE", 2):  # exercise paging
+            assert next_due(user_id, limit=3, now=10) == practice_entries[:3]
+            assert next_due(user_id, limit=10, now=3) == practice_entries[:4]
+
+            # Reviewed entries are rescheduled and saved
+            reviewed = review(user_id, {practice_entries[0].id: 5}, now=10)
+            assert reviewed[0].due_at == 10 + DAY
+            assert PracticeEntry.get(id=practice_entries[0].id) == reviewed[0]
+            assert next_due(user_id, limit=10, now=10) == practice_entries[1:]
+
+            # Entry created after queue was loaded
+            new_entry = PracticeEntry("c", "v", "pt", "new", 0, 3, user_id, due_at=0)
+            new_entry.put()
+            res = next_due(user_id, limit=2, now=10)
+            assert res == [new_entry, practice_entries[1]]
+
+            # Reloaded from index
+            review_queues.queues.clear()
+            assert next_due(user_id, limit=10, now=10 + DAY)[-1] == reviewed[0]
+
+            # Changes by other processes (cf. change feed)
+            other = PracticeEntry.get(id=practice_entries[1].id)
+            assert other is not None
+            other.review(5, now=10)
+            sync_review_queues([Change("MODIFY", other, practice_entries[1], "1")])
+            sync_review_queues([Change("REMOVE", None, new_entry, "2")])
+            res = next_due(user_id, limit=2, now=10)
+            assert res == practice_entries[2:4]
+
+    def test_review_queue_ttl(self):
+        user_id = "user-review-ttl"
+        entry = PracticeEntry("c", "v", "pt", "text", 0, 5, user_id, due_at=0)
+        entry.put()
+        assert next_due(user_id, now=10) == [entry]
+
+        # Written by another process (without change feed)
+        other = PracticeEntry("c", "v", "pt", "other", 0, 5, user_id, due_at=1)
+        self.client.put_item(
+            **PracticeEntry.TableName(), Item=PracticeEntry.serialize(other)
+        )
+        assert next_due(user_id, now=10) == [entry]
+        with patch.object(review_queues, "ttl", 0.0):
+            assert next_due(user_id, now=10) == [entry, other]
+
+    def test_practice_entry_without_user(self):
+        # Created before reviews (no "user_id" nor review state)
+        item = dict(
+            id="entry-legacy",
+            caption_entry_id="c",
+            video_id="v",
+            language="fr",
+            video_id__language="v__fr",
+            text="text",
+            range_start=0,
+            range_end=4,
+            created_at=0,
+        )
+        self.client.put_item(**PracticeEntry.TableName(), Item=boto3_serialize(item))
+        entry = PracticeEntry.get(id="entry-legacy")
+        assert entry is not None
+        assert entry.user_id is None
+        entry.review(5, now=10)
+        entry.update()
+        due = next_due(self.user.id, now=10 + DAY)
+        assert entry.id not in [e.id for e in due]
+
+    def test_search(self):
+        caption_entries = [
+            CaptionEntry("video-search1", "fr", "et demain on déménage !", 0, 5),
+            CaptionEntry("video-search1", "fr", "Demain, on DÉMÉNAGE", 5, 10),
+            CaptionEntry("video-search2", "fr", "demain on démé nage", 0, 5),
+            CaptionEntry("video-search3", "fr", "demain\xa0on déménage", 0, 5),
+        ]
+        CaptionEntry.put_batch(caption_entries[:3])
+        caption_entries[3].put()
+        res = search("fr", "demain on déménage")
+        assert res == [
+            SearchHit("video-search1", 2, sorted(e.id for e in caption_entries[:2])),
+            SearchHit("video-search3", 1, [caption_entries[3].id]),
+        ]
+        with patch("demo.models.caption_posting.POSTINGS_PAGE_SIZE", 1):
+            assert search("fr", "demain on déménage") == res
+
+        caption_entries[3].text = "demain on part"
+        caption_entries[3].update()
+        caption_entries[0].delete()
+        res = search("fr", "demain on déménage")
+        assert res == [SearchHit("video-search1", 1, [caption_entries[1].id])]
+
+        # Updated by UnitOfWork
+        caption_entries[1].text = "demain on reste"
+        UnitOfWork().update(caption_entries[1]).commit()
+        assert search("fr", "demain on déménage") == []
+        assert search("fr", "on reste")[0].caption_entry_ids == [caption_entries[1].id]
+
+    def test_track_timings_invalidated_while_loading(self):
+        timings = TrackTimings()
+
+        def load_invalidated(video_id: str, language: str):
+            timings.invalidate(CaptionTrack.key(video_id, language))  # change feed
+            return CachedTiming(TrackTiming([], [], []), {}, 0.0)
+
+        with patch("demo.models.track_timing.load_timing", load_invalidated):
+            timings.get("v", "fr")
+        assert not timings.tracks and not timings.loading and not timings.generations
+
+        cached = CachedTiming(TrackTiming([], [], []), {}, 0.0)
+        with patch("demo.models.track_timing.load_timing", lambda *_: cached):
+            assert timings.get("v", "fr") is cached
+        assert timings.tracks["v__fr"] is cached
+
+    def test_caption_track(self):
+        entries = [
+            CaptionEntry("video-track", "fr", f"texte {i}", i, i + 1)
+            for i in range(300)
+        ]
+        CaptionTrack.save("video-track", "fr", entries)
+        assert CaptionTrack.load_entries("video-track", "fr") == entries
+
+        CaptionTrack.save("video-track", "fr", entries[:2])
+        assert CaptionTrack.load_entries("video-track", "fr") == entries[:2]
+        # Chunk of previous longer track not yet deleted (e.g. by concurrent save)
+        key = CaptionTrack.key("video-track", "fr")
+        CaptionTrack.put_batch(
+            CaptionTrack(key, i, num_chunks, pack_entries(entries[2 * i : 2 * i + 2]))
+            for i, num_chunks in enumerate([2, 2, 3])
+        )
+        assert CaptionTrack.load_entries("video-track", "fr") == entries[:4]
+        assert CaptionTrack.load_entries("video-track", "en") == []
+
+    @patch("demo.models.caption_track.MAX_CHUNK_BYTES", 500)
+    @patch("demo.models.caption_track.LOAD_RETRY_DELAY", 0.0)
+    def test_caption_track_concurrent_save(self):
+        entries = [
+            CaptionEntry("video-torn", "fr", f"texte {i}", i, i + 1) for i in range(100)
+        ]
+        CaptionTrack.save("video-torn", "fr", entries)
+        key = CaptionTrack.key("video-torn", "fr")
+        first = CaptionTrack.get(video_id__language=key, chunk=0)
+        assert first is not None and first.num_chunks > 2
+
+        # Chunk already replaced by another save whose chunk 0 isn't written yet
+        other = CaptionTrack(key, 1, first.num_chunks, pack_entries([]), "other")
+        other.put(unique=False)
+        with self.assertRaises(RuntimeError):
+            CaptionTrack.load_entries("video-torn", "fr")
+
+        CaptionTrack.save("video-torn", "fr", entries[::-1])
+        assert CaptionTrack.load_entries("video-torn", "fr") == entries[::-1]
+
+    @patch.object(config, "caption_storage", "packed")
+    def test_caption_entry_load_in_tracks(self):
+        entries = [
+            CaptionEntry("video-packed", language, f"text {i}", i, i + 1)
+            for language in ["fr", "en"]
+            for i in range(3)
+        ]
+        CaptionEntry.put_track("video-packed", "fr", entries[:3])
+        CaptionEntry.put_track("video-packed", "en", entries[3:])
+        assert CaptionEntry.get(id=entries[0].id) is None  # no row of its own
+
+        refs = [(e.video_id, e.language, e.id) for e in [entries[4], entries[1]]]
+        refs.append(("video-packed", "fr", "missing"))
+        res = asyncio.run(CaptionEntry.load_in_tracks(refs))
+        assert res == [entries[4], entries[1], None]
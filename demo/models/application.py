@@ -1,9 +1,23 @@
-from dataclasses import asdict, field
+import random
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from datetime import datetime
-from typing import Any, Type, TypeVar, cast
+from typing import Any, Callable, Iterable, Optional, Type, TypeVar
 from uuid import uuid4
 
-from ..model_utils import Base
+from boto3.dynamodb.conditions import Key
+
+from ..config import config, schema
+from ..model_utils import (
+    Base,
+    Param,
+    QueryTemplate,
+    TransactionCanceled,
+    UnitOfWork,
+    boto3_serialize,
+    serializer,
+)
+from ..single_table_utils import ModelLayout, SingleTable, single_table_definition
 
 
 def generate_id() -> str:
@@ -18,13 +32,52 @@ auto_id_field = field(default_factory=generate_id)
 
 auto_created_at_field = field(default_factory=generate_created_at)
 
+AGGREGATE_BATCH_CONCURRENCY = 16
+
 T = TypeVar("T", bound="ApplicationBase")
 
+# Shared table of models with layout (cf. config.table_layout)
+main_table = SingleTable(schema("Main", stream=True, **single_table_definition()))
+
+
+def single_table_layout(
+    model_schema: dict,
+    slots: dict[str, str],
+    collection: Optional[Callable[[Any], tuple[str, str]]] = None,
+) -> Optional[ModelLayout]:
+    # Model's index name -> slot of main_table, None with "per_model" layout
+    if config.table_layout != "single":
+        return None
+    return main_table.layout(model_schema, slots, collection)
+
+
+def video_collection_key(video_id: str) -> str:
+    # Collection of video with its captions and practice entries (cf. VideoPage)
+    return f"Video#{video_id}"
+
+
+@dataclass
+class CountBy:
+    # Number of items per value of "attribute" (which must not change after put)
+    attribute: str
+    # Counter items per value (each write picks one at random and reads sum them),
+    # so that writes of a common value (e.g. language) neither conflict in
+    # transactions nor hit a single partition
+    shards: int = 1
+
+    def shard_suffix(self, shard: int) -> str:
+        # Shard 0 is the unsharded counter
+        return f"#{shard}" if shard else ""
+
 
 class ApplicationBase(Base):
     # Extra attributes (in addition to dataclass fields) to persist in dynamodb
     __extra_attrs__: list[str] = []
 
+    # Counters updated in the same transaction as put/delete (cf. Counter).
+    # "put_batch"/"destroy_batch" of such models also go through transactions
+    __aggregates__: list[CountBy] = []
+
     @classmethod
     def to_dict(cls: Type[T], self: T) -> dict:
         d = asdict(self)
@@ -36,4 +89,156 @@ class ApplicationBase(Base):
     def from_dict(cls: Type[T], d: dict) -> T:
         for attr in cls.__extra_attrs__:
             d.pop(attr, None)
-        return cast(Any, cls)(**d)
+        # Through a variable so that pylint infers the subclass (it takes "cls" of
+        # cast(...) as ApplicationBase, cf. no-member on results of "get")
+        constructor: Any = cls
+        return constructor(**d)
+
+    #
+    # Aggregates
+    #
+
+    @classmethod
+    def aggregate(cls: Type[T], attribute: str) -> CountBy:
+        return next(a for a in cls.__aggregates__ if a.attribute == attribute)
+
+    @classmethod
+    def aggregate_counter_name(cls: Type[T], attribute: str, shard=0) -> str:
+        suffix = cls.aggregate(attribute).shard_suffix(shard)
+        return f"{cls.__name__}.{attribute}{suffix}"
+
+    def aggregate_updates(self: T, delta: int) -> list[dict]:
+        return [
+            dict(
+                Update=Counter.increment_params(
+                    self.aggregate_counter_name(
+                        aggregate.attribute, random.randrange(aggregate.shards)
+                    ),
+                    str(getattr(self, aggregate.attribute)),
+                    delta,
+                )
+            )
+            for aggregate in self.__aggregates__
+        ]
+
+    def transact_items(self: T, action: str, **options) -> list[dict]:
+        if not self.__aggregates__:
+            return super().transact_items(action, **options)
+        if action == "put":
+            assert options.get("unique", True)  # overwriting would count twice
+            return [dict(Put=self.put_params()), *self.aggregate_updates(1)]
+        if action == "delete":
+            return [
+                dict(Delete=self.delete_params(must_exist=True)),
+                *self.aggregate_updates(-1),
+            ]
+        return super().transact_items(action, **options)
+
+    def put(self: T, unique=True):
+        if not self.__aggregates__:
+            return super().put(unique=unique)
+        UnitOfWork().put(self, unique=unique).commit()
+        return None
+
+    def delete(self: T) -> bool:
+        if not self.__aggregates__:
+            return super().delete()
+        try:
+            UnitOfWork().delete(self, must_exist=True).commit()
+        except TransactionCanceled as e:
+            failures = [(f.index, f.code) for f in e.failures]
+            if failures == [(0, "ConditionalCheckFailed")]:
+                return False
+            raise
+        return True
+
+    @classmethod
+    def put_batch(cls: Type[T], items: Iterable[T]):
+        if not cls.__aggregates__:
+            super().put_batch(items)
+            return
+        # One transaction per item (instead of BatchWriteItem) since a transaction
+        # cannot update the same counter twice. Existing items are skipped (i.e.
+        # not overwritten) as they are counted already.
+        with ThreadPoolExecutor(AGGREGATE_BATCH_CONCURRENCY) as executor:
+            list(executor.map(lambda item: item.put_new(), items))
+
+    def put_new(self: T) -> bool:
+        try:
+            UnitOfWork().put(self).commit()
+        except TransactionCanceled as e:
+            failures = [(f.index, f.code) for f in e.failures]
+            if failures == [(0, "ConditionalCheckFailed")]:
+                return False
+            raise
+        return True
+
+    @classmethod
+    def destroy_batch(cls: Type[T], items: Iterable[T]):
+        if not cls.__aggregates__:
+            super().destroy_batch(items)
+            return
+        with ThreadPoolExecutor(AGGREGATE_BATCH_CONCURRENCY) as executor:
+            list(executor.map(lambda item: item.delete(), items))
+
+    @classmethod
+    def count_by(cls: Type[T], attribute: str, value: Any) -> int:
+        shards = range(cls.aggregate(attribute).shards)
+        counters = Counter.get_batch(
+            [
+                dict(
+                    counter_name=cls.aggregate_counter_name(attribute, shard),
+                    group_key=str(value),
+                )
+                for shard in shards
+            ]
+        )
+        return sum(int(counter.count) for counter in counters if counter)
+
+    @classmethod
+    def count_all_by(cls: Type[T], attribute: str) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for shard in range(cls.aggregate(attribute).shards):
+            counters = Counter.query_prepared(
+                FIND_COUNTERS,
+                counter_name=cls.aggregate_counter_name(attribute, shard),
+            )
+            for counter in counters:
+                counts[counter.group_key] = counts.get(counter.group_key, 0) + int(
+                    counter.count
+                )
+        return counts
+
+
+@dataclass
+class Counter(ApplicationBase):
+    __schema__ = schema(
+        "Counter",
+        AttributeDefinitions=[
+            {"AttributeName": "counter_name", "AttributeType": "S"},
+            {"AttributeName": "group_key", "AttributeType": "S"},
+        ],
+        KeySchema=[
+            {"AttributeName": "counter_name", "KeyType": "HASH"},
+            {"AttributeName": "group_key", "KeyType": "RANGE"},
+        ],
+    )
+
+    counter_name: str  # e.g. "PracticeEntry.video_id" ("#<shard>" suffix if sharded)
+    group_key: str  # e.g. Video.id
+    count: int = 0
+
+    @classmethod
+    def increment_params(cls, counter_name: str, group_key: str, delta: int) -> dict:
+        return dict(
+            **cls.TableName(),
+            Key=boto3_serialize(dict(counter_name=counter_name, group_key=group_key)),
+            UpdateExpression="ADD #count :delta",  # "count" is reserved word
+            ExpressionAttributeNames={"#count": "count"},
+            ExpressionAttributeValues={":delta": serializer.serialize(delta)},
+        )
+
+
+FIND_COUNTERS = QueryTemplate(
+    KeyConditionExpression=Key("counter_name").eq(Param("counter_name"))
+)
@@ -1,13 +1,26 @@
+import asyncio
 from dataclasses import dataclass
+from functools import partial
+from typing import Iterable, Optional
 
-from ..config import schema
-from .application import ApplicationBase, auto_id_field
+from boto3.dynamodb.conditions import Key
+
+from ..config import config, schema
+from ..model_utils import Param, QueryTemplate, run_in_executor
+from .application import (
+    ApplicationBase,
+    auto_id_field,
+    single_table_layout,
+    video_collection_key,
+)
+from .caption_posting import CaptionPosting
 
 
 @dataclass
 class CaptionEntry(ApplicationBase):
     __schema__ = schema(
         "CaptionEntry",
+        stream=True,
         AttributeDefinitions=[
             {"AttributeName": "id", "AttributeType": "S"},
             {"AttributeName": "video_id__language", "AttributeType": "S"},
@@ -30,6 +43,14 @@ class CaptionEntry(ApplicationBase):
             },
         ],
     )
+    __layout__ = single_table_layout(
+        __schema__,
+        {"CaptionEntry.video_id__language-": "GSI1"},
+        collection=lambda entry: (
+            video_collection_key(entry.video_id),
+            f"CaptionEntry#{entry.language}#{entry.timestamp_start:010}#{entry.id}",
+        ),
+    )
     __extra_attrs__ = ["video_id__language"]
 
     video_id: str  # Video.id
@@ -39,6 +60,101 @@ class CaptionEntry(ApplicationBase):
     timestamp_end: int
     id: str = auto_id_field
 
+    def __post_init__(self) -> None:
+        # Stored version read before write by UnitOfWork (cf. after_commit)
+        self.previous: Optional[CaptionEntry] = None
+
     @property
     def video_id__language(self) -> str:
         return "__".join([self.video_id, self.language])
+
+    #
+    # Whole track (stored as rows or packed in CaptionTrack cf. config.caption_storage)
+    #
+
+    @classmethod
+    def find_by_video(cls, video_id: str, language: str) -> list["CaptionEntry"]:
+        if config.caption_storage == "packed":
+            from .caption_track import CaptionTrack
+
+            return CaptionTrack.load_entries(video_id, language)
+
+        res = cls.query_prepared(
+            FIND_BY_VIDEO_ID__LANGUAGE,
+            video_id__language="__".join([video_id, language]),
+        )
+        return sorted(res, key=lambda entry: entry.timestamp_start)
+
+    @classmethod
+    async def load_in_tracks(
+        cls, refs: list[tuple[str, str, str]]
+    ) -> list[Optional["CaptionEntry"]]:
+        # Entries by (video_id, language, id). Packed entries have no item of their
+        # own (i.e. "get" by id finds nothing), so read each of their tracks once.
+        if config.caption_storage != "packed":
+            return await asyncio.gather(*[cls.load_batched(id=id) for *_, id in refs])
+
+        tracks = list({(video_id, language) for video_id, language, _ in refs})
+        loaded = await asyncio.gather(
+            *[run_in_executor(partial(cls.find_by_video, *track)) for track in tracks]
+        )
+        entries = {entry.id: entry for track in loaded for entry in track}
+        return [entries.get(id) for *_, id in refs]
+
+    @classmethod
+    def put_track(cls, video_id: str, language: str, entries: list["CaptionEntry"]):
+        if config.caption_storage == "packed":
+            from .caption_track import CaptionTrack
+
+            CaptionTrack.save(video_id, language, entries)
+            CaptionPosting.index_many(entries)
+            return
+
+        cls.put_batch(entries)
+
+    #
+    # Keep CaptionPosting (search index) in sync
+    #
+
+    def put(self, unique=True):
+        old = None if unique else CaptionEntry.get(id=self.id)
+        super().put(unique=unique)
+        CaptionPosting.index(self, old)
+
+    def update(self):
+        old = CaptionEntry.get(id=self.id)
+        super().update()
+        CaptionPosting.index(self, old)
+
+    def delete(self) -> bool:
+        deleted = super().delete()
+        if deleted:
+            CaptionPosting.index(None, self)
+        return deleted
+
+    def transact_items(self, action: str, **options) -> list[dict]:
+        # TransactWriteItems cannot return old item, so read it beforehand to
+        # remove its terms after commit
+        if action == "update" or (action == "put" and not options.get("unique", True)):
+            self.previous = CaptionEntry.get(id=self.id)
+        return super().transact_items(action, **options)
+
+    def after_commit(self, action: str):
+        # Written by UnitOfWork
+        if action in ["put", "update"]:
+            CaptionPosting.index(self, self.previous)
+            self.previous = None
+        if action == "delete":
+            CaptionPosting.index(None, self)
+
+    @classmethod
+    def put_batch(cls, items: Iterable["CaptionEntry"]):
+        items = list(items)
+        super().put_batch(items)
+        CaptionPosting.index_many(items)
+
+
+FIND_BY_VIDEO_ID__LANGUAGE = QueryTemplate(
+    IndexName="CaptionEntry.video_id__language-",
+    KeyConditionExpression=Key("video_id__language").eq(Param("video_id__language")),
+)
@@ -0,0 +1,159 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from boto3.dynamodb.conditions import Key
+
+from ..config import schema
+from ..model_utils import Param, QueryTemplate
+from ..search_utils import count_phrase, token_positions, tokenize
+from .application import ApplicationBase
+
+if TYPE_CHECKING:  # CaptionEntry maintains postings (cf. CaptionEntry.put)
+    from .caption_entry import CaptionEntry
+
+executor = ThreadPoolExecutor(16)
+
+
+@dataclass
+class CaptionPosting(ApplicationBase):
+    # Inverted index of CaptionEntry.text i.e. one item per (term, caption entry)
+    __schema__ = schema(
+        "CaptionPosting",
+        AttributeDefinitions=[
+            {"AttributeName": "term", "AttributeType": "S"},
+            {"AttributeName": "caption_entry_id", "AttributeType": "S"},
+        ],
+        KeySchema=[
+            {"AttributeName": "term", "KeyType": "HASH"},
+            {"AttributeName": "caption_entry_id", "KeyType": "RANGE"},
+        ],
+    )
+
+    term: str  # "<language>#<token>"
+    caption_entry_id: str  # CaptionEntry.id
+    video_id: str  # Video.id
+    positions: list[int]  # token positions within CaptionEntry.text
+
+    @classmethod
+    def from_caption_entry(
+        cls, caption_entry: "CaptionEntry"
+    ) -> list["CaptionPosting"]:
+        tokens = tokenize(caption_entry.text, caption_entry.language)
+        return [
+            CaptionPosting(
+                term_key(caption_entry.language, token),
+                caption_entry.id,
+                caption_entry.video_id,
+                positions,
+            )
+            for token, positions in token_positions(tokens).items()
+        ]
+
+    @classmethod
+    def index_many(cls, caption_entries: list["CaptionEntry"]):
+        cls.put_batch(
+            [p for entry in caption_entries for p in cls.from_caption_entry(entry)]
+        )
+
+    @classmethod
+    def index(cls, new: Optional["CaptionEntry"], old: Optional["CaptionEntry"] = None):
+        # Incrementally update postings for caption entry write
+        new_postings = cls.from_caption_entry(new) if new else []
+        old_postings = cls.from_caption_entry(old) if old else []
+        new_terms = {posting.term for posting in new_postings}
+        cls.destroy_batch([p for p in old_postings if p.term not in new_terms])
+        cls.put_batch(new_postings)
+
+    @classmethod
+    def find_by_term(cls, term: str) -> list["CaptionPosting"]:
+        return cls.query_prepared(FIND_BY_TERM, term=term)
+
+    @classmethod
+    def find_page_by_term(
+        cls, term: str, limit: int, cursor=None
+    ) -> tuple[list["CaptionPosting"], Optional[dict]]:
+        params = FIND_BY_TERM.bind(term=term)
+        if cursor is not None:
+            params.update(ExclusiveStartKey=cursor)
+        return cls.query_page_raw(**params, Limit=limit)
+
+
+FIND_BY_TERM = QueryTemplate(KeyConditionExpression=Key("term").eq(Param("term")))
+
+
+def term_key(language: str, token: str) -> str:
+    return f"{language}#{token}"
+
+
+@dataclass
+class SearchHit:
+    video_id: str
+    hits: int
+    caption_entry_ids: list[str]
+
+
+def search(language: str, phrase: str, limit=20) -> list[SearchHit]:
+    # Videos containing phrase within single caption entry ranked by number of hits
+    tokens = tokenize(phrase, language)
+    if not tokens:
+        return []
+
+    # Caption entries of the rarest term are looked up in the other terms' postings
+    # by key (intersecting as it goes), so cost is bound by the rarest term
+    rarest, postings = find_rarest_postings(language, sorted(set(tokens)))
+    candidates = sorted(postings[rarest])
+    for token, token_postings in postings.items():
+        if token == rarest:
+            continue
+        term = term_key(language, token)
+        missing = [id for id in candidates if id not in token_postings]
+        found = CaptionPosting.get_batch(
+            [dict(term=term, caption_entry_id=id) for id in missing]
+        )
+        for posting in found:
+            if posting is not None:
+                token_postings[posting.caption_entry_id] = posting
+        candidates = [id for id in candidates if id in token_postings]
+
+    # Check positions for phrase and group by video
+    videos: dict[str, SearchHit] = {}
+    for caption_entry_id in candidates:
+        positions = [
+            set(map(int, postings[token][caption_entry_id].positions))
+            for token in tokens
+        ]
+        if hits := count_phrase(positions):
+            video_id = postings[tokens[0]][caption_entry_id].video_id
+            hit = videos.setdefault(video_id, SearchHit(video_id, 0, []))
+            hit.hits += hits
+            hit.caption_entry_ids.append(caption_entry_id)
+
+    return sorted(videos.values(), key=lambda hit: -hit.hits)[:limit]
+
+
+POSTINGS_PAGE_SIZE = 100
+
+
+def find_rarest_postings(
+    language: str, tokens: list[str]
+) -> tuple[str, dict[str, dict[str, CaptionPosting]]]:
+    # Page posting lists of all terms (each in its own partition, in parallel) in
+    # lockstep until one of them is complete i.e. read at most a page more than the
+    # rarest term for each term. Other terms' postings are partial.
+    postings: dict[str, dict[str, CaptionPosting]] = {token: {} for token in tokens}
+    cursors: dict[str, Optional[dict]] = {}
+    while True:
+        pages = executor.map(
+            lambda token: CaptionPosting.find_page_by_term(
+                term_key(language, token), POSTINGS_PAGE_SIZE, cursors.get(token)
+            ),
+            tokens,
+        )
+        for token, (page, cursor) in zip(tokens, list(pages)):
+            postings[token].update((p.caption_entry_id, p) for p in page)
+            cursors[token] = cursor
+        complete = [token for token in tokens if cursors[token] is None]
+        if complete:
+            rarest = min(complete, key=lambda token: len(postings[token]))
+            return rarest, postings
@@ -0,0 +1,154 @@
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Type, TypeVar
+from uuid import uuid4
+
+from boto3.dynamodb.conditions import Key
+
+from ..config import schema
+from ..model_utils import Param, QueryTemplate
+from .application import ApplicationBase
+from .caption_entry import CaptionEntry
+
+T = TypeVar("T", bound="CaptionTrack")
+
+MAX_CHUNK_BYTES = 350_000  # below 400KB item size limit with some margin
+# Reading again a track being saved (cf. CaptionTrack.load_entries)
+LOAD_MAX_ATTEMPTS = 5
+LOAD_RETRY_DELAY = 0.05
+
+
+@dataclass
+class CaptionTrack(ApplicationBase):
+    # Whole (video_id, language) track packed in a single item (or a few chunks)
+    __schema__ = schema(
+        "CaptionTrack",
+        stream=True,
+        AttributeDefinitions=[
+            {"AttributeName": "video_id__language", "AttributeType": "S"},
+            {"AttributeName": "chunk", "AttributeType": "N"},
+        ],
+        KeySchema=[
+            {"AttributeName": "video_id__language", "KeyType": "HASH"},
+            {"AttributeName": "chunk", "KeyType": "RANGE"},
+        ],
+    )
+
+    video_id__language: str
+    chunk: int
+    num_chunks: int
+    data: bytes  # cf. pack_entries
+    # Chunks written by the same save (empty for tracks saved before it was added)
+    generation: str = ""
+
+    @classmethod
+    def from_dict(cls: Type[T], d: dict) -> T:
+        d["data"] = d["data"].value  # boto3's Binary
+        d["chunk"] = int(d["chunk"])
+        d["num_chunks"] = int(d["num_chunks"])
+        return super().from_dict(d)
+
+    @classmethod
+    def key(cls, video_id: str, language: str) -> str:
+        return "__".join([video_id, language])
+
+    @classmethod
+    def save(cls, video_id: str, language: str, entries: list[CaptionEntry]):
+        # Chunk 0 is written last, so readers see either the previous track or this
+        # one as a whole (other chunks are told apart by generation)
+        key = cls.key(video_id, language)
+        chunks = pack_chunks(entries)
+        generation = uuid4().hex
+        tracks = [
+            CaptionTrack(key, i, len(chunks), data, generation)
+            for i, data in enumerate(chunks)
+        ]
+        old = cls.get(video_id__language=key, chunk=0)
+        cls.put_batch(tracks[1:])
+        tracks[0].put(unique=False)
+        if old is not None:
+            stale = range(len(chunks), old.num_chunks)
+            cls.destroy_batch(CaptionTrack(key, i, 0, b"") for i in stale)
+
+    @classmethod
+    def load_entries(cls, video_id: str, language: str) -> list[CaptionEntry]:
+        key = cls.key(video_id, language)
+        for attempt in range(LOAD_MAX_ATTEMPTS):
+            first = cls.get(video_id__language=key, chunk=0)
+            if first is None:
+                return []
+            tracks = [first]
+            if first.num_chunks > 1:
+                rest = cls.query_prepared(FIND_REST_CHUNKS, video_id__language=key)
+                # Skip stale chunks of a longer track (deleted after new chunks are
+                # put) and chunks already replaced by a concurrent save
+                tracks += [
+                    track
+                    for track in rest
+                    if track.chunk < first.num_chunks
+                    and track.generation == first.generation
+                ]
+            if len(tracks) == first.num_chunks:
+                return [
+                    entry
+                    for track in tracks
+                    for entry in unpack_entries(track.data, video_id, language)
+                ]
+            time.sleep(LOAD_RETRY_DELAY * (attempt + 1))
+        raise RuntimeError(f"caption track {key} is being saved")
+
+
+FIND_REST_CHUNKS = QueryTemplate(
+    KeyConditionExpression=Key("video_id__language").eq(Param("video_id__language"))
+    & Key("chunk").gt(0)
+)
+
+
+#
+# Columnar binary format (before compression)
+#   <count: uint32> <timestamp_start: uint32 * count> <timestamp_end: uint32 * count>
+#   <ids and texts: utf-8 joined by "\0">
+#
+
+
+def pack_entries(entries: list[CaptionEntry]) -> bytes:
+    n = len(entries)
+    strings = [entry.id for entry in entries] + [entry.text for entry in entries]
+    raw = b"".join(
+        [
+            struct.pack("<I", n),
+            struct.pack(f"<{n}I", *[int(entry.timestamp_start) for entry in entries]),
+            struct.pack(f"<{n}I", *[int(entry.timestamp_end) for entry in entries]),
+            "\0".join(strings).encode("utf-8"),
+        ]
+    )
+    return zlib.compress(raw)
+
+
+def unpack_entries(data: bytes, video_id: str, language: str) -> list[CaptionEntry]:
+    raw = zlib.decompress(data)
+    (n,) = struct.unpack_from("<I", raw)
+    starts = struct.unpack_from(f"<{n}I", raw, 4)
+    ends = struct.unpack_from(f"<{n}I", raw, 4 + 4 * n)
+    strings = raw[4 + 8 * n :].decode("utf-8").split("\0") if n else []
+    ids, texts = strings[:n], strings[n:]
+    return [
+        CaptionEntry(video_id, language, texts[i], starts[i], ends[i], id=ids[i])
+        for i in range(n)
+    ]
+
+
+def pack_chunks(entries: list[CaptionEntry]) -> list[bytes]:
+    # Split entries evenly into as few chunks as fitting in MAX_CHUNK_BYTES
+    num_chunks = 1
+    while True:
+        size = -(-len(entries) // num_chunks) or 1
+        chunks = [
+            pack_entries(entries[i : i + size])
+            for i in range(0, max(len(entries), 1), size)
+        ]
+        if all(len(chunk) <= MAX_CHUNK_BYTES for chunk in chunks) or size == 1:
+            return chunks
+        num_chunks *= 2
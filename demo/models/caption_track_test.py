@@ -0,0 +1,31 @@
+import unittest
+from unittest.mock import patch
+
+from .caption_entry import CaptionEntry
+from .caption_track import pack_chunks, pack_entries, unpack_entries
+
+
+def make_entries(n: int) -> list[CaptionEntry]:
+    return [
+        CaptionEntry("video", "fr", f"déménager {i}\xa0!", i, i + 2) for i in range(n)
+    ]
+
+
+class CaptionTrackTest(unittest.TestCase):
+    def test_pack_and_unpack(self):
+        entries = make_entries(100)
+        data = pack_entries(entries)
+        assert unpack_entries(data, "video", "fr") == entries
+
+    def test_pack_empty(self):
+        assert unpack_entries(pack_entries([]), "video", "fr") == []
+        assert len(pack_chunks([])) == 1
+
+    def test_pack_chunks(self):
+        entries = make_entries(1000)
+        with patch("demo.models.caption_track.MAX_CHUNK_BYTES", 2000):
+            chunks = pack_chunks(entries)
+        assert len(chunks) > 1
+        assert all(len(chunk) <= 2000 for chunk in chunks)
+        res = [e for chunk in chunks for e in unpack_entries(chunk, "video", "fr")]
+        assert res == entries
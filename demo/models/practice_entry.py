@@ -1,21 +1,42 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
+
+from boto3.dynamodb.conditions import Key
 
 from ..config import schema
-from .application import ApplicationBase, auto_created_at_field, auto_id_field
+from ..model_utils import Param, QueryTemplate
+from ..review_utils import DEFAULT_EASE, ReviewState, schedule
+from ..sharding_utils import Cursor, ShardedIndex
+from .application import (
+    ApplicationBase,
+    CountBy,
+    auto_created_at_field,
+    auto_id_field,
+    generate_created_at,
+    single_table_layout,
+    video_collection_key,
+)
+
+LANGUAGE_INDEX = ShardedIndex(
+    "PracticeEntry.language_shard-created_at", "language_shard", "created_at", 8
+)
 
 
 @dataclass
 class PracticeEntry(ApplicationBase):
     __schema__ = schema(
         "PracticeEntry",
+        stream=True,
         AttributeDefinitions=[
             {"AttributeName": "id", "AttributeType": "S"},
             {
                 "AttributeName": "video_id__language",
                 "AttributeType": "S",
             },
-            {"AttributeName": "language", "AttributeType": "S"},
+            {"AttributeName": "language_shard", "AttributeType": "S"},
             {"AttributeName": "created_at", "AttributeType": "N"},
+            {"AttributeName": "user_id", "AttributeType": "S"},
+            {"AttributeName": "due_at", "AttributeType": "N"},
         ],
         KeySchema=[
             {"AttributeName": "id", "KeyType": "HASH"},
@@ -34,10 +55,10 @@ class PracticeEntry(ApplicationBase):
                 },
             },
             {
-                "IndexName": "PracticeEntry.language-created_at",
+                "IndexName": "PracticeEntry.language_shard-created_at",
                 "KeySchema": [
                     {
-                        "AttributeName": "language",
+                        "AttributeName": "language_shard",
                         "KeyType": "HASH",
                     },
                     {
@@ -49,9 +70,38 @@ class PracticeEntry(ApplicationBase):
                     "ProjectionType": "ALL",
                 },
             },
+            {
+                "IndexName": "PracticeEntry.user_id-due_at",
+                "KeySchema": [
+                    {
+                        "AttributeName": "user_id",
+                        "KeyType": "HASH",
+                    },
+                    {
+                        "AttributeName": "due_at",
+                        "KeyType": "RANGE",
+                    },
+                ],
+                "Projection": {
+                    "ProjectionType": "ALL",
+                },
+            },
         ],
     )
-    __extra_attrs__ = ["video_id__language"]
+    __layout__ = single_table_layout(
+        __schema__,
+        {
+            "PracticeEntry.language_shard-created_at": "GSI1",
+            "PracticeEntry.user_id-due_at": "GSI2",
+            "PracticeEntry.video_id__language": "GSI3",
+        },
+        collection=lambda entry: (
+            video_collection_key(entry.video_id),
+            f"PracticeEntry#{entry.user_id}#{entry.id}",
+        ),
+    )
+    __extra_attrs__ = ["video_id__language", "language_shard"]
+    __aggregates__ = [CountBy("video_id"), CountBy("language", shards=8)]
 
     caption_entry_id: str  # CaptionEntry.id
     video_id: str  # Video.id
@@ -59,9 +109,68 @@ class PracticeEntry(ApplicationBase):
     text: str  # copy of CaptionEntry.text within the selected range
     range_start: int  # offset within CaptionEntry.text
     range_end: int
+    # User.id (None for entries created before reviews, which are not in any
+    # user's "user_id-due_at" index)
+    user_id: Optional[str] = None
     created_at: int = auto_created_at_field
     id: str = auto_id_field
 
+    # Review state (cf. review_utils.schedule), due as soon as created
+    due_at: int = field(default_factory=generate_created_at)
+    interval: int = 0  # in second
+    ease: int = DEFAULT_EASE  # in permille
+    repetitions: int = 0
+
+    @classmethod
+    def to_dict(cls, self: "PracticeEntry") -> dict:
+        d = super().to_dict(self)
+        if d["user_id"] is None:
+            del d["user_id"]  # index key cannot be null
+        return d
+
     @property
     def video_id__language(self) -> str:
         return "__".join([self.video_id, self.language])
+
+    @property
+    def language_shard(self) -> str:
+        return LANGUAGE_INDEX.shard_key(self.language, self.id)
+
+    @property
+    def review_state(self) -> ReviewState:
+        return ReviewState(self.due_at, self.interval, self.ease, self.repetitions)
+
+    def review(self, grade: int, now: int):
+        state = schedule(self.review_state, grade, now)
+        self.due_at, self.interval = state.due_at, state.interval
+        self.ease, self.repetitions = state.ease, state.repetitions
+
+    def after_commit(self, action: str):
+        from .review_queue import review_queues
+
+        if action == "put":
+            review_queues.add(self)
+
+    @classmethod
+    def find_due_page(
+        cls, user_id: str, due_from: int, due_until: int, limit: int, cursor=None
+    ) -> tuple[list["PracticeEntry"], Optional[dict]]:
+        # Bounded range of "user_id-due_at" index (oldest due first)
+        params = FIND_DUE.bind(user_id=user_id, due_from=due_from, due_until=due_until)
+        if cursor is not None:
+            params.update(ExclusiveStartKey=cursor)
+        return cls.query_page_raw(**params, Limit=limit)
+
+    @classmethod
+    def find_by_language(
+        cls, language: str, limit=20, cursor: Optional[Cursor] = None
+    ) -> tuple[list["PracticeEntry"], Optional[Cursor]]:
+        # Newest first
+        return LANGUAGE_INDEX.query(cls, language, limit=limit, cursor=cursor)
+
+
+FIND_DUE = QueryTemplate(
+    IndexName="PracticeEntry.user_id-due_at",
+    KeyConditionExpression=Key("user_id").eq(Param("user_id"))
+    & Key("due_at").between(Param("due_from"), Param("due_until")),
+)
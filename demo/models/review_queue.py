@@ -0,0 +1,174 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from ..model_utils import UnitOfWork
+from ..stream_utils import Change, change_feed
+from .practice_entry import PracticeEntry
+
+#
+# "Next N due" practice entries per user without loading the whole history: entries
+# are loaded oldest due first by bounded range queries on "user_id-due_at" index
+# into a heap, which absorbs reviews of the session until the queue is dropped
+#
+
+
+class DueQueue:
+    PAGE_SIZE = 100
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.created_at = self.used_at = time.monotonic()
+        self.lock = threading.Lock()  # same user may send concurrent requests
+        self.entries, self.heap, self.loaded_until, self.cursor = self.unloaded()
+
+    def reset(self):
+        self.entries, self.heap, self.loaded_until, self.cursor = self.unloaded()
+
+    @staticmethod
+    def unloaded() -> tuple[
+        dict[str, PracticeEntry], list[tuple[int, str]], int, Optional[dict]
+    ]:
+        # Nothing loaded i.e.
+        # - entries by id
+        # - heap of (due_at, id) (stale when reviewed)
+        # - loaded_until: every entry due until then is in entries
+        # - cursor: within (loaded_until, now]
+        return {}, [], -1, None
+
+    def push(self, entry: PracticeEntry):
+        self.entries[entry.id] = entry
+        heapq.heappush(self.heap, (entry.due_at, entry.id))
+
+    def next_due(self, limit: int, now: int) -> list[PracticeEntry]:
+        with self.lock:
+            while self.loaded_until < now and len(self.peek(limit, now)) < limit:
+                self.load_page(now)
+            return self.peek(limit, now)
+
+    def load_page(self, now: int):
+        entries, self.cursor = PracticeEntry.find_due_page(
+            self.user_id, self.loaded_until + 1, now, self.PAGE_SIZE, self.cursor
+        )
+        for entry in entries:
+            if entry.id not in self.entries:  # keep reviewed state
+                self.push(entry)
+        if self.cursor is None:
+            self.loaded_until = now
+
+    def peek(self, limit: int, now: int) -> list[PracticeEntry]:
+        # Pop up to "limit" due items (dropping stale ones) and push them back
+        due: dict[str, PracticeEntry] = {}
+        kept = []
+        while self.heap and len(due) < limit and self.heap[0][0] <= now:
+            due_at, entry_id = heapq.heappop(self.heap)
+            entry = self.entries.get(entry_id)  # None if deleted
+            if entry and entry.due_at == due_at and entry_id not in due:
+                due[entry_id] = entry
+                kept.append((due_at, entry_id))
+        for item in kept:
+            heapq.heappush(self.heap, item)
+        return list(due.values())
+
+    def review(self, grades: dict[str, int], now: int) -> list[PracticeEntry]:
+        with self.lock:
+            return self.review_locked(grades, now)
+
+    def review_locked(self, grades: dict[str, int], now: int) -> list[PracticeEntry]:
+        # Apply grades of a review session and save all entries in batch
+        missing = [entry_id for entry_id in grades if entry_id not in self.entries]
+        for entry in PracticeEntry.get_batch([dict(id=id) for id in missing]):
+            if entry is not None and entry.user_id == self.user_id:
+                self.push(entry)
+
+        reviewed = []
+        unit_of_work = UnitOfWork()
+        for entry_id, grade in grades.items():
+            if entry := self.entries.get(entry_id):
+                entry.review(grade, now)
+                heapq.heappush(self.heap, (entry.due_at, entry.id))
+                unit_of_work.update(entry)
+                reviewed.append(entry)
+        if reviewed:
+            # Not atomic i.e. independent updates packed in a few transactions
+            try:
+                unit_of_work.commit(atomic=False)
+            except Exception:
+                self.reset()  # reload saved state on next call
+                raise
+        return reviewed
+
+
+class ReviewQueues:
+    # Queues of recently active users (LRU, dropped after "max_idle" in second).
+    # Entries created or reviewed by other processes show up only through change
+    # feed, thus without it queues are reloaded after "ttl" (cf. create_app)
+    def __init__(self, max_users=1000, max_idle=15 * 60.0, ttl: Optional[float] = None):
+        self.max_users = max_users
+        self.max_idle = max_idle
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.queues: OrderedDict[str, DueQueue] = OrderedDict()
+
+    def expired(self, queue: DueQueue, now: float) -> bool:
+        if self.ttl is not None and now - queue.created_at >= self.ttl:
+            return True
+        return now - queue.used_at >= self.max_idle
+
+    def get(self, user_id: str) -> DueQueue:
+        with self.lock:
+            now = time.monotonic()
+            queue = self.queues.get(user_id)
+            if queue is None or self.expired(queue, now):
+                queue = DueQueue(user_id)
+            queue.used_at = now
+            self.queues[user_id] = queue
+            self.queues.move_to_end(user_id)
+            while len(self.queues) > self.max_users:
+                self.queues.popitem(last=False)
+            return queue
+
+    def find(self, user_id: Optional[str]) -> Optional[DueQueue]:
+        # Loaded queue if any (without loading it)
+        if user_id is None:
+            return None
+        with self.lock:
+            return self.queues.get(user_id)
+
+    def add(self, entry: PracticeEntry):
+        # Entry created after its user's queue was loaded (cf. PracticeEntry.put)
+        if queue := self.find(entry.user_id):
+            with queue.lock:
+                queue.push(entry)
+
+    def remove(self, entry: PracticeEntry):
+        if queue := self.find(entry.user_id):
+            with queue.lock:
+                queue.entries.pop(entry.id, None)
+
+
+review_queues = ReviewQueues()
+
+
+@change_feed.register(PracticeEntry)
+def sync_review_queues(changes: list[Change]):
+    # Entries created, reviewed or deleted by any process
+    for change in changes:
+        if change.new is not None:
+            review_queues.add(change.new)
+        elif change.old is not None:
+            review_queues.remove(change.old)
+
+
+def next_due(user_id: str, limit=20, now: Optional[int] = None) -> list[PracticeEntry]:
+    queue = review_queues.get(user_id)
+    return queue.next_due(limit, int(time.time()) if now is None else now)
+
+
+def review(
+    user_id: str, grades: dict[str, int], now: Optional[int] = None
+) -> list[PracticeEntry]:
+    queue = review_queues.get(user_id)
+    return queue.review(grades, int(time.time()) if now is None else now)
@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from ..config import schema
+from .application import ApplicationBase
+
+
+@dataclass
+class StreamCheckpoint(ApplicationBase):
+    # Last handled position of change feed consumer (cf. stream_utils.ChangeFeed)
+    __schema__ = schema(
+        "StreamCheckpoint",
+        AttributeDefinitions=[
+            {"AttributeName": "consumer", "AttributeType": "S"},
+            {"AttributeName": "shard", "AttributeType": "S"},
+        ],
+        KeySchema=[
+            {"AttributeName": "consumer", "KeyType": "HASH"},
+            {"AttributeName": "shard", "KeyType": "RANGE"},
+        ],
+    )
+
+    consumer: str
+    shard: str  # "<stream arn>#<shard id>"
+    sequence_number: str
+
+    @classmethod
+    def find_sequence_number(cls, consumer: str, shard: str) -> Optional[str]:
+        checkpoint = cls.get(consumer=consumer, shard=shard)
+        return checkpoint.sequence_number if checkpoint else None
+
+    @classmethod
+    def save(cls, consumer: str, shard: str, sequence_number: str):
+        cls(consumer, shard, sequence_number).put(unique=False)
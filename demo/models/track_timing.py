@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from ..stream_utils import Change, change_feed
+from ..timing_utils import TrackTiming
+from .caption_entry import CaptionEntry
+from .caption_track import CaptionTrack
+from .practice_entry import PracticeEntry
+
+#
+# Time span (in second) of practice entries within their video, estimated from
+# their character range (cf. timing_utils) with timings cached per caption track
+#
+
+
+@dataclass
+class CachedTiming:
+    timing: TrackTiming
+    captions: dict[str, int]  # CaptionEntry.id -> index in track
+    loaded_at: float  # monotonic
+
+
+class TrackTimings:
+    # Recently used tracks (LRU, dropped after "max_age" in second unless
+    # invalidated by change feed)
+    def __init__(self, max_tracks=1000, max_age=15 * 60.0):
+        self.max_tracks = max_tracks
+        self.max_age = max_age
+        self.lock = threading.Lock()  # invalidated from change feed thread
+        self.tracks: OrderedDict[str, CachedTiming] = OrderedDict()
+        # Invalidations of tracks being loaded (number of loads in flight by key),
+        # so that timing loaded before a change isn't cached after its invalidation
+        self.loading: dict[str, int] = {}
+        self.generations: dict[str, int] = {}
+
+    def get(self, video_id: str, language: str) -> CachedTiming:
+        key = "__".join([video_id, language])
+        with self.lock:
+            cached = self.tracks.get(key)
+            if (
+                cached is not None
+                and time.monotonic() - cached.loaded_at <= self.max_age
+            ):
+                self.tracks.move_to_end(key)
+                return cached
+            self.loading[key] = self.loading.get(key, 0) + 1
+            generation = self.generations.get(key, 0)
+
+        try:
+            cached = load_timing(video_id, language)
+        finally:
+            with self.lock:
+                stale = self.generations.get(key, 0) != generation
+                self.loading[key] -= 1
+                if self.loading[key] == 0:
+                    del self.loading[key]
+                    self.generations.pop(key, None)
+        if stale:
+            return cached  # served once but not cached
+        with self.lock:
+            self.tracks[key] = cached
+            self.tracks.move_to_end(key)
+            while len(self.tracks) > self.max_tracks:
+                self.tracks.popitem(last=False)
+        return cached
+
+    def invalidate(self, video_id__language: str):
+        with self.lock:
+            self.tracks.pop(video_id__language, None)
+            if video_id__language in self.loading:
+                generation = self.generations.get(video_id__language, 0) + 1
+                self.generations[video_id__language] = generation
+
+
+def load_timing(video_id: str, language: str) -> CachedTiming:
+    entries = CaptionEntry.find_by_video(video_id, language)
+    timing = TrackTiming(
+        [entry.text for entry in entries],
+        [entry.timestamp_start for entry in entries],
+        [entry.timestamp_end for entry in entries],
+    )
+    captions = {entry.id: i for i, entry in enumerate(entries)}
+    return CachedTiming(timing, captions, time.monotonic())
+
+
+track_timings = TrackTimings()
+
+
+def time_spans(entries: list[PracticeEntry]) -> list[Optional[tuple[float, float]]]:
+    # In the same order as entries (None if caption entry is gone), mapped in one
+    # batch per track
+    spans: list[Optional[tuple[float, float]]] = [None] * len(entries)
+    groups: dict[tuple[str, str], list[int]] = {}
+    for i, entry in enumerate(entries):
+        groups.setdefault((entry.video_id, entry.language), []).append(i)
+
+    for (video_id, language), indices in groups.items():
+        cached = track_timings.get(video_id, language)
+        found = [i for i in indices if entries[i].caption_entry_id in cached.captions]
+        if not found:
+            continue
+        captions = [cached.captions[entries[i].caption_entry_id] for i in found]
+        range_starts = np.array([entries[i].range_start for i in found])
+        range_ends = np.array([entries[i].range_end for i in found])
+        starts, ends = cached.timing.map_ranges(captions, range_starts, range_ends)
+        for i, start, end in zip(found, starts.tolist(), ends.tolist()):
+            spans[i] = (start, end)
+    return spans
+
+
+@change_feed.register(CaptionEntry)
+def invalidate_caption_entries(changes: list[Change]):
+    for change in changes:
+        track_timings.invalidate(change.item.video_id__language)
+
+
+@change_feed.register(CaptionTrack)
+def invalidate_caption_tracks(changes: list[Change]):
+    for change in changes:
+        track_timings.invalidate(change.item.video_id__language)
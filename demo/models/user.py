@@ -1,5 +1,10 @@
 import base64
 import hashlib
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from dataclasses import dataclass
 from typing import Optional
@@ -11,8 +16,11 @@ from more_itertools import first
 from pydantic import BaseModel, Field, ValidationError
 
 from ..config import config, env, schema
+from ..model_utils import Param, QueryTemplate, UnitOfWork, boto3_serialize
 from .application import ApplicationBase, auto_created_at_field, auto_id_field
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class User(ApplicationBase):
@@ -40,6 +48,7 @@ class User(ApplicationBase):
             },
         ],
     )
+    __json_exclude__ = ["password_digest"]
 
     username: str
     password_digest: str
@@ -56,13 +65,7 @@ class User(ApplicationBase):
         assert unique
         if self.find_by_username(self.username) is not None:
             raise RuntimeError(f'username "{self.username}" is already taken')
-        unique_username = UniqueUsername(self.username)
-        self.__client__.transact_write_items(
-            TransactItems=[
-                dict(Put=self.put_params()),
-                dict(Put=unique_username.put_params()),
-            ]
-        )
+        UnitOfWork().put(self).put(UniqueUsername(self.username)).commit()
 
     @classmethod
     def init_by_credentials(cls, username: str, password: str) -> "User":
@@ -74,10 +77,7 @@ class User(ApplicationBase):
 
     @classmethod
     def find_by_username(cls, username: str) -> Optional["User"]:
-        res = cls.query(
-            IndexName="User.username-",
-            KeyConditionExpression=Attr("username").eq(username),
-        )
+        res = cls.query_prepared(FIND_BY_USERNAME, username=username)
         return first(res, None)
 
     @classmethod
@@ -85,9 +85,31 @@ class User(ApplicationBase):
         user = cls.find_by_username(username)
         if user is not None:
             if verify_passsword(password, user.password_digest):
+                if bcrypt_cost.outdated(user.password_digest):
+                    # Only chance to rehash is when password is known
+                    rehash_queue.submit(user, password)
                 return user
         return None
 
+    def rehash_password(self, password: str):
+        # Conditional so that concurrent password change (or rehash) wins
+        digest = generate_password_digest(password)
+        params = dict(
+            **self.TableName(),
+            Key=boto3_serialize(self.keys()),
+            UpdateExpression="SET password_digest = :new",
+            ConditionExpression="password_digest = :old",
+            ExpressionAttributeValues=boto3_serialize(
+                {":new": digest, ":old": self.password_digest}
+            ),
+        )
+        try:
+            self.request("update_item", **params)
+        except self.__client__.exceptions.ConditionalCheckFailedException:
+            pass
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("failed to rehash password of %s", self.id)
+
     def to_token(self) -> str:
         return encode_token(self)
 
@@ -98,6 +120,12 @@ class User(ApplicationBase):
         return None
 
 
+FIND_BY_USERNAME = QueryTemplate(
+    IndexName="User.username-",
+    KeyConditionExpression=Attr("username").eq(Param("username")),
+)
+
+
 @dataclass
 class UniqueUsername(ApplicationBase):
     __schema__ = schema(
@@ -124,11 +152,87 @@ class CredentialsValidator(BaseModel):
 
 BCRYPT_SALT_ROUNDS = 4 if env == "test" else 12
 
+BCRYPT_MIN_ROUNDS = 10  # lower bound of calibration (OWASP recommendation)
+BCRYPT_MAX_ROUNDS = 16
+
+# Digests within this many rounds of current cost are not rehashed. Any difference
+# is rehashed by default; raise it if calibration is noisy (e.g. between deploys)
+# so that it doesn't rehash everyone back and forth.
+BCRYPT_REHASH_TOLERANCE = 0
+
+
+class BcryptCost:
+    # Rounds of new digests, calibrated at startup (cf. config.bcrypt_target_ms) once
+    # for all worker processes (cf. __main__)
+    def __init__(self, rounds=BCRYPT_SALT_ROUNDS, tolerance=BCRYPT_REHASH_TOLERANCE):
+        self.rounds = rounds
+        self.tolerance = tolerance
+
+    def outdated(self, digest: str) -> bool:
+        return abs(digest_rounds(digest) - self.rounds) > self.tolerance
+
+    def calibrate(
+        self,
+        target_ms: float,
+        min_rounds=BCRYPT_MIN_ROUNDS,
+        max_rounds=BCRYPT_MAX_ROUNDS,
+    ) -> int:
+        # Time doubles per round, so measure once (best of 3) and extrapolate
+        elapsed_ms = min(hash_time_ms(min_rounds) for _ in range(3))
+        extra = math.floor(math.log2(max(target_ms / elapsed_ms, 1.0)))
+        self.rounds = min(min_rounds + extra, max_rounds)
+        logger.info("bcrypt rounds %d (target %sms)", self.rounds, target_ms)
+        return self.rounds
+
+
+bcrypt_cost = BcryptCost()
+
+
+class RehashQueue:
+    # Rehash after login off the request path. Each user is queued at most once and
+    # logins beyond "max_pending" are skipped (rehashed on a later login)
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(1)
+        self.lock = threading.Lock()
+        self.pending: set[str] = set()
+
+    def submit(self, user: User, password: str) -> bool:
+        with self.lock:
+            if user.id in self.pending or len(self.pending) >= self.max_pending:
+                return False
+            self.pending.add(user.id)
+        future = self.executor.submit(user.rehash_password, password)
+        future.add_done_callback(lambda _: self.done(user.id))
+        return True
+
+    def done(self, user_id: str):
+        with self.lock:
+            self.pending.discard(user_id)
+
+    def wait(self):
+        # Until queued rehashes finish
+        self.executor.submit(lambda: None).result()
+
+
+rehash_queue = RehashQueue()
+
+
+def hash_time_ms(rounds: int) -> float:
+    started_at = time.perf_counter()
+    bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds))
+    return (time.perf_counter() - started_at) * 1000
+
+
+def digest_rounds(digest: str) -> int:
+    # "$2b$<rounds>$<salt and hash>"
+    return int(digest.split("$")[2])
+
 
 def generate_password_digest(password: str) -> str:
     password_bin = bytes(password, "utf-8")
     password_bin_sha256 = base64.b64encode(hashlib.sha256(password_bin).digest())
-    digest_bin = bcrypt.hashpw(password_bin_sha256, bcrypt.gensalt(BCRYPT_SALT_ROUNDS))
+    digest_bin = bcrypt.hashpw(password_bin_sha256, bcrypt.gensalt(bcrypt_cost.rounds))
     digest = digest_bin.decode("ascii")
     return digest
 
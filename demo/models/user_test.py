@@ -1,13 +1,22 @@
 import unittest
-from typing import Any, ClassVar
+from typing import Any, ClassVar, cast
 
 import boto3
 import pytest
 from pydantic import ValidationError
 
 from ..config import config, env
+from ..model_utils import delete_tables, ensure_tables
 from .application import ApplicationBase
-from .user import UniqueUsername, User
+from .user import (
+    BCRYPT_REHASH_TOLERANCE,
+    BCRYPT_SALT_ROUNDS,
+    UniqueUsername,
+    User,
+    bcrypt_cost,
+    digest_rounds,
+    rehash_queue,
+)
 
 
 class UserTest(unittest.TestCase):
@@ -24,13 +33,12 @@ class UserTest(unittest.TestCase):
             aws_secret_access_key=config.aws_secret_access_key,
         )
         ApplicationBase.__client__ = cls.client
-        User.create_table()
-        UniqueUsername.create_table()
+        ensure_tables([User, UniqueUsername])
 
     @classmethod
     def tearDownClass(cls) -> None:
-        UniqueUsername.delete_table()
-        User.delete_table()
+        rehash_queue.wait()
+        delete_tables([User, UniqueUsername])
 
     def test_auto_id_field(self):
         user = User("joe", "asdfjkl;")
@@ -62,6 +70,41 @@ class UserTest(unittest.TestCase):
         res = User.find_by_credentials("jimmy", password)
         assert user == res
 
+    def test_calibrate_bcrypt_cost(self):
+        try:
+            assert bcrypt_cost.calibrate(0.0, min_rounds=4, max_rounds=6) == 4
+            assert bcrypt_cost.calibrate(1e9, min_rounds=4, max_rounds=6) == 6
+        finally:
+            bcrypt_cost.rounds = BCRYPT_SALT_ROUNDS
+
+    def test_rehash_password_on_login(self):
+        password = "asdfjkl;"
+        user = User.create("jacky", password)
+        assert digest_rounds(user.password_digest) == BCRYPT_SALT_ROUNDS
+
+        # Within tolerance (none by default)
+        bcrypt_cost.rounds = BCRYPT_SALT_ROUNDS + 1
+        bcrypt_cost.tolerance = 1
+        try:
+            assert User.find_by_credentials("jacky", password) == user
+            rehash_queue.wait()
+        finally:
+            bcrypt_cost.rounds = BCRYPT_SALT_ROUNDS
+            bcrypt_cost.tolerance = BCRYPT_REHASH_TOLERANCE
+        assert User.get(id=user.id) == user
+
+        bcrypt_cost.rounds = BCRYPT_SALT_ROUNDS + 1
+        try:
+            assert User.find_by_credentials("jacky", password) == user
+            rehash_queue.wait()
+        finally:
+            bcrypt_cost.rounds = BCRYPT_SALT_ROUNDS
+
+        rehashed = cast(User, User.get(id=user.id))
+        assert digest_rounds(rehashed.password_digest) == BCRYPT_SALT_ROUNDS + 1
+        assert User.find_by_credentials("jacky", password) == rehashed
+        rehash_queue.wait()
+
     def test_username_validation(self):
         username = "@#$%"
         with pytest.raises(ValidationError):
@@ -1,19 +1,32 @@
 from dataclasses import dataclass
-from typing import Literal
+from typing import Literal, Optional
 
 from ..config import schema
-from .application import ApplicationBase, auto_created_at_field, auto_id_field
+from ..sharding_utils import Cursor, ShardedIndex
+from .application import (
+    ApplicationBase,
+    CountBy,
+    auto_created_at_field,
+    auto_id_field,
+    single_table_layout,
+    video_collection_key,
+)
+
+IS_PUBLIC_INDEX = ShardedIndex(
+    "Video.is_public_shard-created_at", "is_public_shard", "created_at", 8
+)
 
 
 @dataclass
 class Video(ApplicationBase):
     __schema__ = schema(
         "Video",
+        stream=True,
         AttributeDefinitions=[
             {"AttributeName": "id", "AttributeType": "S"},
             {"AttributeName": "user_id", "AttributeType": "S"},
             {"AttributeName": "created_at", "AttributeType": "N"},
-            {"AttributeName": "is_public", "AttributeType": "N"},
+            {"AttributeName": "is_public_shard", "AttributeType": "S"},
         ],
         KeySchema=[
             {"AttributeName": "id", "KeyType": "HASH"},
@@ -36,10 +49,10 @@ class Video(ApplicationBase):
                 },
             },
             {
-                "IndexName": "Video.is_public-created_at",
+                "IndexName": "Video.is_public_shard-created_at",
                 "KeySchema": [
                     {
-                        "AttributeName": "is_public",
+                        "AttributeName": "is_public_shard",
                         "KeyType": "HASH",
                     },
                     {
@@ -53,6 +66,16 @@ class Video(ApplicationBase):
             },
         ],
     )
+    __layout__ = single_table_layout(
+        __schema__,
+        {
+            "Video.is_public_shard-created_at": "GSI1",
+            "Video.user_id-created_at": "GSI2",
+        },
+        collection=lambda video: (video_collection_key(video.id), "Video"),
+    )
+    __extra_attrs__ = ["is_public_shard"]
+    __aggregates__ = [CountBy("user_id")]
 
     user_id: str  # User.id
     youtube_id: str
@@ -63,3 +86,14 @@ class Video(ApplicationBase):
     is_public: Literal[0, 1] = 0  # "bool" type cannot be dynamodb HASH, so use "int"
     created_at: int = auto_created_at_field
     id: str = auto_id_field
+
+    @property
+    def is_public_shard(self) -> str:
+        return IS_PUBLIC_INDEX.shard_key(self.is_public, self.id)
+
+    @classmethod
+    def find_public(
+        cls, limit=20, cursor: Optional[Cursor] = None
+    ) -> tuple[list["Video"], Optional[Cursor]]:
+        # Newest first
+        return IS_PUBLIC_INDEX.query(cls, 1, limit=limit, cursor=cursor)
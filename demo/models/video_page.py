@@ -0,0 +1,74 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from ..config import config
+from ..single_table_utils import COLLECTION_SORT_KEY
+from .application import main_table, video_collection_key
+from .caption_entry import CaptionEntry
+from .practice_entry import PracticeEntry
+from .video import Video
+
+#
+# Video with its captions (both languages) and user's practice entries, i.e. what
+# the player needs. With "single" table layout (and "rows" caption storage) all of
+# them share the video's collection and are read by a few range queries of it.
+#
+
+
+@dataclass
+class VideoPage:
+    video: Video
+    caption_entries: dict[str, list[CaptionEntry]] = field(default_factory=dict)
+    practice_entries: list[PracticeEntry] = field(default_factory=list)
+
+
+def find_video_page(video_id: str, user_id: str) -> Optional[VideoPage]:
+    if config.table_layout == "single" and config.caption_storage == "rows":
+        return find_video_page_collection(video_id, user_id)
+
+    video = Video.get(id=video_id)
+    if video is None:
+        return None
+    page = VideoPage(video)
+    for language in [video.language1, video.language2]:
+        page.caption_entries[language] = CaptionEntry.find_by_video(video_id, language)
+        page.practice_entries += PracticeEntry.query(
+            IndexName="PracticeEntry.video_id__language",
+            KeyConditionExpression=Key("video_id__language").eq(
+                "__".join([video_id, language])
+            ),
+            FilterExpression=Attr("user_id").eq(user_id),
+        )
+    return page
+
+
+def find_video_page_collection(video_id: str, user_id: str) -> Optional[VideoPage]:
+    # Practice entries are sorted by user within collection (cf. PracticeEntry), so
+    # read ranges before them, of the user and after them (i.e. video)
+    practice_entries = f"{PracticeEntry.__name__}#"
+    sort_key = Key(COLLECTION_SORT_KEY)
+    items = [
+        item
+        for condition in [
+            sort_key.lt(practice_entries),
+            sort_key.begins_with(f"{practice_entries}{user_id}#"),
+            sort_key.gt(f"{PracticeEntry.__name__}$"),  # "$" follows "#"
+        ]
+        for item in main_table.query_collection(
+            video_collection_key(video_id), condition
+        )
+    ]
+    videos = [item for item in items if isinstance(item, Video)]
+    if not videos:
+        return None
+    page = VideoPage(videos[0])
+    for language in [page.video.language1, page.video.language2]:
+        page.caption_entries[language] = []
+    for item in items:  # in collection sort key order (i.e. by timestamp_start)
+        if isinstance(item, CaptionEntry):
+            page.caption_entries.setdefault(item.language, []).append(item)
+        elif isinstance(item, PracticeEntry):
+            page.practice_entries.append(item)
+    return page
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from aiohttp import web
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+# Workers are spawned (not forked) so that a rolling restart picks up new code
+mp = multiprocessing.get_context("spawn")
+
+
+@dataclass
+class WorkerOptions:
+    host: str
+    port: int
+    max_pool_connections: int
+    shutdown_timeout: float
+    # Same bcrypt cost in all workers (otherwise they rehash each other's digests)
+    bcrypt_rounds: Optional[int] = None
+
+
+#
+# worker process
+#
+
+
+def run_worker(options: WorkerOptions, ready: Any, changes: Any) -> None:
+    # Ctrl-C is delivered to the whole process group, but only supervisor decides
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve(options, ready, changes))
+
+
+async def serve(options: WorkerOptions, ready: Any, changes: Any) -> None:
+    from .create_app import create_app
+
+    stopped = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set)
+
+    app = create_app(
+        max_pool_connections=options.max_pool_connections,
+        bcrypt_rounds=options.bcrypt_rounds,
+        poll_change_feed=False,
+    )
+    threading.Thread(target=deliver_changes, args=(changes,), daemon=True).start()
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    # Each worker binds its own socket and the kernel balances connections among them
+    site = web.TCPSite(
+        runner,
+        options.host,
+        options.port,
+        reuse_port=True,
+        shutdown_timeout=options.shutdown_timeout,
+    )
+    await site.start()
+    ready.set()
+
+    await stopped.wait()
+    # Stop accepting connections and wait for in-flight requests
+    await runner.cleanup()
+
+
+def deliver_changes(changes: Any) -> None:
+    # Changes read by supervisor (cf. Supervisor.relay_changes) to this worker's
+    # handlers (i.e. in-process caches)
+    from .stream_utils import change_feed
+
+    while True:
+        model, model_changes = changes.get()
+        try:
+            change_feed.deliver(model, model_changes)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("failed to deliver changes of %s", model.__name__)
+
+
+#
+# supervisor process
+#
+
+
+@dataclass
+class Worker:
+    process: Any  # multiprocessing.Process
+    ready: Any  # multiprocessing.Event
+    changes: Any  # multiprocessing.Queue of (model, list of stream_utils.Change)
+    started_at: float
+
+
+class Supervisor:
+    POLL_INTERVAL = 0.5
+    READY_TIMEOUT = 30.0
+    MIN_UPTIME = 5.0  # worker dying sooner than this is considered crash loop
+    MAX_RESPAWN_DELAY = 30.0
+
+    def __init__(self, options: WorkerOptions, num_workers: int):
+        self.options = options
+        self.num_workers = num_workers
+        self.workers: list[Worker] = []
+        self.stopping = False
+        self.restarting = False
+        self.respawn_delay = 0.0
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.on_stop)
+        signal.signal(signal.SIGINT, self.on_stop)
+        signal.signal(signal.SIGHUP, self.on_restart)
+
+        for _ in range(self.num_workers):
+            self.spawn()
+        if config.change_feed:
+            self.start_change_feed()
+        host, port = self.options.host, self.options.port
+        logger.info("%d workers on http://%s:%d", self.num_workers, host, port)
+
+        while not self.stopping:
+            if self.restarting:
+                self.restarting = False
+                self.rolling_restart()
+            self.respawn_dead()
+            time.sleep(self.POLL_INTERVAL)
+
+        self.shutdown()
+
+    def on_stop(self, *_) -> None:
+        self.stopping = True
+
+    def on_restart(self, *_) -> None:
+        self.restarting = True
+
+    def spawn(self) -> Worker:
+        ready = mp.Event()
+        changes = mp.Queue()
+        process = mp.Process(target=run_worker, args=(self.options, ready, changes))
+        process.start()
+        worker = Worker(process, ready, changes, time.monotonic())
+        self.workers.append(worker)
+        return worker
+
+    def remove(self, worker: Worker) -> None:
+        self.workers.remove(worker)
+        # Don't wait for undelivered changes to be flushed
+        worker.changes.cancel_join_thread()
+        worker.changes.close()
+
+    def start_change_feed(self) -> None:
+        # DynamoDB Streams allows only a few readers per shard, so supervisor reads
+        # them once and sends changes to every worker
+        from . import create_app  # pylint: disable=unused-import
+        from .client import create_client, create_streams_client
+        from .model_utils import Base
+        from .stream_utils import change_feed
+
+        # Handlers are registered by modules of app (but only called in workers)
+        Base.__client__ = create_client()
+        change_feed.client = create_streams_client()
+        change_feed.forward = self.broadcast
+        threading.Thread(target=self.relay_changes, daemon=True).start()
+
+    def relay_changes(self) -> None:
+        from .stream_utils import change_feed
+
+        while not self.stopping:
+            if change_feed.poll_logged() == 0:
+                time.sleep(config.change_feed_poll_interval)
+
+    def broadcast(self, model: Any, changes: list) -> None:
+        for worker in list(self.workers):  # workers are replaced by main thread
+            with suppress(ValueError):  # closed queue of removed worker
+                worker.changes.put((model, changes))
+
+    def stop(self, worker: Worker) -> None:
+        worker.process.terminate()  # SIGTERM i.e. graceful shutdown
+        worker.process.join(self.options.shutdown_timeout + 1)
+        if worker.process.is_alive():
+            logger.warning("worker %d did not exit, killing it", worker.process.pid)
+            worker.process.kill()
+            worker.process.join()
+        self.remove(worker)
+
+    def respawn_dead(self) -> None:
+        for worker in list(self.workers):
+            if worker.process.is_alive():
+                continue
+            worker.process.join()
+            self.remove(worker)
+            logger.warning(
+                "worker %d exited with %s", worker.process.pid, worker.process.exitcode
+            )
+
+            # Back off exponentially while workers keep crashing right after start
+            if time.monotonic() - worker.started_at < self.MIN_UPTIME:
+                self.respawn_delay = min(
+                    max(self.respawn_delay * 2, self.POLL_INTERVAL),
+                    self.MAX_RESPAWN_DELAY,
+                )
+                time.sleep(self.respawn_delay)
+            else:
+                self.respawn_delay = 0.0
+            if not self.stopping:
+                self.spawn()
+
+    def rolling_restart(self) -> None:
+        # Replace workers one by one so that the port is always served
+        for old in list(self.workers):
+            if self.stopping:
+                return
+            new = self.spawn()
+            if not new.ready.wait(self.READY_TIMEOUT):
+                logger.error("new worker did not become ready, aborting restart")
+                self.stop(new)
+                return
+            self.stop(old)
+        logger.info("rolling restart finished")
+
+    def shutdown(self) -> None:
+        for worker in self.workers:
+            worker.process.terminate()
+        deadline = time.monotonic() + self.options.shutdown_timeout + 1
+        for worker in list(self.workers):
+            worker.process.join(max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+        self.workers = []
+
+
+def run_supervisor(options: WorkerOptions, num_workers: Optional[int]) -> None:
+    Supervisor(options, num_workers or mp.cpu_count()).run()
@@ -0,0 +1,53 @@
+import sys
+import threading
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+
+class SamplingProfiler:
+    # Sample stacks of all threads periodically from background thread and
+    # aggregate them in "folded" format (cf. flamegraph.pl, speedscope).
+    # Note that concurrent requests on the same event loop (or executor) are
+    # sampled together since they share threads.
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> Counter[str]:
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        return self.samples
+
+    def run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self.stopped.wait(self.interval):
+            # pylint: disable=protected-access
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                name = names.get(thread_id, str(thread_id))
+                self.samples[";".join([name, *folded_stack(frame)])] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.samples.most_common())
+
+
+def folded_stack(frame: Optional[FrameType]) -> list[str]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        location = f"{code.co_filename}:{code.co_firstlineno}"
+        stack.append(f"{code.co_name} ({location})")
+        frame = frame.f_back
+    return stack[::-1]
@@ -0,0 +1,45 @@
+from dataclasses import dataclass
+
+DAY = 24 * 60 * 60
+
+MIN_EASE = 1300  # in permille
+DEFAULT_EASE = 2500
+
+
+@dataclass
+class ReviewState:
+    due_at: int  # unix time
+    interval: int  # in second
+    ease: int  # interval multiplier in permille
+    repetitions: int  # consecutive successful reviews
+
+
+def schedule(state: ReviewState, grade: int, now: int) -> ReviewState:
+    """
+    SM-2 with grade from 0 (blackout) to 5 (perfect), failure (< 3) starts over
+    >>> s = schedule(ReviewState(0, 0, DEFAULT_EASE, 0), 4, now=0)
+    >>> s
+    ReviewState(due_at=86400, interval=86400, ease=2500, repetitions=1)
+    >>> s = schedule(s, 5, now=s.due_at)
+    >>> s.interval // DAY, s.ease, s.repetitions
+    (6, 2600, 2)
+    >>> s = schedule(s, 3, now=s.due_at)
+    >>> s.interval // DAY, s.ease, s.repetitions
+    (14, 2460, 3)
+    >>> schedule(s, 1, now=0)
+    ReviewState(due_at=86400, interval=86400, ease=1920, repetitions=0)
+    """
+    assert 0 <= grade <= 5
+    miss = 5 - grade
+    ease = max(state.ease + 100 - miss * (80 + miss * 20), MIN_EASE)
+    if grade < 3:
+        repetitions, interval = 0, DAY
+    else:
+        repetitions = state.repetitions + 1
+        if repetitions == 1:
+            interval = DAY
+        elif repetitions == 2:
+            interval = 6 * DAY
+        else:
+            interval = state.interval * ease // 1000
+    return ReviewState(now + interval, interval, ease, repetitions)
@@ -1,9 +1,27 @@
 from aiohttp.web import get, post
 
 from .controller_utils import to_handler
+from .controllers.practice_entries import PracticeEntriesController
+from .controllers.reviews import ReviewsController
+from .controllers.sessions import SessionsController
 from .controllers.users import UsersController
+from .controllers.videos import VideosController
 
 routes = [
     get("/", to_handler(UsersController, UsersController.create)),
     post("/users/", to_handler(UsersController, UsersController.create)),
+    get("/users/me", to_handler(UsersController, UsersController.show_me)),
+    post("/sessions/", to_handler(SessionsController, SessionsController.create)),
+    get(
+        "/practice_entries/",
+        to_handler(PracticeEntriesController, PracticeEntriesController.index),
+    ),
+    get("/reviews/due", to_handler(ReviewsController, ReviewsController.due)),
+    post("/reviews/", to_handler(ReviewsController, ReviewsController.create)),
+    get("/videos/{id}", to_handler(VideosController, VideosController.show)),
+    get("/videos/{id}/page", to_handler(VideosController, VideosController.page)),
+    get(
+        "/videos/{id}/captions/{language}",
+        to_handler(VideosController, VideosController.captions),
+    ),
 ]
@@ -0,0 +1,55 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+# Per-language replacements applied after accents are stripped
+LANGUAGE_REPLACEMENTS: dict[str, list[tuple[str, str]]] = {
+    "fr": [("œ", "oe"), ("æ", "ae")],
+    "de": [("ß", "ss")],
+}
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def normalize_text(text: str, language: str) -> str:
+    """
+    >>> normalize_text("Demain on DÉMÉNAGE\\xa0!", "fr")
+    'demain on demenage !'
+    """
+    # Same whitespace handling as misc/ttml_to_json.py
+    text = text.replace("\xa0", " ")
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    for old, new in LANGUAGE_REPLACEMENTS.get(language, []):
+        text = text.replace(old, new)
+    return text
+
+
+def tokenize(text: str, language: str) -> list[str]:
+    """
+    >>> tokenize("Aujourd'hui, on est le 31 août", "fr")
+    ['aujourd', 'hui', 'on', 'est', 'le', '31', 'aout']
+    """
+    return TOKEN_PATTERN.findall(normalize_text(text, language))
+
+
+def token_positions(tokens: list[str]) -> dict[str, list[int]]:
+    """
+    >>> token_positions(["on", "est", "on"])
+    {'on': [0, 2], 'est': [1]}
+    """
+    positions = defaultdict(list)
+    for i, token in enumerate(tokens):
+        positions[token].append(i)
+    return dict(positions)
+
+
+def count_phrase(positions: list[set[int]]) -> int:
+    """
+    Number of occurrences of phrase given positions of each of its tokens
+
+    >>> count_phrase([{0, 5, 9}, {1, 6}, {7}])
+    1
+    """
+    first, *rest = positions
+    return sum(all(p + i in ps for i, ps in enumerate(rest, 1)) for p in first)
@@ -0,0 +1,144 @@
+import contextvars
+import heapq
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice, takewhile
+from typing import Any, Iterator, Optional, Type, TypeVar
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from .model_utils import Base, Param, QueryTemplate, boto3_build_expression
+
+T = TypeVar("T", bound=Base)
+
+# Shard number (as str) -> "ExclusiveStartKey" ({} to start, None when exhausted)
+Cursor = dict[str, Optional[dict]]
+
+executor = ThreadPoolExecutor(32)
+
+
+@dataclass
+class ShardedIndex:
+    # Spread a hot partition key (e.g. "language") over "<value>#<n>" partitions.
+    # Items are assigned to a shard by hash of their id at write time and
+    # queries read all shards in parallel and merge them by range key.
+    index_name: str
+    attribute: str  # sharded hash key e.g. "language_shard"
+    range_key: str  # e.g. "created_at"
+    shards: int
+    template: QueryTemplate = field(init=False)
+
+    def __post_init__(self):
+        self.template = QueryTemplate(
+            IndexName=self.index_name,
+            KeyConditionExpression=Key(self.attribute).eq(Param("shard_key")),
+        )
+
+    def shard_key(self, value: Any, item_id: str) -> str:
+        shard = zlib.crc32(item_id.encode()) % self.shards
+        return f"{value}#{shard}"
+
+    def start_key(self, model: Type[T], item: T) -> dict:
+        d = model.serialize(item)
+        names = model.key_names() + model.index_key_names(self.index_name)
+        return {name: d[name] for name in names}
+
+    def query(
+        self,
+        model: Type[T],
+        value: Any,
+        limit=20,
+        cursor: Optional[Cursor] = None,
+        ascending=False,
+    ) -> tuple[list[T], Optional[Cursor]]:
+        if cursor is None:
+            cursor = {str(n): {} for n in range(self.shards)}
+
+        def fetch(shard: str) -> tuple[list[T], Optional[dict]]:
+            params = self.template.bind(shard_key=f"{value}#{shard}")
+            params.update(Limit=limit, ScanIndexForward=ascending)
+            if start_key := cursor[shard]:
+                params.update(ExclusiveStartKey=start_key)
+            return model.query_page_raw(**params)
+
+        # Scatter (in caller's context, e.g. for its request deadline)
+        shards = [shard for shard, start_key in cursor.items() if start_key is not None]
+        futures = [
+            executor.submit(contextvars.copy_context().run, fetch, shard)
+            for shard in shards
+        ]
+        pages = {shard: future.result() for shard, future in zip(shards, futures)}
+
+        # Gather (k-way merge of sorted pages)
+        def sort_key(pair: tuple[T, str]) -> Any:
+            return getattr(pair[0], self.range_key)
+
+        streams = [
+            [(item, shard) for item in items] for shard, (items, _) in pages.items()
+        ]
+        merged_all: Iterator[tuple[T, str]] = heapq.merge(
+            *streams, key=sort_key, reverse=not ascending
+        )
+
+        # Page of a shard with more items may be short (e.g. 1MB limit), so stop at
+        # the last item read from such shard as its unread items come after it
+        partial = [items for items, last_key in pages.values() if last_key is not None]
+        if any(not items for items in partial):
+            merged_all = iter([])
+        elif partial:
+            last_values = [getattr(items[-1], self.range_key) for items in partial]
+            if ascending:
+                bound = min(last_values)
+                merged_all = takewhile(lambda pair: sort_key(pair) <= bound, merged_all)
+            else:
+                bound = max(last_values)
+                merged_all = takewhile(lambda pair: sort_key(pair) >= bound, merged_all)
+        merged = list(islice(merged_all, limit))
+
+        # Resume each shard right after the last item taken from it
+        last_taken = {shard: item for item, shard in merged}
+        next_cursor: Cursor = {shard: None for shard in cursor}
+        for shard, (items, last_key) in pages.items():
+            if shard not in last_taken:
+                next_cursor[shard] = cursor[shard] if items else last_key
+            elif last_taken[shard] is items[-1]:
+                next_cursor[shard] = last_key
+            else:
+                next_cursor[shard] = self.start_key(model, last_taken[shard])
+
+        items = [item for item, _ in merged]
+        if all(start_key is None for start_key in next_cursor.values()):
+            return items, None
+        return items, next_cursor
+
+    def backfill(self, model: Type[T]) -> int:
+        # Write sharded key into items put before the index was added. Items written
+        # since then (also concurrently) have it already and are not overwritten.
+        params = boto3_build_expression(
+            FilterExpression=Attr(self.attribute).not_exists()
+        )
+        condition = (
+            f"attribute_not_exists({self.attribute}) AND "
+            + model.existing_keys_condition()
+        )
+        count = 0
+        while True:
+            res = model.request("scan", **model.TableName(), **params)
+            for d in res["Items"]:
+                if model.item_model(d) is not model:
+                    continue  # other model of shared table
+                item = model.serialize(model.deserialize(d))
+                try:
+                    model.request(
+                        "put_item",
+                        **model.TableName(),
+                        Item=item,
+                        ConditionExpression=condition,
+                    )
+                    count += 1
+                except model.__client__.exceptions.ConditionalCheckFailedException:
+                    pass
+            if (last_key := res.get("LastEvaluatedKey")) is None:
+                return count
+            params.update(ExclusiveStartKey=last_key)
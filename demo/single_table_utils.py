@@ -0,0 +1,235 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Type
+
+from boto3.dynamodb.conditions import Key
+
+from .model_utils import (
+    Base,
+    boto3_build_expression,
+    index_map,
+    send_request,
+    serializer,
+)
+
+#
+# Several models in one table: items get generic primary key "PK"/"SK" prefixed by
+# model name, "item_type" to tell models apart, and keys of a few overloaded GSIs
+# ("GSI1"... shared by indexes of all models) in place of per-model indexes. Items
+# related to each other (e.g. video and its captions) also share a collection key
+# so that all of them are read by a single query (cf. SingleTable.query_collection).
+#
+
+TYPE_ATTRIBUTE = "item_type"
+COLLECTION_INDEX = "Collection"
+COLLECTION_SORT_KEY = f"{COLLECTION_INDEX}SK"
+
+
+def single_table_definition(
+    num_slots=4, range_types: Optional[dict[str, str]] = None
+) -> dict:
+    # Overloaded GSIs "GSI<n>" have string hash key and range key of type given by
+    # "range_types" (e.g. {"GSI2": "S"}), number by default. Indexes of models
+    # mapped to a slot must have range key of the same type (cf. ModelLayout.bind).
+    range_types = range_types or {}
+    slots = [(COLLECTION_INDEX, "S")] + [
+        (f"GSI{n + 1}", range_types.get(f"GSI{n + 1}", "N")) for n in range(num_slots)
+    ]
+    attributes = [("PK", "S"), ("SK", "S")]
+    for slot, range_type in slots:
+        attributes += [(f"{slot}PK", "S"), (f"{slot}SK", range_type)]
+    return dict(
+        AttributeDefinitions=[
+            {"AttributeName": name, "AttributeType": attribute_type}
+            for name, attribute_type in attributes
+        ],
+        KeySchema=[
+            {"AttributeName": "PK", "KeyType": "HASH"},
+            {"AttributeName": "SK", "KeyType": "RANGE"},
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": slot,
+                "KeySchema": [
+                    {"AttributeName": f"{slot}PK", "KeyType": "HASH"},
+                    {"AttributeName": f"{slot}SK", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            }
+            for slot, _ in slots
+        ],
+    )
+
+
+class SingleTable:
+    def __init__(self, schema: dict):
+        self.schema = schema
+        self.models: dict[str, Type[Base]] = {}
+        self.attribute_types = {
+            attrs["AttributeName"]: attrs["AttributeType"]
+            for attrs in schema["AttributeDefinitions"]
+        }
+        self.attributes = set(self.attribute_types)
+
+    def layout(
+        self,
+        schema: dict,
+        slots: dict[str, str],
+        collection: Optional[Callable[[Any], tuple[str, str]]] = None,
+    ) -> "ModelLayout":
+        return ModelLayout(self, schema, slots, collection)
+
+    def model_of(self, item: dict) -> Type[Base]:
+        return self.models[item[TYPE_ATTRIBUTE]["S"]]
+
+    def query_collection(
+        self, collection_key: str, sort_key_condition: Any = None, **kwargs
+    ) -> list[Base]:
+        # Items of any models sharing collection key, optionally within range of sort
+        # key (e.g. Key(COLLECTION_SORT_KEY).begins_with(...))
+        condition = Key(f"{COLLECTION_INDEX}PK").eq(collection_key)
+        if sort_key_condition is not None:
+            condition &= sort_key_condition
+        params = boto3_build_expression(
+            IndexName=COLLECTION_INDEX, KeyConditionExpression=condition, **kwargs
+        )
+        items = []
+        while True:
+            res = send_request(
+                Base.__client__, "query", TableName=self.schema["TableName"], **params
+            )
+            items += res["Items"]
+            if (last_key := res.get("LastEvaluatedKey")) is None:
+                break
+            params = dict(params, ExclusiveStartKey=last_key)
+        return [self.model_of(item).deserialize(item) for item in items]
+
+
+@dataclass
+class ModelLayout:
+    table: SingleTable
+    schema: dict  # model's own (logical) schema
+    slots: dict[str, str]  # model's index name -> overloaded GSI (e.g. "GSI1")
+    # Item -> (collection key, sort key within collection)
+    collection: Optional[Callable[[Any], tuple[str, str]]] = None
+    model: Any = field(default=None, init=False)
+
+    def bind(self, model: Type[Base]) -> dict:
+        assert set(self.slots) <= set(index_map(self.schema)), "unknown index"
+        for index_name, slot in self.slots.items():
+            range_type = self.table.attribute_types[f"{slot}SK"]
+            _, *range_key = self.key_names(index_name)
+            if range_key and (attribute_type := self.attribute_type(range_key[0])):
+                assert attribute_type == range_type, f"{slot}SK is {range_type}"
+        self.model = model
+        self.table.models[model.__name__] = model
+        return self.table.schema
+
+    def key_names(self, index_name: Optional[str] = None) -> list[str]:
+        # Logical hash (and range) key of primary key or index
+        if index_name is None:
+            key_schema = self.schema["KeySchema"]
+        else:
+            key_schema = index_map(self.schema)[index_name]["KeySchema"]
+        return [attrs["AttributeName"] for attrs in key_schema]
+
+    def primary_key(self, keys: Any) -> dict:
+        # From dict of logical keys or model instance
+        values = [
+            keys[name] if isinstance(keys, dict) else getattr(keys, name)
+            for name in self.key_names()
+        ]
+        type_name = self.model.__name__
+        return dict(PK="#".join([type_name, *map(str, values)]), SK=type_name)
+
+    def attribute_type(self, name: str) -> Optional[str]:
+        # Declared type of model's attribute ("S", "N" or "B") if any
+        for attrs in self.schema.get("AttributeDefinitions", []):
+            if attrs["AttributeName"] == name:
+                return attrs["AttributeType"]
+        return None
+
+    def index_key_names(self, index_name: str) -> list[str]:
+        slot = self.slots[index_name]
+        return [f"{slot}PK", f"{slot}SK"]
+
+    def item_attributes(self, item: Any) -> dict:
+        # Serialized generic attributes added to item
+        d = dict(self.primary_key(item), **{TYPE_ATTRIBUTE: self.model.__name__})
+        for index_name, slot in self.slots.items():
+            hash_key, *range_key = self.key_names(index_name)
+            if (value := getattr(item, hash_key)) is None:
+                continue  # sparse index
+            d[f"{slot}PK"] = f"{index_name}#{value}"
+            if range_key:
+                d[f"{slot}SK"] = getattr(item, range_key[0])
+            else:
+                range_type = self.table.attribute_types[f"{slot}SK"]
+                d[f"{slot}SK"] = 0 if range_type == "N" else "0"
+        if self.collection:
+            collection_key, sort_key = self.collection(item)
+            d[f"{COLLECTION_INDEX}PK"] = collection_key
+            d[COLLECTION_SORT_KEY] = sort_key
+        return {k: serializer.serialize(v) for k, v in d.items()}
+
+    def strip(self, d: dict) -> dict:
+        attributes = self.table.attributes | {TYPE_ATTRIBUTE}
+        return {k: v for k, v in d.items() if k not in attributes}
+
+    def model_of(self, item: dict) -> Type[Base]:
+        return self.table.model_of(item)
+
+    def translate_query(self, params: dict) -> dict:
+        # Query of model's index -> query of overloaded GSI (i.e. rename key
+        # attributes and prefix hash key value with index name) only within key
+        # condition, as filter and projection are of model's own attributes
+        index_name = params.get("IndexName")
+        if index_name not in self.slots:
+            raise ValueError(f"{self.model.__name__} cannot query {index_name}")
+        slot = self.slots[index_name]
+        hash_key, *range_key = self.key_names(index_name)
+        condition = params["KeyConditionExpression"]
+        others = " ".join(
+            params.get(param, "")
+            for param in ["FilterExpression", "ProjectionExpression"]
+        )
+        names = dict(params["ExpressionAttributeNames"])
+        values = dict(params["ExpressionAttributeValues"])
+
+        def key_placeholder(placeholder: str) -> str:
+            # Placeholder of key condition, new one if others use it too
+            if not uses_placeholder(others, placeholder):
+                return placeholder
+            nonlocal condition
+            condition = replace_placeholder(condition, placeholder, placeholder + slot)
+            return placeholder + slot
+
+        for placeholder, name in params["ExpressionAttributeNames"].items():
+            if not uses_placeholder(condition, placeholder):
+                continue
+            if name == hash_key:
+                placeholder = key_placeholder(placeholder)
+                names[placeholder] = f"{slot}PK"
+                pattern = re.escape(placeholder) + r" = (:\w+)"
+                for value_placeholder in re.findall(pattern, condition):
+                    value = next(iter(values[value_placeholder].values()))
+                    values[key_placeholder(value_placeholder)] = {
+                        "S": f"{index_name}#{value}"
+                    }
+            elif name in range_key:
+                names[key_placeholder(placeholder)] = f"{slot}SK"
+        return dict(
+            params,
+            IndexName=slot,
+            KeyConditionExpression=condition,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+
+
+def uses_placeholder(expression: str, placeholder: str) -> bool:
+    return re.search(re.escape(placeholder) + r"(?!\w)", expression) is not None
+
+
+def replace_placeholder(expression: str, placeholder: str, new: str) -> str:
+    return re.sub(re.escape(placeholder) + r"(?!\w)", new, expression)
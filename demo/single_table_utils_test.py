@@ -0,0 +1,194 @@
+import unittest
+import uuid
+from dataclasses import dataclass
+
+import boto3
+from boto3.dynamodb.conditions import Attr, Key
+
+from .model_utils import Base, delete_tables, ensure_tables, get_many
+from .model_utils_test import TEST_CONFIG, TEST_TABLE_PREFIX, DataclassBase
+from .single_table_utils import (
+    COLLECTION_SORT_KEY,
+    SingleTable,
+    single_table_definition,
+)
+
+
+def define_single_table_models():
+    table = SingleTable(
+        dict(
+            TableName=f"{TEST_TABLE_PREFIX}{uuid.uuid1()}",
+            BillingMode="PAY_PER_REQUEST",
+            **single_table_definition(num_slots=2),
+        )
+    )
+
+    @dataclass
+    class Album(DataclassBase):
+        __schema__ = dict(
+            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": "Album.owner-year",
+                    "KeySchema": [
+                        {"AttributeName": "owner", "KeyType": "HASH"},
+                        {"AttributeName": "year", "KeyType": "RANGE"},
+                    ],
+                },
+            ],
+        )
+        __layout__ = table.layout(
+            __schema__,
+            {"Album.owner-year": "GSI1"},
+            collection=lambda album: (f"Album#{album.id}", "Album"),
+        )
+        id: str
+        owner: str
+        year: int
+
+    @dataclass
+    class Track(DataclassBase):
+        __schema__ = dict(
+            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": "Track.owner-",
+                    "KeySchema": [{"AttributeName": "owner", "KeyType": "HASH"}],
+                },
+            ],
+        )
+        __layout__ = table.layout(
+            __schema__,
+            {"Track.owner-": "GSI2"},
+            collection=lambda track: (
+                f"Album#{track.album_id}",
+                f"Track#{track.no:03}",
+            ),
+        )
+        id: str
+        album_id: str
+        owner: str
+        no: int
+
+    return table, Album, Track
+
+
+class SingleTableTest(unittest.TestCase):
+    def setUp(self):
+        Base.__client__ = boto3.client("dynamodb", **TEST_CONFIG)
+        self.table, self.Album, self.Track = define_single_table_models()
+        ensure_tables([self.Album, self.Track])
+
+    def tearDown(self):
+        delete_tables([self.Album, self.Track])
+
+    def test_single_table(self):
+        Album, Track = self.Album, self.Track
+        album = Album("a1", "alice", 2001)
+        tracks = [Track(f"t{no}", "a1", "alice", no) for no in [2, 1]]
+        album.put()
+        Track.put_batch(tracks)
+        Album("a2", "alice", 1999).put()
+
+        self.assertEqual(Album.get(id="a1"), album)
+        self.assertIsNone(Track.get(id="a1"))  # same logical key, other model
+        res = get_many([(Track, dict(id="t1")), (Album, dict(id="a1"))])
+        self.assertEqual(res, [tracks[1], album])
+
+        # Index queries are translated to overloaded GSIs
+        res = Album.query(
+            IndexName="Album.owner-year",
+            KeyConditionExpression=Key("owner").eq("alice") & Key("year").gt(2000),
+        )
+        self.assertEqual(res, [album])
+        res = Track.query(
+            IndexName="Track.owner-", KeyConditionExpression=Key("owner").eq("alice")
+        )
+        self.assertEqual(sorted(res, key=lambda track: track.no), tracks[::-1])
+        with self.assertRaises(ValueError):
+            Album.query(KeyConditionExpression=Key("id").eq("a1"))
+
+        # Filter on the same (logical) attribute as key condition is kept as is
+        res = Album.query(
+            IndexName="Album.owner-year",
+            KeyConditionExpression=Key("owner").eq("alice"),
+            FilterExpression=Attr("owner").eq("alice") & Attr("year").lt(2000),
+        )
+        self.assertEqual(res, [Album("a2", "alice", 1999)])
+
+        # Scan skips items of other models
+        self.assertEqual(len(Album.scan()), 2)
+
+        # Collection of different models in sort key order
+        res = self.table.query_collection("Album#a1")
+        self.assertEqual(res, [album, tracks[1], tracks[0]])
+        res = self.table.query_collection(
+            "Album#a1", Key(COLLECTION_SORT_KEY).begins_with("Track#")
+        )
+        self.assertEqual(res, [tracks[1], tracks[0]])
+
+        tracks[0].delete()
+        self.assertEqual(len(Track.scan()), 1)
+
+    def test_translate_query_shared_placeholders(self):
+        params = dict(
+            IndexName="Album.owner-year",
+            KeyConditionExpression="#o = :o",
+            FilterExpression="#o = :o",
+            ExpressionAttributeNames={"#o": "owner"},
+            ExpressionAttributeValues={":o": {"S": "alice"}},
+        )
+        res = self.Album.__layout__.translate_query(params)
+        self.assertEqual(res["KeyConditionExpression"], "#oGSI1 = :oGSI1")
+        self.assertEqual(res["FilterExpression"], "#o = :o")
+        self.assertEqual(
+            res["ExpressionAttributeNames"], {"#o": "owner", "#oGSI1": "GSI1PK"}
+        )
+        self.assertEqual(
+            res["ExpressionAttributeValues"],
+            {":o": {"S": "alice"}, ":oGSI1": {"S": "Album.owner-year#alice"}},
+        )
+
+    def test_range_types(self):
+        table = SingleTable(
+            dict(
+                TableName=f"{TEST_TABLE_PREFIX}{uuid.uuid1()}",
+                BillingMode="PAY_PER_REQUEST",
+                **single_table_definition(num_slots=2, range_types={"GSI2": "S"}),
+            )
+        )
+        schema = dict(
+            AttributeDefinitions=[{"AttributeName": "name", "AttributeType": "S"}],
+            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": "Label.owner-name",
+                    "KeySchema": [
+                        {"AttributeName": "owner", "KeyType": "HASH"},
+                        {"AttributeName": "name", "KeyType": "RANGE"},
+                    ],
+                },
+            ],
+        )
+        with self.assertRaises(AssertionError):
+            table.layout(schema, {"Label.owner-name": "GSI1"}).bind(Base)
+
+        @dataclass
+        class Label(DataclassBase):
+            __schema__ = schema
+            __layout__ = table.layout(schema, {"Label.owner-name": "GSI2"})
+            id: str
+            owner: str
+            name: str
+
+        ensure_tables([Label])
+        try:
+            labels = [Label("l1", "alice", "rock"), Label("l2", "alice", "jazz")]
+            Label.put_batch(labels)
+            res = Label.query(
+                IndexName="Label.owner-name",
+                KeyConditionExpression=Key("owner").eq("alice"),
+            )
+            self.assertEqual(res, labels[::-1])
+        finally:
+            delete_tables([Label])
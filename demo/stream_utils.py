@@ -0,0 +1,208 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Type
+
+from .model_utils import Base, run_in_executor
+
+logger = logging.getLogger(__name__)
+
+#
+# Consume DynamoDB Streams (cf. config.STREAM_SPECIFICATION) of models as batches of
+# decoded changes, so that caches and derived data follow writes without polling
+# tables
+#
+
+
+@dataclass
+class Change:
+    event: str  # "INSERT", "MODIFY" or "REMOVE"
+    new: Optional[Any]  # model instance (None for "REMOVE")
+    old: Optional[Any]  # model instance (None for "INSERT")
+    sequence_number: str
+
+    @property
+    def item(self) -> Any:
+        # New instance, or old one for "REMOVE" (e.g. to invalidate its keys)
+        return self.old if self.new is None else self.new
+
+
+def decode_record(model: Type[Base], record: dict) -> Change:
+    data = record["dynamodb"]
+    new, old = data.get("NewImage"), data.get("OldImage")
+    return Change(
+        record["eventName"],
+        model.deserialize(new) if new else None,
+        model.deserialize(old) if old else None,
+        data["SequenceNumber"],
+    )
+
+
+def record_image(record: dict) -> dict:
+    data = record["dynamodb"]
+    return data.get("NewImage") or data["OldImage"]
+
+
+Handler = Callable[[list[Change]], None]
+
+# Receives changes instead of handlers (cf. ChangeFeed.forward)
+Forward = Callable[[Type[Base], list[Change]], None]
+
+# (stream arn, shard id)
+Shard = tuple[str, str]
+
+
+class ChangeFeed:
+    # Each handler gets changes of its model shard by shard in order. Stream of table
+    # shared by several models (cf. Base.__layout__) is read once and its records
+    # are dispatched by model ("item_type"). With
+    # "checkpoints" (cf. models.StreamCheckpoint) position is saved after handlers
+    # succeed and failed batch is redelivered (at least once), otherwise feed starts
+    # from latest changes and failed batch is skipped (enough for in-process caches)
+    def __init__(self, consumer: str, checkpoints: Any = None, batch_size=100):
+        self.consumer = consumer
+        self.checkpoints = checkpoints
+        self.batch_size = batch_size
+        self.client: Any = None  # "dynamodbstreams" client (cf. create_streams_client)
+        self.handlers: dict[Type[Base], list[Handler]] = {}
+        self.stream_arns: dict[str, str] = {}  # by table name
+        self.iterators: dict[Shard, str] = {}
+        self.finished: set[Shard] = set()
+        # Set to pass changes on (e.g. prefork supervisor sends them to workers, which
+        # "deliver" them to their handlers) so that shards have a single reader
+        self.forward: Optional[Forward] = None
+
+    def register(self, model: Type[Base]) -> Callable[[Handler], Handler]:
+        def decorator(handler: Handler) -> Handler:
+            self.handlers.setdefault(model, []).append(handler)
+            return handler
+
+        return decorator
+
+    def poll(self) -> int:
+        # Read one batch from every readable shard and return number of changes
+        tables: dict[str, list[Type[Base]]] = {}
+        for model in self.handlers:
+            tables.setdefault(model.__schema__["TableName"], []).append(model)
+        return sum(self.poll_table(models[0]) for models in tables.values())
+
+    def poll_logged(self) -> int:
+        try:
+            return self.poll()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("change feed %s failed to poll", self.consumer)
+            return 0
+
+    async def run(self, poll_interval=1.0):
+        while True:
+            if await run_in_executor(self.poll_logged) == 0:
+                await asyncio.sleep(poll_interval)
+
+    def deliver(self, model: Type[Base], changes: list[Change]):
+        for handler in self.handlers[model]:
+            handler(changes)
+
+    def poll_table(self, table: Type[Base]) -> int:
+        # "table" is any model stored in the table
+        table_name = table.__schema__["TableName"]
+        initial = table_name not in self.stream_arns
+        if initial:
+            table.describe_table()
+            stream_arn = table.__table_description__["LatestStreamArn"]
+            self.stream_arns[table_name] = stream_arn
+        stream_arn = self.stream_arns[table_name]
+
+        shards = self.shards(stream_arn)
+        shard_ids = {shard["ShardId"] for shard in shards}
+        count = 0
+        for shard in shards:
+            key = (stream_arn, shard["ShardId"])
+            parent = shard.get("ParentShardId")
+            if key in self.finished:
+                continue
+            # Child shard waits until its parent (if not yet trimmed) is read up to end
+            if parent in shard_ids and (stream_arn, parent) not in self.finished:
+                continue
+            count += self.poll_shard(table, key, initial)
+        return count
+
+    def shards(self, stream_arn: str) -> list[dict]:
+        shards: list[dict] = []
+        params = dict(StreamArn=stream_arn)
+        while True:
+            res = self.client.describe_stream(**params)["StreamDescription"]
+            shards += res["Shards"]
+            if "LastEvaluatedShardId" not in res:
+                return shards
+            params.update(ExclusiveStartShardId=res["LastEvaluatedShardId"])
+
+    def poll_shard(self, table: Type[Base], key: Shard, initial: bool) -> int:
+        if key not in self.iterators:
+            self.iterators[key] = self.shard_iterator(key, initial)
+        try:
+            res = self.client.get_records(
+                ShardIterator=self.iterators[key], Limit=self.batch_size
+            )
+        except self.client.exceptions.ExpiredIteratorException:
+            del self.iterators[key]  # restart from checkpoint on next poll
+            return 0
+
+        changes: dict[Type[Base], list[Change]] = {}
+        for record in res["Records"]:
+            model = table.item_model(record_image(record))
+            if model in self.handlers:
+                changes.setdefault(model, []).append(decode_record(model, record))
+        try:
+            for model, model_changes in changes.items():
+                if self.forward is not None:
+                    self.forward(model, model_changes)
+                else:
+                    self.deliver(model, model_changes)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("change feed %s failed on %s", self.consumer, key)
+            if self.checkpoints is not None:
+                del self.iterators[key]  # redeliver from checkpoint
+                return 0
+        if self.checkpoints is not None and res["Records"]:
+            # Including records of models without handler
+            sequence_number = res["Records"][-1]["dynamodb"]["SequenceNumber"]
+            self.checkpoints.save(self.consumer, "#".join(key), sequence_number)
+
+        if next_iterator := res.get("NextShardIterator"):
+            self.iterators[key] = next_iterator
+        else:  # closed shard read up to end
+            del self.iterators[key]
+            self.finished.add(key)
+        return sum(len(model_changes) for model_changes in changes.values())
+
+    def shard_iterator(self, key: Shard, initial: bool) -> str:
+        stream_arn, shard_id = key
+        params = dict(StreamArn=stream_arn, ShardId=shard_id)
+        sequence_number = None
+        if self.checkpoints is not None:
+            sequence_number = self.checkpoints.find_sequence_number(
+                self.consumer, "#".join(key)
+            )
+        if sequence_number is not None:
+            try:
+                res = self.client.get_shard_iterator(
+                    **params,
+                    ShardIteratorType="AFTER_SEQUENCE_NUMBER",
+                    SequenceNumber=sequence_number,
+                )
+                return res["ShardIterator"]
+            except self.client.exceptions.TrimmedDataAccessException:
+                logger.warning("change feed %s lost changes of %s", self.consumer, key)
+
+        # Shards open when feed starts without checkpoint are read from now on, but
+        # shards created later (i.e. children) from their beginning
+        iterator_type = "TRIM_HORIZON"
+        if self.checkpoints is None and initial:
+            iterator_type = "LATEST"
+        res = self.client.get_shard_iterator(**params, ShardIteratorType=iterator_type)
+        return res["ShardIterator"]
+
+
+# Feed for in-process caches (if config.change_feed) polled by create_app, or by
+# supervisor when prefork (cf. prefork.Supervisor.relay_changes)
+change_feed = ChangeFeed("local")
@@ -0,0 +1,135 @@
+import time
+import unittest
+from typing import Any, ClassVar
+
+import boto3
+
+from .model_utils import Base, delete_tables, ensure_tables
+from .model_utils_test import TEST_CONFIG, define_test_model
+from .single_table_utils_test import define_single_table_models
+from .stream_utils import Change, ChangeFeed
+
+
+class MemoryCheckpoints:
+    positions: dict[tuple[str, str], str] = {}
+
+    @classmethod
+    def find_sequence_number(cls, consumer: str, shard: str):
+        return cls.positions.get((consumer, shard))
+
+    @classmethod
+    def save(cls, consumer: str, shard: str, sequence_number: str):
+        cls.positions[(consumer, shard)] = sequence_number
+
+
+def define_stream_model():
+    Model = define_test_model()
+    Model.__schema__["StreamSpecification"] = dict(
+        StreamEnabled=True, StreamViewType="NEW_AND_OLD_IMAGES"
+    )
+    Model.create_table()
+    return Model
+
+
+def poll_until(feed: ChangeFeed, count: int, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while count > 0 and time.monotonic() < deadline:
+        count -= feed.poll()
+        time.sleep(0.1)
+
+
+class ChangeFeedTest(unittest.TestCase):
+    client: ClassVar[Any]
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        Base.__client__ = boto3.client("dynamodb", **TEST_CONFIG)
+        cls.client = boto3.client("dynamodbstreams", **TEST_CONFIG)
+
+    def test_changes(self):
+        Model = define_stream_model()
+        feed = ChangeFeed("test", checkpoints=MemoryCheckpoints)
+        feed.client = self.client
+        received: list[Change] = []
+        feed.register(Model)(received.extend)
+
+        model = Model("john", "asdfjkl;")
+        model.put()
+        model.password = "password"
+        model.update()
+        model.delete()
+        poll_until(feed, 3)
+
+        assert [change.event for change in received] == ["INSERT", "MODIFY", "REMOVE"]
+        assert received[0].new == Model("john", "asdfjkl;") and not received[0].old
+        assert received[1].old.password == "asdfjkl;"
+        assert received[1].new.password == "password"
+        assert received[2].old == model and not received[2].new
+
+        # Restart from checkpoint
+        feed = ChangeFeed("test", checkpoints=MemoryCheckpoints)
+        feed.client = self.client
+        feed.register(Model)(received.extend)
+        Model("jane", "asdfjkl;").put()
+        poll_until(feed, 1)
+        assert [change.new.username for change in received[3:]] == ["jane"]
+
+    def test_failed_batch_is_redelivered(self):
+        Model = define_stream_model()
+        feed = ChangeFeed("test", checkpoints=MemoryCheckpoints)
+        feed.client = self.client
+        attempts: list[int] = []
+
+        @feed.register(Model)
+        def handler(changes: list[Change]):
+            attempts.append(len(changes))
+            if len(attempts) == 1:
+                raise RuntimeError("oops")
+
+        Model("john", "asdfjkl;").put()
+        poll_until(feed, 1)
+        assert attempts == [1, 1]
+
+    def test_forward(self):
+        # e.g. supervisor reads stream and workers deliver changes to handlers
+        Model = define_stream_model()
+        feed = ChangeFeed("test")
+        feed.client = self.client
+        received: list[Change] = []
+        feed.register(Model)(received.extend)
+        forwarded: list[tuple[Any, list[Change]]] = []
+        feed.forward = lambda model, changes: forwarded.append((model, changes))
+
+        feed.poll()  # start from latest
+        Model("john", "asdfjkl;").put()
+        poll_until(feed, 1)
+        assert received == []
+        assert [(model, len(changes)) for model, changes in forwarded] == [(Model, 1)]
+
+        feed.deliver(*forwarded[0])
+        assert [change.new.username for change in received] == ["john"]
+
+    def test_shared_table(self):
+        # Stream of single table is read once for all of its models
+        table, Album, Track = define_single_table_models()
+        table.schema["StreamSpecification"] = dict(
+            StreamEnabled=True, StreamViewType="NEW_AND_OLD_IMAGES"
+        )
+        ensure_tables([Album, Track])
+        try:
+            feed = ChangeFeed("test")
+            feed.client = self.client
+            albums: list[Change] = []
+            tracks: list[Change] = []
+            feed.register(Album)(albums.extend)
+            feed.register(Track)(tracks.extend)
+
+            feed.poll()  # start from latest
+            Album("a1", "alice", 2001).put()
+            Track("t1", "a1", "alice", 1).put()
+            poll_until(feed, 2)
+            assert [change.new for change in albums] == [Album("a1", "alice", 2001)]
+            assert [change.new for change in tracks] == [Track("t1", "a1", "alice", 1)]
+            assert len(feed.stream_arns) == 1
+        finally:
+            delete_tables([Album, Track])
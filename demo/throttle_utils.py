@@ -0,0 +1,179 @@
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+from botocore.exceptions import ClientError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
+from botocore.exceptions import HTTPClientError
+
+from .latency_utils import check_deadline, remaining_time
+
+THROTTLE_ERROR_CODES = [
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+]
+
+
+def is_throttle_error(e: ClientError) -> bool:
+    code = e.response.get("Error", {}).get("Code")
+    if code in THROTTLE_ERROR_CODES:
+        return True
+    if code == "TransactionCanceledException":
+        reasons = e.response.get("CancellationReasons", [])
+        return any(reason.get("Code") == "ThrottlingError" for reason in reasons)
+    return False
+
+
+def is_transaction_conflict(e: ClientError) -> bool:
+    # Transaction canceled only because another request wrote the same item (e.g. a
+    # hot counter), which has no effect and is safe to resend
+    if e.response.get("Error", {}).get("Code") != "TransactionCanceledException":
+        return False
+    codes = {reason.get("Code") for reason in e.response.get("CancellationReasons", [])}
+    return "TransactionConflict" in codes and codes <= {"None", "TransactionConflict"}
+
+
+def is_transient_error(e: Exception) -> bool:
+    # Server errors (5xx) and connection errors / timeouts, which botocore would
+    # retry by itself if the client was allowed to (cf. client.create_client)
+    if isinstance(e, (BotocoreConnectionError, HTTPClientError)):
+        return True
+    if isinstance(e, ClientError):
+        return e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500
+    return False
+
+
+class AdaptiveRateLimiter:
+    # Token bucket (up to 1 second of burst) whose refill rate follows AIMD i.e.
+    # - additive increase (per second) while requests succeed
+    # - multiplicative decrease when DynamoDB throttles
+    def __init__(
+        self,
+        max_rate=1000.0,
+        min_rate=1.0,
+        increase=10.0,
+        decrease=0.5,
+        decrease_cooldown=0.5,
+    ):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.decrease_cooldown = decrease_cooldown
+        self.lock = threading.Lock()
+        self.rate = max_rate
+        self.tokens = max_rate
+        now = time.monotonic()
+        self.refilled_at = now
+        self.increased_at = now
+        self.decreased_at = now - decrease_cooldown
+
+    def refill(self, now: float):
+        elapsed = now - self.refilled_at
+        self.tokens = min(self.tokens + elapsed * self.rate, max(self.rate, 1.0))
+        self.refilled_at = now
+
+    def acquire(self, cost=1.0) -> float:
+        # Take tokens in advance (possibly going negative) and sleep off the deficit
+        with self.lock:
+            self.refill(time.monotonic())
+            self.tokens -= cost
+            wait = max(-self.tokens / self.rate, 0.0)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def on_success(self):
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            elapsed = now - self.increased_at
+            self.rate = min(self.rate + self.increase * elapsed, self.max_rate)
+            self.increased_at = now
+
+    def on_throttle(self):
+        with self.lock:
+            now = time.monotonic()
+            # Requests sent in the same burst get throttled together, so decrease once
+            if now - self.decreased_at < self.decrease_cooldown:
+                return
+            self.refill(now)
+            self.rate = max(self.rate * self.decrease, self.min_rate)
+            self.tokens = min(self.tokens, 0.0)
+            self.decreased_at = now
+            self.increased_at = now
+
+
+class RateLimiterRegistry:
+    # One limiter per table and per index (GSI has its own throughput)
+    def __init__(self, **limiter_kwargs):
+        self.limiter_kwargs = limiter_kwargs
+        self.lock = threading.Lock()
+        self.limiters: dict[str, AdaptiveRateLimiter] = {}
+
+    def get(self, table: str, index: Optional[str] = None) -> AdaptiveRateLimiter:
+        name = table if index is None else f"{table}/{index}"
+        with self.lock:
+            if name not in self.limiters:
+                self.limiters[name] = AdaptiveRateLimiter(**self.limiter_kwargs)
+            return self.limiters[name]
+
+    def rates(self) -> dict[str, float]:
+        # Current rate (requests or items per second) for monitoring
+        with self.lock:
+            return {name: limiter.rate for name, limiter in self.limiters.items()}
+
+
+rate_limiters = RateLimiterRegistry()
+
+
+def backoff(attempt: int, base=0.05, cap=5.0) -> float:
+    # "Full jitter" exponential backoff
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def call_with_rate_limit(
+    limiters: list[AdaptiveRateLimiter],
+    call: Callable[[], dict],
+    costs: Optional[list[int]] = None,
+    max_attempts=8,
+) -> dict:
+    # Retries are done here only i.e. the client must not retry by itself (cf.
+    # client.create_client), otherwise attempts would multiply. Only throttling
+    # lowers the rate; transaction conflicts and transient errors are just resent.
+    # "costs" are tokens taken from each limiter (e.g. items of batch per table),
+    # 1 by default.
+    costs = costs or [1] * len(limiters)
+    for attempt in range(max_attempts):
+        for limiter, cost in zip(limiters, costs):
+            limiter.acquire(cost)
+        check_deadline()
+        try:
+            res = call()
+        except (ClientError, BotocoreConnectionError, HTTPClientError) as e:
+            throttled = isinstance(e, ClientError) and is_throttle_error(e)
+            conflict = isinstance(e, ClientError) and is_transaction_conflict(e)
+            if not (throttled or conflict or is_transient_error(e)):
+                raise
+            if attempt == max_attempts - 1:
+                raise
+            if throttled:  # others are not about throughput
+                for limiter in limiters:
+                    limiter.on_throttle()
+            # Don't sleep beyond deadline
+            remaining = remaining_time()
+            delay = backoff(attempt)
+            time.sleep(delay if remaining is None else max(min(delay, remaining), 0))
+            continue
+
+        # Batch requests report throttled part as unprocessed (caller resends them)
+        if res.get("UnprocessedItems") or res.get("UnprocessedKeys"):
+            for limiter in limiters:
+                limiter.on_throttle()
+        else:
+            for limiter in limiters:
+                limiter.on_success()
+        return res
+    assert False  # unreachable
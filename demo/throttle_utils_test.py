@@ -0,0 +1,119 @@
+import unittest
+
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from .throttle_utils import (
+    AdaptiveRateLimiter,
+    RateLimiterRegistry,
+    call_with_rate_limit,
+    is_throttle_error,
+    is_transaction_conflict,
+    is_transient_error,
+)
+
+
+def client_error(code: str, **response) -> ClientError:
+    return ClientError(dict(Error=dict(Code=code), **response), "Operation")
+
+
+class AdaptiveRateLimiterTest(unittest.TestCase):
+    def test_decrease_and_increase(self):
+        limiter = AdaptiveRateLimiter(max_rate=100.0, increase=1000.0)
+        limiter.on_throttle()
+        assert limiter.rate == 50.0
+        limiter.on_throttle()  # within cooldown
+        assert limiter.rate == 50.0
+        limiter.increased_at -= 0.01
+        limiter.on_success()
+        assert 55.0 < limiter.rate < 100.0
+
+    def test_min_rate(self):
+        limiter = AdaptiveRateLimiter(max_rate=2.0, min_rate=1.0, decrease_cooldown=0)
+        for _ in range(3):
+            limiter.on_throttle()
+        assert limiter.rate == 1.0
+
+    def test_acquire_waits_for_deficit(self):
+        limiter = AdaptiveRateLimiter(max_rate=100.0)
+        assert limiter.acquire(100.0) == 0.0
+        assert limiter.acquire(1.0) > 0.0
+
+    def test_registry_rates(self):
+        registry = RateLimiterRegistry(max_rate=10.0)
+        assert registry.get("a") is registry.get("a")
+        registry.get("a", "index").on_throttle()
+        assert registry.rates() == {"a": 10.0, "a/index": 5.0}
+
+
+class CallWithRateLimitTest(unittest.TestCase):
+    def test_is_throttle_error(self):
+        assert is_throttle_error(client_error("ThrottlingException"))
+        assert not is_throttle_error(client_error("ConditionalCheckFailedException"))
+        reasons = [dict(Code="None"), dict(Code="ThrottlingError")]
+        e = client_error("TransactionCanceledException", CancellationReasons=reasons)
+        assert is_throttle_error(e)
+
+    def test_retry_throttled(self):
+        limiter = AdaptiveRateLimiter()
+        errors = [client_error("ProvisionedThroughputExceededException")]
+
+        def call():
+            if errors:
+                raise errors.pop()
+            return {"Item": {}}
+
+        assert call_with_rate_limit([limiter], call) == {"Item": {}}
+        assert limiter.rate < limiter.max_rate
+
+    def test_retry_transaction_conflict(self):
+        limiter = AdaptiveRateLimiter()
+        reasons = [dict(Code="None"), dict(Code="TransactionConflict")]
+        conflict = client_error(
+            "TransactionCanceledException", CancellationReasons=reasons
+        )
+        assert is_transaction_conflict(conflict)
+        errors = [conflict]
+
+        def call():
+            if errors:
+                raise errors.pop()
+            return {}
+
+        assert call_with_rate_limit([limiter], call) == {}
+        assert limiter.rate == limiter.max_rate  # not a throughput problem
+
+        reasons = [
+            dict(Code="ConditionalCheckFailed"),
+            dict(Code="TransactionConflict"),
+        ]
+        e = client_error("TransactionCanceledException", CancellationReasons=reasons)
+        assert not is_transaction_conflict(e)
+
+    def test_retry_transient_errors(self):
+        limiter = AdaptiveRateLimiter()
+        server_error = client_error(
+            "InternalServerError", ResponseMetadata=dict(HTTPStatusCode=500)
+        )
+        timeout = ReadTimeoutError(endpoint_url="http://localhost")
+        assert is_transient_error(server_error) and is_transient_error(timeout)
+        errors = [server_error, timeout]
+
+        def call():
+            if errors:
+                raise errors.pop()
+            return {}
+
+        assert call_with_rate_limit([limiter], call) == {}
+        assert limiter.rate == limiter.max_rate
+
+    def test_costs_per_limiter(self):
+        limiters = [AdaptiveRateLimiter(max_rate=10.0) for _ in range(2)]
+        call_with_rate_limit(limiters, lambda: {}, costs=[3, 1])
+        assert [round(limiter.tokens) for limiter in limiters] == [7, 9]
+
+    def test_no_retry_other_errors(self):
+        def call():
+            raise client_error("ValidationException")
+
+        with self.assertRaises(ClientError):
+            call_with_rate_limit([AdaptiveRateLimiter()], call)
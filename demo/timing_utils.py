@@ -0,0 +1,80 @@
+import re
+
+import numpy as np
+
+from .search_utils import TOKEN_PATTERN
+
+#
+# Estimate when a character offset of caption text is spoken, given only the time
+# span of each caption: words share the span in proportion to their length (chars
+# and syllables), then offsets are interpolated between word boundaries. A track
+# is laid out once as flat arrays so that many ranges map in one vectorized pass.
+#
+
+VOWEL_GROUP_PATTERN = re.compile(r"[aeiouyàâäéèêëîïôöûùüÿœæ]+", re.IGNORECASE)
+
+SYLLABLE_WEIGHT = 2.0  # in characters (i.e. a syllable lasts about 2 more chars)
+
+SEPARATOR = "\n"  # between captions in track text (so that offsets don't overlap)
+
+
+class TrackTiming:
+    """
+    >>> timing = TrackTiming(["on est le", "demain"], [10, 12], [12, 14])
+    >>> timing.words
+    ['on', 'est', 'le', 'demain']
+    >>> timing.word_starts.round(2).tolist()
+    [10.0, 10.62, 11.38, 12.0]
+    >>> starts, ends = timing.map_ranges([0, 0, 1], [0, 3, 0], [2, 9, 6])
+    >>> starts.round(2).tolist(), ends.round(2).tolist()
+    ([10.0, 10.62, 12.0], [10.62, 12.0, 14.0])
+    """
+
+    def __init__(self, texts: list[str], starts: list[float], ends: list[float]):
+        text = SEPARATOR.join(texts)
+        lengths = np.array([len(t) for t in texts], dtype=np.int64)
+        # Offset of each caption within track text
+        self.offsets = np.cumsum(lengths + 1) - (lengths + 1)
+        caption_starts = np.asarray(starts, dtype=np.float64)
+        caption_ends = np.asarray(ends, dtype=np.float64)
+
+        spans = [m.span() for m in TOKEN_PATTERN.finditer(text)]
+        self.words = [text[start:end] for start, end in spans]
+        words = np.array(spans, dtype=np.int64).reshape(-1, 2)
+        word_starts, word_ends = words[:, 0], words[:, 1]
+        captions = np.searchsorted(self.offsets, word_starts, side="right") - 1
+
+        # Syllables ~ vowel groups (at least one e.g. for numbers)
+        vowels = [m.start() for m in VOWEL_GROUP_PATTERN.finditer(text)]
+        vowel_words = np.searchsorted(word_starts, vowels, side="right") - 1
+        syllables = np.bincount(vowel_words[vowel_words >= 0], minlength=len(spans))
+        weights = word_ends - word_starts + SYLLABLE_WEIGHT * np.maximum(syllables, 1)
+
+        # Fraction of caption span before and after each word
+        totals = np.bincount(captions, weights, minlength=len(texts))
+        before = np.cumsum(weights) - weights
+        before -= (np.cumsum(totals) - totals)[captions]
+        totals = totals[captions]
+        durations = (caption_ends - caption_starts)[captions]
+        self.word_starts = caption_starts[captions] + durations * before / totals
+        self.word_ends = self.word_starts + durations * weights / totals
+
+        # Piecewise linear offset -> time (caption bounds and word bounds)
+        knot_offsets = np.concatenate(
+            [self.offsets, self.offsets + lengths, word_starts, word_ends]
+        )
+        knot_times = np.concatenate(
+            [caption_starts, caption_ends, self.word_starts, self.word_ends]
+        )
+        order = np.lexsort([knot_times, knot_offsets])
+        self.knot_offsets = knot_offsets[order]
+        self.knot_times = np.maximum.accumulate(knot_times[order])  # rounding
+
+    def map_ranges(
+        self, captions, range_starts, range_ends
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Offsets within text of caption (index in track) -> times
+        offsets = self.offsets[np.asarray(captions, dtype=np.int64)]
+        starts = np.interp(offsets + range_starts, self.knot_offsets, self.knot_times)
+        ends = np.interp(offsets + range_ends, self.knot_offsets, self.knot_times)
+        return starts, ends
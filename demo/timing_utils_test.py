@@ -0,0 +1,33 @@
+import unittest
+
+import numpy as np
+
+from .timing_utils import TrackTiming
+
+
+class TrackTimingTest(unittest.TestCase):
+    def test_map_ranges(self):
+        texts = ["...", "Aujourd'hui, on est le 31 août", "♪", "demain on déménage !"]
+        timing = TrackTiming(texts, [0, 1, 5, 6], [1, 5, 6, 9])
+
+        # Whole captions span their timestamps (even without words)
+        captions = np.arange(len(texts))
+        lengths = np.array([len(text) for text in texts])
+        starts, ends = timing.map_ranges(captions, np.zeros(len(texts)), lengths)
+        self.assertEqual(starts.tolist(), [0, 1, 5, 6])
+        self.assertEqual(ends.tolist(), [1, 5, 6, 9])
+
+        # Longer word takes longer and words follow each other
+        starts, ends = timing.map_ranges([3, 3, 3], [0, 7, 10], [6, 9, 18])
+        self.assertGreater(ends[2] - starts[2], ends[0] - starts[0])
+        self.assertTrue(np.all(starts[1:] >= ends[:-1]))
+
+        # Offsets within a word are interpolated, monotonic everywhere
+        offsets = np.arange(len(texts[1]) + 1)
+        times, _ = timing.map_ranges(np.ones_like(offsets), offsets, offsets)
+        self.assertTrue(np.all(np.diff(times) >= 0))
+        self.assertTrue(1 < times[3] < times[7])
+
+    def test_empty_track(self):
+        timing = TrackTiming([], [], [])
+        self.assertEqual(timing.words, [])